@@ -1,9 +1,18 @@
+import asyncio
 import os
+import sys
+import threading
+from collections import deque
 from enum import Enum
-from typing import Dict, Any, List
+from typing import Dict, Any, Optional
 
-from flight_agent import flight_agent
-from cab_agent import cab_agent
+# Allow running this file directly (python agents/Supervisor_updated.py)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from agents.flight_agent import flight_agent, aflight_agent
+from agents.cab_agent import cab_agent, acab_agent
+from agents.intent_router import get_router
+from agents.deadline import Deadline, TurnCancelled, deadline_scope
 
 # --- Shared Agent State Enum ---
 class AgentState(str, Enum):
@@ -31,7 +40,81 @@ def supervisor(state: Dict[str, Any]) -> Dict[str, Any]:
 
     return state
 
+class _LineReader:
+    """Reads stdin on a daemon thread, so 'stop' can be typed while an agent is still answering"""
+
+    def __init__(self):
+        self.loop = asyncio.get_running_loop()
+        self.lines: "asyncio.Queue[Optional[str]]" = asyncio.Queue()  # None: end of input
+        self.early: deque = deque()  # lines typed during an agent call, answered next
+        threading.Thread(target=self._read, name="cli-input", daemon=True).start()
+
+    def _read(self):
+        while True:
+            line = sys.stdin.readline()
+            self.loop.call_soon_threadsafe(self.lines.put_nowait, line.rstrip("\n") if line else None)
+            if not line:
+                return
+
+    async def get(self) -> str:
+        line = self.early.popleft() if self.early else await self.lines.get()
+        # End of input stops the booking like typing "stop" would
+        return "stop" if line is None else line
+
+
+_reader: Optional[_LineReader] = None
+
+async def ainput(prompt: str) -> str:
+    global _reader
+    if _reader is None:
+        _reader = _LineReader()
+    print(prompt, end="", flush=True)
+    return await _reader.get()
+
+async def cancellable(coro):
+    """Run an agent call under a turn deadline; typing 'stop' while it runs cancels its LLM request"""
+    global _reader
+    if _reader is None:
+        _reader = _LineReader()
+    deadline = Deadline()
+    with deadline_scope(deadline):
+        call = asyncio.ensure_future(coro)  # the task takes the deadline along in its context
+    line = asyncio.ensure_future(_reader.lines.get())
+    done, _ = await asyncio.wait({call, line}, return_when=asyncio.FIRST_COMPLETED)
+    if line in done:
+        if line.result() is not None and line.result().strip().lower() == "stop":
+            deadline.cancel("stopped")
+        else:
+            _reader.early.append(line.result())
+    else:
+        line.cancel()
+    return await call
+
+async def asupervisor(state: Dict[str, Any]) -> Dict[str, Any]:
+    """Async counterpart of supervisor"""
+    current_agent = state.get("current_agent", AgentState.FLIGHT_AGENT)
+
+    if current_agent == AgentState.FLIGHT_AGENT:
+        state = await cancellable(aflight_agent(state))
+        if state["booking_info"].get("flight", {}).get("status") == "booked":
+            print("\nSupervisor: Your flight is booked! Would you like to book a cab to the airport?")
+            follow_up = (await ainput("You: ")).lower()
+            if "yes" in follow_up:
+                state["current_agent"] = AgentState.CAB_AGENT
+                state = await cancellable(acab_agent(state))
+            else:
+                state["current_agent"] = AgentState.END
+
+    elif current_agent == AgentState.CAB_AGENT:
+        state = await cancellable(acab_agent(state))
+
+    return state
+
 def run_supervisor():
+    asyncio.run(arun_supervisor())
+
+async def arun_supervisor():
+    """Async CLI loop: agent calls and blocking input() never hold the event loop"""
     state = {
         "messages": [],
         "current_agent": None,
@@ -51,15 +134,16 @@ def run_supervisor():
 
         # Only ask input if not already in the middle of an agent interaction
         if state["current_agent"] is None:
-            user_input = input("You: ").strip().lower()
+            user_input = (await ainput("You: ")).strip().lower()
             if user_input == "stop":
                 print("Supervisor: Stopping the booking process as requested.")
                 break
 
             # Determine which agent to call
-            if any(k in user_input for k in ["flight", "book a flight", "plane", "air ticket"]):
+            intent = get_router().route(user_input)
+            if intent == "flight":
                 state["current_agent"] = AgentState.FLIGHT_AGENT
-            elif any(k in user_input for k in ["cab", "taxi", "ride", "airport drop"]):
+            elif intent == "cab":
                 state["current_agent"] = AgentState.CAB_AGENT
             else:
                 print("Supervisor: Sorry, I didn't understand. Do you want to book a flight or a cab?")
@@ -67,15 +151,22 @@ def run_supervisor():
 
         # Get user input before agent call
         if state["current_agent"] is not None:
-            user_input = input("You: ").strip()
+            user_input = (await ainput("You: ")).strip()
             if user_input.lower() == "stop":
                 print("Supervisor: Stopping the booking process as requested.")
                 break
             state["user_input"] = user_input
 
 
-        # Call the current agent
-        state = supervisor(state)
+        # Call the current agent; "stop" typed while it answers cancels the request
+        try:
+            state = await asupervisor(state)
+        except TurnCancelled as cancelled:
+            if cancelled.reason == "stopped":
+                print("Supervisor: Stopping the booking process as requested.")
+                break
+            print("Supervisor: Sorry, that took too long to answer. Please try again.")
+            continue
 
 
         if state["messages"]:
@@ -87,7 +178,7 @@ def run_supervisor():
            state["booking_info"]["flight"].get("status") == "booked" and \
            state["booking_info"]["cab"].get("status") != "booked":
             print("Supervisor: Your flight is booked! Would you like to book a cab to the airport?")
-            follow_up = input("You: ").lower()
+            follow_up = (await ainput("You: ")).lower()
             if follow_up == "stop":
                 print("Supervisor: Stopping the booking process as requested.")
                 break
@@ -101,7 +192,7 @@ def run_supervisor():
              state["booking_info"]["cab"].get("status") == "booked" and \
              state["booking_info"]["flight"].get("status") != "booked":
             print("Supervisor: Your cab is booked! Would you like to book a flight as well?")
-            follow_up = input("You: ").lower()
+            follow_up = (await ainput("You: ")).lower()
             if follow_up == "stop":
                 print("Supervisor: Stopping the booking process as requested.")
                 break
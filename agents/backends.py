@@ -0,0 +1,151 @@
+# agents/backends.py
+import os
+import asyncio
+import logging
+import threading
+from typing import Any, Dict, Optional, Set, Tuple, Type
+
+logger = logging.getLogger(__name__)
+
+# --- Backend settings ---
+BACKEND = os.environ.get("LLM_BACKEND", "groq")  # "groq" or "local"
+POOL_SIZE = int(os.environ.get("LLM_POOL_SIZE", "20"))  # keep-alive connections shared by all agents
+KEEPALIVE_SECONDS = float(os.environ.get("LLM_KEEPALIVE_SECONDS", "120"))
+
+
+# --- Backend interface ---
+class LLMBackend:
+    """Creates the chat models used by the flight, cab and supervisor agents.
+
+    A chat model only has to provide invoke/ainvoke/stream/astream over a list
+    of LangChain messages, returning AIMessage / AIMessageChunk objects.
+    """
+
+    name = "base"
+    rate_limited = False  # True if the provider limits requests/tokens per minute (see agents/scheduler.py)
+
+    def create_chat_model(self, model: str, temperature: float, api_key: Optional[str] = None) -> Any:
+        """A chat model for `model`; `api_key` overrides the backend's default key where keys apply"""
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+class GroqBackend(LLMBackend):
+    """Groq-hosted models through langchain_groq, sharing one HTTP connection pool"""
+
+    name = "groq"
+    rate_limited = True
+
+    def __init__(self, pool_size: int = POOL_SIZE, keepalive_seconds: float = KEEPALIVE_SECONDS):
+        self.pool_size = pool_size
+        self.keepalive_seconds = keepalive_seconds
+        self._http_clients: Optional[Tuple[Any, Any]] = None
+
+    def _shared_http_clients(self) -> Tuple[Any, Any]:
+        """One sync and one async httpx client, so every agent reuses the same TLS connections"""
+        if self._http_clients is None:
+            import httpx
+
+            limits = httpx.Limits(
+                max_connections=self.pool_size,
+                max_keepalive_connections=self.pool_size,
+                keepalive_expiry=self.keepalive_seconds
+            )
+            self._http_clients = (httpx.Client(limits=limits), httpx.AsyncClient(limits=limits))
+        return self._http_clients
+
+    def create_chat_model(self, model: str, temperature: float, api_key: Optional[str] = None) -> Any:
+        from langchain_groq import ChatGroq
+
+        http_client, http_async_client = self._shared_http_clients()
+        options: Dict[str, Any] = {"api_key": api_key} if api_key else {}  # default: GROQ_API_KEY
+        return ChatGroq(
+            temperature=temperature,
+            model_name=model,
+            max_retries=0,  # retried with backoff by agents/resilience.py
+            http_client=http_client,
+            http_async_client=http_async_client,
+            **options
+        )
+
+    def close(self):
+        if self._http_clients is not None:
+            http_client, http_async_client = self._http_clients
+            self._http_clients = None
+            http_client.close()
+            _close_async(http_async_client)
+
+
+_closing: Set["asyncio.Task"] = set()  # close tasks still running, kept referenced until done
+
+def _close_async(client: Any):
+    """Close an httpx.AsyncClient from sync code: on the running loop if there is one, else on a new loop"""
+    try:
+        loop = asyncio.get_running_loop()
+    except RuntimeError:
+        loop = None
+    if loop is not None:
+        task = loop.create_task(client.aclose())
+        _closing.add(task)
+        task.add_done_callback(_closing.discard)
+        return
+    try:
+        asyncio.run(client.aclose())
+    except Exception:
+        logger.warning("Could not close the async HTTP client", exc_info=True)
+
+
+class LocalBackend(LLMBackend):
+    """Offline rule-based stand-in with configurable latency, for tests and load runs"""
+
+    name = "local"
+
+    def __init__(self, latency: Optional[float] = None, tokens_per_second: Optional[float] = None):
+        self.latency = latency
+        self.tokens_per_second = tokens_per_second
+
+    def create_chat_model(self, model: str, temperature: float, api_key: Optional[str] = None) -> Any:
+        from agents.local_backend import LocalChatModel
+
+        # Distinct model name so local replies never share cache entries with real ones
+        settings: Dict[str, Any] = {"model_name": f"local:{model}", "temperature": temperature}
+        if self.latency is not None:
+            settings["latency"] = self.latency
+        if self.tokens_per_second is not None:
+            settings["tokens_per_second"] = self.tokens_per_second
+        return LocalChatModel(**settings)
+
+
+BACKENDS: Dict[str, Type[LLMBackend]] = {
+    GroqBackend.name: GroqBackend,
+    LocalBackend.name: LocalBackend,
+}
+
+_backend: Optional[LLMBackend] = None
+_backend_lock = threading.Lock()
+
+
+# --- Backend selection ---
+def get_backend() -> LLMBackend:
+    """The process-wide backend, chosen by LLM_BACKEND unless set_backend() was called"""
+    global _backend
+    with _backend_lock:
+        if _backend is None:
+            if BACKEND not in BACKENDS:
+                raise ValueError(f"Unknown LLM_BACKEND '{BACKEND}'. Choose one of: {', '.join(BACKENDS)}")
+            _backend = BACKENDS[BACKEND]()
+        return _backend
+
+
+def set_backend(backend: LLMBackend):
+    """Switch every agent to another backend; clients are recreated on next use"""
+    global _backend
+    from agents.llm_pool import reset_clients
+
+    with _backend_lock:
+        if _backend is not None:
+            _backend.close()
+        _backend = backend
+    reset_clients()
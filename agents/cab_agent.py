@@ -1,16 +1,19 @@
 import os
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Generator, Callable
 from enum import Enum
-from datetime import datetime
 
-from langchain_groq import ChatGroq
 from langchain_core.prompts import ChatPromptTemplate
-from langchain_core.messages import HumanMessage, SystemMessage
+from langchain_core.messages import BaseMessage, HumanMessage, SystemMessage
 
-# --- Model setup ---
-os.environ["GROQ_API_KEY"] = "API KEY"  # Replace with secure method in prod
-MODEL = "llama3-70b-8192"
-cab_llm = ChatGroq(temperature=0, model_name=MODEL)
+from agents.streaming import AWAITING_CONFIRMATION, BOOKING_COMPLETE, MarkerFilter
+from agents.history import HistoryBuffer, HistoryManager
+from agents.message import Message
+from agents.llm_pool import get_llm
+from agents.tracing import traced
+
+# --- History budget ---
+# Older turns beyond the budget are folded into a rolling summary
+history_manager = HistoryManager(token_budget=int(os.environ.get("CAB_HISTORY_TOKEN_BUDGET", "3000")))
 
 # --- Agent states ---
 class AgentState(str, Enum):
@@ -20,32 +23,26 @@ class AgentState(str, Enum):
 # --- Conversation state management ---
 class ConversationState:
     def __init__(self):
-        self.messages: List[Dict[str, Any]] = []
+        self.messages: List[Message] = []
         self.current_agent: AgentState = AgentState.CAB_AGENT
         self.booking_info: Dict[str, Any] = {
             "cab": {}
         }
+        self.history = HistoryBuffer()
 
     def add_message(self, role: str, content: str, agent: Optional[AgentState] = None):
-        self.messages.append({
-            "role": role,
-            "content": content,
-            "timestamp": datetime.now().isoformat(),
-            "agent": agent if agent else self.current_agent
-        })
+        self.messages.append(Message(agent if agent else self.current_agent, content, role))
 
     def get_conversation_history(self) -> str:
-        history = ""
-        for msg in self.messages:
-            agent_prefix = f"[{msg['agent']}] " if 'agent' in msg else ""
-            history += f"{agent_prefix}{msg['role']}: {msg['content']}\n\n"
-        return history
+        # Only messages added since the last turn are rendered
+        return history_manager.render(self.history, self.messages)
 
     def to_dict(self) -> Dict[str, Any]:
         return {
             "messages": self.messages,
             "current_agent": self.current_agent,
             "booking_info": self.booking_info,
+            "history_buffer": self.history,
             "user_input": ""
         }
 
@@ -55,6 +52,8 @@ class ConversationState:
         state.messages = state_dict.get("messages", [])
         state.current_agent = state_dict.get("current_agent", AgentState.CAB_AGENT)
         state.booking_info = state_dict.get("booking_info", {"cab": {}})
+        if state_dict.get("history_buffer") is not None:
+            state.history = state_dict["history_buffer"]
         return state
 
 # --- Prompt template for Cab Agent ---
@@ -71,7 +70,7 @@ You need to collect all necessary information like:
 Be friendly and conversational. Follow these steps:
 
 1. Collect all required information from the user (pickup location, drop-off location, date, time, number of passengers, type of cab).
-2. Once you have all the details, recap the booking details for the user and ask if there are any special instructions or if they are ready to confirm the booking.
+2. Once you have all the details, recap the booking details for the user and ask if there are any special instructions or if they are ready to confirm the booking. End every recap that asks for confirmation with: "AWAITING_CONFIRMATION".
 3. Wait for the user to either:
    - Confirm the booking (e.g., by saying "yes", "book it", "confirm", etc.).
    - Provide special instructions (e.g., "I have a special request", "add instructions", etc.).
@@ -88,13 +87,11 @@ User: {user_input}
 Cab Agent:"""
 
 
-def cab_agent(state: Dict[str, Any]) -> Dict[str, Any]:
-    state_obj = ConversationState.from_dict(state)
-    user_input = state.get("user_input", "")
-
+@traced("format_prompt")
+def _build_messages(state_obj: ConversationState, user_input: str) -> List[BaseMessage]:
     prompt = ChatPromptTemplate.from_template(CAB_AGENT_PROMPT)
 
-    messages = [
+    return [
         SystemMessage(content="You are a helpful Cab Booking Agent assistant."),
         HumanMessage(content=prompt.format(
             conversation_history=state_obj.get_conversation_history(),
@@ -102,20 +99,15 @@ def cab_agent(state: Dict[str, Any]) -> Dict[str, Any]:
         ))
     ]
 
-    response = cab_llm.invoke(messages)
-
+def _record_turn(state_obj: ConversationState, user_input: str, agent_response: str,
+                 booking_complete: bool, awaiting_confirmation: bool = False) -> Dict[str, Any]:
     # Add user message
     state_obj.add_message("user", user_input)
-    
-    # Process agent response
-    agent_response = response.content
-    
+
     # Check if booking is complete
-    if "BOOKING_COMPLETE" in agent_response:
-        # Clean the response by removing "BOOKING_COMPLETE"
-        clean_response = agent_response.replace("BOOKING_COMPLETE", "").strip()
+    if booking_complete:
         # Add only the cleaned response
-        state_obj.add_message("assistant", clean_response)
+        state_obj.add_message("assistant", agent_response)
         # Update booking info
         state_obj.booking_info["cab"]["status"] = "booked"
         state_obj.booking_info["cab"]["details"] = "Cab booked based on user preferences"
@@ -123,7 +115,86 @@ def cab_agent(state: Dict[str, Any]) -> Dict[str, Any]:
     else:
         # Add the response as-is if booking is not complete
         state_obj.add_message("assistant", agent_response)
+        # The status describes this turn only: the caller's state machine tracks the stage
+        if awaiting_confirmation:
+            state_obj.booking_info["cab"]["status"] = "pending_confirmation"
+        else:
+            state_obj.booking_info["cab"].pop("status", None)
 
     result = state_obj.to_dict()
     result["user_input"] = ""  # Clear input for next step
-    return result
\ No newline at end of file
+    return result
+
+def _record_reply(state_obj: ConversationState, user_input: str, agent_response: str) -> Dict[str, Any]:
+    # Check if booking is complete
+    booking_complete = BOOKING_COMPLETE in agent_response
+    awaiting_confirmation = AWAITING_CONFIRMATION in agent_response
+    if booking_complete or awaiting_confirmation:
+        # Clean the response by removing the markers
+        agent_response = agent_response.replace(BOOKING_COMPLETE, "").replace(AWAITING_CONFIRMATION, "").strip()
+
+    return _record_turn(state_obj, user_input, agent_response, booking_complete, awaiting_confirmation)
+
+def _record_streamed_reply(state_obj: ConversationState, user_input: str, parts: List[str],
+                           markers: MarkerFilter) -> Dict[str, Any]:
+    booking_complete = BOOKING_COMPLETE in markers.found
+    awaiting_confirmation = AWAITING_CONFIRMATION in markers.found
+    agent_response = "".join(parts)
+    if booking_complete or awaiting_confirmation:
+        agent_response = agent_response.strip()
+
+    return _record_turn(state_obj, user_input, agent_response, booking_complete, awaiting_confirmation)
+
+@traced("cab_agent", agent="cab")
+def cab_agent(state: Dict[str, Any]) -> Dict[str, Any]:
+    state_obj = ConversationState.from_dict(state)
+    user_input = state.get("user_input", "")
+
+    response = get_llm("cab").invoke(_build_messages(state_obj, user_input))
+    return _record_reply(state_obj, user_input, response.content)
+
+@traced("cab_agent", agent="cab", streamed=True)
+def cab_agent_stream(state: Dict[str, Any]) -> Generator[str, None, Dict[str, Any]]:
+    """Streaming variant of cab_agent: yields reply tokens, returns the updated state"""
+    state_obj = ConversationState.from_dict(state)
+    user_input = state.get("user_input", "")
+
+    markers = MarkerFilter(BOOKING_COMPLETE, AWAITING_CONFIRMATION)
+    parts: List[str] = []
+    for chunk in get_llm("cab").stream(_build_messages(state_obj, user_input)):
+        text = markers.feed(chunk.content)
+        if text:
+            parts.append(text)
+            yield text
+    tail = markers.flush()
+    if tail:
+        parts.append(tail)
+        yield tail
+
+    return _record_streamed_reply(state_obj, user_input, parts, markers)
+
+@traced("cab_agent", agent="cab")
+async def acab_agent(state: Dict[str, Any],
+                     on_token: Optional[Callable[[str], None]] = None) -> Dict[str, Any]:
+    """Async counterpart of cab_agent; streams tokens to on_token when given"""
+    state_obj = ConversationState.from_dict(state)
+    user_input = state.get("user_input", "")
+    messages = _build_messages(state_obj, user_input)
+
+    if on_token is None:
+        response = await get_llm("cab").ainvoke(messages)
+        return _record_reply(state_obj, user_input, response.content)
+
+    markers = MarkerFilter(BOOKING_COMPLETE, AWAITING_CONFIRMATION)
+    parts: List[str] = []
+    async for chunk in get_llm("cab").astream(messages):
+        text = markers.feed(chunk.content)
+        if text:
+            parts.append(text)
+            on_token(text)
+    tail = markers.flush()
+    if tail:
+        parts.append(tail)
+        on_token(tail)
+
+    return _record_streamed_reply(state_obj, user_input, parts, markers)
@@ -0,0 +1,182 @@
+# agents/conversation.py
+from enum import Enum
+from typing import Any, Dict, List, Optional, Sequence, Set, Tuple
+
+from agents.message_store import ensure_message_store
+
+
+# --- Stages and events ---
+class Stage(str, Enum):
+    INITIAL = "initial"
+    FLIGHT_BOOKING = "flight_booking"
+    CAB_BOOKING = "cab_booking"
+    COMBINED_BOOKING = "combined_booking"  # flight and cab details collected in the same turns
+    PENDING_CONFIRMATION = "pending_confirmation"
+    AWAITING_SPECIAL_REQUESTS = "awaiting_special_requests"
+    COMPLETED = "completed"
+
+    def __str__(self) -> str:
+        return self.value
+
+
+class Event(str, Enum):
+    START_FLIGHT = "start_flight"
+    START_CAB = "start_cab"
+    START_COMBINED = "start_combined"
+    REPLIED = "replied"  # the agent answered without changing the booking status
+    CONFIRMATION_REQUESTED = "confirmation_requested"
+    BOOKED = "booked"
+    STOP = "stop"
+
+
+START_EVENTS = {"flight": Event.START_FLIGHT, "cab": Event.START_CAB}
+# Booking status reported by an agent for the turn -> event
+STATUS_EVENTS = {"booked": Event.BOOKED, "pending_confirmation": Event.CONFIRMATION_REQUESTED}
+
+_ACTIVE = (Stage.FLIGHT_BOOKING, Stage.CAB_BOOKING, Stage.PENDING_CONFIRMATION, Stage.AWAITING_SPECIAL_REQUESTS)
+
+TRANSITIONS: Dict[Tuple[Stage, Event], Stage] = {}
+for _stage in (Stage.INITIAL, Stage.COMPLETED):
+    TRANSITIONS[(_stage, Event.START_FLIGHT)] = Stage.FLIGHT_BOOKING
+    TRANSITIONS[(_stage, Event.START_CAB)] = Stage.CAB_BOOKING
+    TRANSITIONS[(_stage, Event.START_COMBINED)] = Stage.COMBINED_BOOKING
+    TRANSITIONS[(_stage, Event.STOP)] = Stage.INITIAL
+for _stage in _ACTIVE:
+    TRANSITIONS[(_stage, Event.CONFIRMATION_REQUESTED)] = Stage.PENDING_CONFIRMATION
+    TRANSITIONS[(_stage, Event.BOOKED)] = Stage.COMPLETED
+    TRANSITIONS[(_stage, Event.STOP)] = Stage.INITIAL
+TRANSITIONS[(Stage.FLIGHT_BOOKING, Event.REPLIED)] = Stage.FLIGHT_BOOKING
+TRANSITIONS[(Stage.CAB_BOOKING, Event.REPLIED)] = Stage.CAB_BOOKING
+# In a combined booking only a completed booking changes the stage, see ConversationFSM.agent_replied
+TRANSITIONS[(Stage.COMBINED_BOOKING, Event.REPLIED)] = Stage.COMBINED_BOOKING
+TRANSITIONS[(Stage.COMBINED_BOOKING, Event.CONFIRMATION_REQUESTED)] = Stage.COMBINED_BOOKING
+TRANSITIONS[(Stage.COMBINED_BOOKING, Event.BOOKED)] = Stage.COMPLETED
+TRANSITIONS[(Stage.COMBINED_BOOKING, Event.STOP)] = Stage.INITIAL
+# Anything but a confirmation after the recap means the user is adding special requests
+TRANSITIONS[(Stage.PENDING_CONFIRMATION, Event.REPLIED)] = Stage.AWAITING_SPECIAL_REQUESTS
+TRANSITIONS[(Stage.AWAITING_SPECIAL_REQUESTS, Event.REPLIED)] = Stage.AWAITING_SPECIAL_REQUESTS
+del _stage
+
+
+# --- Per-session state machine ---
+class ConversationFSM:
+    """Where a session is in the booking flow, updated by O(1) table lookups.
+
+    The wrappers fire one event per turn (the user starting or stopping a
+    booking, or the booking status an agent reported), so no turn has to read
+    the transcript to find out whether a booking is in progress or done.
+    """
+
+    def __init__(self):
+        self.stage = Stage.INITIAL
+        self.service: Optional[str] = None  # service whose agent is talking to the user
+        self.booked: Set[str] = set()
+        self.handoff_from: Optional[str] = None  # booked service whose details the next agent gets
+        self.parallel: List[str] = []  # services of a combined booking, each with its own agent
+
+    def fire(self, event: Event) -> Stage:
+        next_stage = TRANSITIONS.get((self.stage, event))
+        if next_stage is None:
+            raise ValueError(f"No transition from stage '{self.stage}' on event '{event.value}'")
+        if event is Event.BOOKED:
+            if self.service:
+                self.booked.add(self.service)
+            self.service = None
+        elif event is Event.STOP:
+            self.service = None
+            self.handoff_from = None
+            self.parallel = []
+        self.stage = next_stage
+        return next_stage
+
+    def start(self, service: str, handoff_from: Optional[str] = None) -> Stage:
+        """Open a booking with service, optionally passing it a completed booking of another service"""
+        if service in self.booked:
+            return self.stage  # each service is booked once per session
+        stage = self.fire(START_EVENTS[service])
+        self.service = service
+        self.handoff_from = handoff_from
+        return stage
+
+    def start_combined(self, services: Sequence[str]) -> Stage:
+        """Open bookings with several services at once; falls back to start() if only one is left"""
+        services = [service for service in services if service not in self.booked]
+        if len(services) < 2:
+            return self.start(services[0]) if services else self.stage
+        stage = self.fire(Event.START_COMBINED)
+        self.parallel = list(services)
+        self.handoff_from = None
+        return stage
+
+    def agent_replied(self, service: str, status: Optional[str]) -> Stage:
+        """The turn's single decision point: advance on the status the agent reported"""
+        if self.parallel:
+            return self._combined_replied(service, status)
+        if service != self.service:
+            return self.stage
+        return self.fire(STATUS_EVENTS.get(status, Event.REPLIED))
+
+    def _combined_replied(self, service: str, status: Optional[str]) -> Stage:
+        event = STATUS_EVENTS.get(status, Event.REPLIED)
+        if service not in self.parallel or event is not Event.BOOKED:
+            return self.fire(event) if service in self.parallel else self.stage
+        # One booking is done: the rest continues as a normal booking that gets its details
+        self.parallel.remove(service)
+        self.booked.add(service)
+        if len(self.parallel) > 1:
+            return self.stage
+        remaining = self.parallel.pop() if self.parallel else None
+        self.fire(Event.BOOKED)
+        return self.start(remaining, handoff_from=service) if remaining else self.stage
+
+    def take_handoff(self) -> Optional[str]:
+        """Return the handed-over service once, on the first turn of the new booking"""
+        source, self.handoff_from = self.handoff_from, None
+        return source
+
+    def is_booked(self, service: str) -> bool:
+        return service in self.booked
+
+    @property
+    def active(self) -> bool:
+        return self.service is not None or bool(self.parallel)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "stage": self.stage.value,
+            "service": self.service,
+            "booked": sorted(self.booked),
+            "handoff_from": self.handoff_from,
+            "parallel": list(self.parallel),
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "ConversationFSM":
+        conversation = cls()
+        conversation.stage = Stage(data.get("stage", Stage.INITIAL.value))
+        conversation.service = data.get("service")
+        conversation.booked = set(data.get("booked", ()))
+        conversation.handoff_from = data.get("handoff_from")
+        conversation.parallel = list(data.get("parallel", ()))
+        return conversation
+
+
+_SERVICE_OF_AGENT = {"flight_agent": "flight", "cab_agent": "cab"}
+
+def ensure_conversation(state: Dict[str, Any]) -> ConversationFSM:
+    """Return state["conversation"], creating it for sessions that predate it"""
+    conversation = state.get("conversation")
+    if conversation is None:
+        # Seed it from the keys such sessions carried instead
+        conversation = ConversationFSM()
+        booking_info = state.get("booking_info", {})
+        messages = ensure_message_store(state)
+        conversation.booked = {service for service, info in booking_info.items()
+                               if info.get("status") == "booked" or messages.is_complete(service)}
+        if conversation.booked:
+            conversation.stage = Stage.COMPLETED
+        service = _SERVICE_OF_AGENT.get(state.get("current_agent"))
+        if service:
+            conversation.start(service)
+        state["conversation"] = conversation
+    return conversation
@@ -0,0 +1,202 @@
+# agents/deadline.py
+import os
+import time
+import asyncio
+import threading
+from concurrent.futures import Future
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Iterator, List, Optional, Tuple
+
+# --- Deadline settings ---
+TURN_DEADLINE = float(os.environ.get("TURN_DEADLINE_SECONDS", "120"))  # whole turn, all LLM calls included; 0 = none
+
+
+class TurnCancelled(Exception):
+    """The turn was cancelled: stopped by the user, superseded, or past its deadline"""
+
+    def __init__(self, reason: str):
+        super().__init__(f"turn cancelled ({reason})")
+        self.reason = reason
+
+
+# --- Deadlines ---
+class Deadline:
+    """Time limit and cancellation flag of one turn, shared by every LLM call made for it.
+
+    cancel() completes `future`, which waiting calls include in their wait so
+    they return at once instead of when the request would have finished.
+    """
+
+    __slots__ = ("expires", "future", "tripped")
+
+    def __init__(self, seconds: float = TURN_DEADLINE):
+        self.expires = time.monotonic() + seconds if seconds > 0 else None
+        self.future: Future = Future()  # result: the cancellation reason
+        self.tripped: Optional[str] = None  # reason work was actually cut short, if it was
+
+    def remaining(self) -> Optional[float]:
+        return None if self.expires is None else max(0.0, self.expires - time.monotonic())
+
+    @property
+    def cancelled(self) -> bool:
+        return self.future.done()
+
+    @property
+    def reason(self) -> Optional[str]:
+        if self.future.done():
+            return self.future.result()
+        if self.expires is not None and time.monotonic() >= self.expires:
+            return "deadline"
+        return None
+
+    def cancel(self, reason: str = "stopped") -> bool:
+        """Cancel the turn; False if it was already cancelled"""
+        try:
+            self.future.set_result(reason)
+        except Exception:  # InvalidStateError: cancelled before
+            return False
+        return True
+
+    def follow(self, other: "Deadline"):
+        """Also end with `other`: cancelled when it is, and expiring no later than it"""
+        if other.expires is not None and (self.expires is None or other.expires < self.expires):
+            self.expires = other.expires
+        other.future.add_done_callback(lambda future: self.cancel(future.result()))
+
+    def trip(self) -> TurnCancelled:
+        """Record that work of the turn was abandoned and return the error to raise"""
+        self.tripped = self.reason or "stopped"
+        return TurnCancelled(self.tripped)
+
+    def check(self):
+        if self.reason is not None:
+            raise self.trip()
+
+    def clamp(self, timeout: float) -> float:
+        """An attempt's timeout cut down to the time left in the turn (0 = no limit)"""
+        remaining = self.remaining()
+        if remaining is None:
+            return timeout
+        return min(timeout, remaining) if timeout > 0 else remaining
+
+    def waiter(self) -> "asyncio.Future":
+        """An asyncio future of the running loop that completes when the turn is cancelled"""
+        loop = asyncio.get_running_loop()
+        waiter = loop.create_future()
+
+        def wake(_):
+            try:
+                loop.call_soon_threadsafe(lambda: waiter.done() or waiter.set_result(None))
+            except RuntimeError:  # the loop is closed; nobody is waiting any more
+                pass
+
+        self.future.add_done_callback(wake)
+        return waiter
+
+
+# The turn the current code runs for; None outside any turn (no limit, never cancelled)
+_current: ContextVar[Optional[Deadline]] = ContextVar("turn_deadline", default=None)
+
+
+def current_deadline() -> Optional[Deadline]:
+    return _current.get()
+
+
+@contextmanager
+def deadline_scope(deadline: Deadline) -> Iterator[Deadline]:
+    token = _current.set(deadline)
+    try:
+        yield deadline
+    finally:
+        _current.reset(token)
+
+
+def check_deadline():
+    """Raise TurnCancelled if the current turn was cancelled or ran out of time"""
+    deadline = _current.get()
+    if deadline is not None:
+        deadline.check()
+
+
+# --- Request clock ---
+class RequestClock:
+    """Whether a request is waiting in the scheduler's queue, for whoever times it
+    (agents/resilience.py), so the wait for a slot is not counted as the request's"""
+
+    __slots__ = ("queued", "sent")
+
+    def __init__(self):
+        self.queued = False
+        self.sent: Future = Future()  # result: time.perf_counter() when the request left the queue
+
+    @property
+    def waiting(self) -> bool:
+        return self.queued and not self.sent.done()
+
+
+_clock: ContextVar[Optional[RequestClock]] = ContextVar("request_clock", default=None)
+
+
+@contextmanager
+def clock_scope(clock: RequestClock) -> Iterator[RequestClock]:
+    token = _clock.set(clock)
+    try:
+        yield clock
+    finally:
+        _clock.reset(token)
+
+
+def mark_queued():
+    """Record that the current request is waiting for a scheduler slot"""
+    clock = _clock.get()
+    if clock is not None:
+        clock.queued = True
+
+
+def mark_sent():
+    """Record that the current request is being sent now"""
+    clock = _clock.get()
+    if clock is not None:
+        try:
+            clock.sent.set_result(time.perf_counter())
+        except Exception:  # InvalidStateError: the caller stopped listening
+            pass
+
+
+# --- Cancellation metrics ---
+class CancellationStats:
+    """Cancelled turns and LLM calls, by reason"""
+
+    def __init__(self):
+        self.counts: Dict[Tuple[str, str], int] = {}
+        self._lock = threading.Lock()
+
+    def count(self, kind: str, reason: str):
+        with self._lock:
+            self.counts[(kind, reason)] = self.counts.get((kind, reason), 0) + 1
+
+    def snapshot(self) -> Dict[Tuple[str, str], int]:
+        with self._lock:
+            return dict(self.counts)
+
+
+_stats = CancellationStats()
+
+def get_cancellation_stats() -> CancellationStats:
+    return _stats
+
+
+def render_cancellation_metrics() -> str:
+    """Cancelled turns and LLM calls in Prometheus text format"""
+    counts = sorted(get_cancellation_stats().snapshot().items())
+    lines: List[str] = []
+    for kind, help_text in (("turn", "Turns cancelled before they finished."),
+                            ("llm_call", "LLM calls abandoned because their turn was cancelled.")):
+        metric = f"travel_{kind}s_cancelled_total"
+        lines.append(f"# HELP {metric} {help_text}")
+        lines.append(f"# TYPE {metric} counter")
+        for (counted, reason), value in counts:
+            if counted == kind:
+                lines.append(f'{metric}{{reason="{reason}"}} {value}')
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,1323 @@
+# agents/engine.py
+import os
+import copy
+import time
+import uuid
+import asyncio
+import logging
+import threading
+import contextvars
+from queue import Queue
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from concurrent.futures import Future, ThreadPoolExecutor
+from enum import Enum
+from typing import Any, AsyncIterator, Awaitable, Callable, Deque, Dict, Hashable, Iterator, List, Optional, Tuple
+
+from agents.conversation import ConversationFSM, Event, Stage, ensure_conversation
+from agents.deadline import Deadline, TurnCancelled, deadline_scope, get_cancellation_stats
+from agents.history import HistoryBuffer
+from agents.intent_router import get_router
+from agents.message import Message, Role
+from agents.message_store import MessageStore, ensure_message_store
+from agents.scheduler import DEFAULT_PRIORITY, PRIORITIES, current_priority, get_scheduler, priority_scope
+from agents import speculation
+from agents.speculation import Speculation, SpeculationBudget
+from agents.session_store import SNAPSHOT_EVERY, STORE_ERRORS, SessionStore, StoredSession, create_session_store
+from agents.tracing import annotate, set_outcome, span, traced
+from agents.usage import COMPACT_HISTORY_TOKENS, SessionUsage, usage_of, usage_scope
+
+# Import your actual flight_agent and cab_agent modules
+try:
+    from agents.flight_agent import flight_agent, flight_agent_stream, aflight_agent
+    from agents.cab_agent import cab_agent, cab_agent_stream, acab_agent
+    from agents.supervisor_agent import asupervisor_agent, supervisor_agent
+    from agents.streaming import consume_stream
+    AGENTS_IMPORTED = True
+except ImportError:
+    AGENTS_IMPORTED = False
+
+logger = logging.getLogger(__name__)
+
+# --- Session settings ---
+SESSION_TTL = float(os.environ.get("SESSION_TTL_SECONDS", "3600"))  # idle sessions are dropped after this
+MAX_SESSIONS = int(os.environ.get("MAX_SESSIONS", "10000"))  # least recently active sessions go first
+# A message asking for both services ("a flight to Goa and a cab to the airport") books them side by side
+COMBINED_BOOKING = os.environ.get("COMBINED_BOOKING", "1") == "1"
+
+# --- Agent wrappers ---
+# Wrapper functions to handle message format compatibility
+def _agent_unavailable(state: Dict[str, Any], agent: str) -> Dict[str, Any]:
+    state["messages"].append(Message(agent, f"{agent.title()} agent module not available. Please check your imports."))
+    return state
+
+def _agent_error(state: Dict[str, Any], agent: str, error: Exception) -> Dict[str, Any]:
+    if isinstance(error, TurnCancelled):
+        # A stopped turn adds nothing; the stop command answers for it
+        set_outcome("cancelled")
+        if error.reason == "deadline":
+            state["messages"].append(Message(agent, DEADLINE_REPLY))
+        return state
+    logger.error("Error in %s_agent", agent, exc_info=error)
+    set_outcome("error")
+    state["last_error"] = f"Error in {agent}_agent: {str(error)}"
+    state["messages"].append(Message(agent, f"Sorry, I encountered an error: {str(error)}. Please try again."))
+    return state
+
+def _agent_state(state: Dict[str, Any], service: str) -> Optional[Dict[str, Any]]:
+    """Build an agent's view of the conversation, or None if its booking is already complete"""
+    messages = ensure_message_store(state)
+    if ensure_conversation(state).is_booked(service):
+        return None
+    
+    agent_state = state.copy()
+    
+    # Messages since the user opened this booking, with the latest supervisor message as context
+    formatted_messages = messages.agent_view(service)
+    if formatted_messages is None:
+        # If no session started, include the latest user input
+        formatted_messages = []
+        if state.get("user_input"):
+            formatted_messages.append(Message(None, state["user_input"], Role.USER))
+    
+    agent_state["messages"] = formatted_messages
+    # Keep the agent's rendered prompt history across turns
+    history = state.setdefault(f"{service}_history", HistoryBuffer())
+    # A session over its token budget gets its history compacted into a shorter summary
+    history.token_budget = COMPACT_HISTORY_TOKENS if usage_of(state).over_budget() else None
+    agent_state["history_buffer"] = history
+    return agent_state
+
+@traced("merge_messages")
+def _merge_agent_messages(state: Dict[str, Any], service: str, new_messages: List[Dict[str, Any]]):
+    # Extract only NEW agent messages, skipping duplicates
+    messages = ensure_message_store(state)
+    for msg in new_messages:
+        if isinstance(msg, (dict, Message)):
+            if msg.get("role") == "assistant" or msg.get("agent") == service:
+                content = msg.get("content", "")
+                if "BOOKING_COMPLETE" in content:
+                    continue
+                if not messages.contains(service, content) and content.strip():
+                    messages.append(Message(service, content))
+
+def _merge_result(state: Dict[str, Any], service: str, result_state: Dict[str, Any], view_size: int) -> Dict[str, Any]:
+    # Only messages past the agent's view are new; the rest came from the store
+    new_messages = result_state.get("messages", [])[view_size:]
+    _merge_agent_messages(state, service, new_messages)
+    
+    # The status the agent reported for this turn is the only input to the state machine
+    booking = result_state["booking_info"].get(service, {})
+    state["booking_info"][service] = booking
+    annotate(status=booking.get("status"))
+    ensure_conversation(state).agent_replied(service, booking.get("status"))
+    _sync_stage(state)
+    
+    return state
+
+@traced("safe_flight_agent", agent="flight")
+def safe_flight_agent(state: Dict[str, Any], on_token: Optional[Callable[[str], None]] = None) -> Dict[str, Any]:
+    """Wrapper for flight_agent with error handling and improved conversation flow.
+    When on_token is given the reply is streamed to it as it is generated."""
+    if not AGENTS_IMPORTED:
+        return _agent_unavailable(state, "flight")
+    
+    try:
+        agent_state = _agent_state(state, "flight")
+        if agent_state is None:
+            return state
+        view_size = len(agent_state["messages"])
+        
+        # Call the actual flight agent
+        if on_token:
+            result_state = consume_stream(flight_agent_stream(agent_state), on_token)
+        else:
+            result_state = flight_agent(agent_state)
+        
+        return _merge_result(state, "flight", result_state, view_size)
+        
+    except Exception as e:
+        return _agent_error(state, "flight", e)
+
+@traced("safe_flight_agent", agent="flight")
+async def asafe_flight_agent(state: Dict[str, Any], on_token: Optional[Callable[[str], None]] = None) -> Dict[str, Any]:
+    """Async counterpart of safe_flight_agent"""
+    if not AGENTS_IMPORTED:
+        return _agent_unavailable(state, "flight")
+    
+    try:
+        agent_state = _agent_state(state, "flight")
+        if agent_state is None:
+            return state
+        view_size = len(agent_state["messages"])
+        
+        result_state = await aflight_agent(agent_state, on_token)
+        return _merge_result(state, "flight", result_state, view_size)
+        
+    except Exception as e:
+        return _agent_error(state, "flight", e)
+
+@traced("safe_cab_agent", agent="cab")
+def safe_cab_agent(state: Dict[str, Any], on_token: Optional[Callable[[str], None]] = None) -> Dict[str, Any]:
+    if not AGENTS_IMPORTED:
+        return _agent_unavailable(state, "cab")
+    
+    try:
+        agent_state = _agent_state(state, "cab")
+        if agent_state is None:
+            return state
+        view_size = len(agent_state["messages"])
+        
+        # Call the actual cab agent
+        if on_token:
+            result_state = consume_stream(cab_agent_stream(agent_state), on_token)
+        else:
+            result_state = cab_agent(agent_state)
+        
+        return _merge_result(state, "cab", result_state, view_size)
+        
+    except Exception as e:
+        return _agent_error(state, "cab", e)
+
+@traced("safe_cab_agent", agent="cab")
+async def asafe_cab_agent(state: Dict[str, Any], on_token: Optional[Callable[[str], None]] = None) -> Dict[str, Any]:
+    """Async counterpart of safe_cab_agent"""
+    if not AGENTS_IMPORTED:
+        return _agent_unavailable(state, "cab")
+    
+    try:
+        agent_state = _agent_state(state, "cab")
+        if agent_state is None:
+            return state
+        view_size = len(agent_state["messages"])
+        
+        result_state = await acab_agent(agent_state, on_token)
+        return _merge_result(state, "cab", result_state, view_size)
+        
+    except Exception as e:
+        return _agent_error(state, "cab", e)
+
+# --- Combined bookings ---
+# Both agents collect their details in the same turns, each on its own view of the conversation;
+# their questions go out together, and the cab agent is told what the flight agent knows so far.
+_agent_pool: Optional[ThreadPoolExecutor] = None
+_agent_pool_lock = threading.Lock()
+
+def _get_agent_pool() -> ThreadPoolExecutor:
+    global _agent_pool
+    with _agent_pool_lock:
+        if _agent_pool is None:
+            _agent_pool = ThreadPoolExecutor(thread_name_prefix="combined-booking")
+    return _agent_pool
+
+def _run_agent(service: str, agent_state: Dict[str, Any], on_token: Optional[Callable[[str], None]]) -> Dict[str, Any]:
+    """Call a service's agent, streaming its reply to on_token when given"""
+    if on_token:
+        stream = {"flight": flight_agent_stream, "cab": cab_agent_stream}[service]
+        return consume_stream(stream(agent_state), on_token)
+    return {"flight": flight_agent, "cab": cab_agent}[service](agent_state)
+
+async def _arun_agent(service: str, agent_state: Dict[str, Any],
+                      on_token: Optional[Callable[[str], None]]) -> Dict[str, Any]:
+    return await {"flight": aflight_agent, "cab": acab_agent}[service](agent_state, on_token)
+
+def _link_cab_to_flight(state: Dict[str, Any], agent_state: Dict[str, Any]):
+    """Give the cab agent the flight agent's latest reply, so the cab can be planned around the flight"""
+    last_flight_message = ensure_message_store(state).last_message("flight")
+    if last_flight_message:
+        agent_state["user_input"] = (
+            f"{agent_state.get('user_input', '')}\n\n"
+            f"(The user is booking a flight for the same trip. The flight agent's latest message: "
+            f"{last_flight_message.get('content')})"
+        )
+
+def _combined_states(state: Dict[str, Any]) -> List[Tuple[str, Dict[str, Any], int]]:
+    """(service, agent state, view size) of each open booking in the combined booking"""
+    prepared = []
+    for service in ensure_conversation(state).parallel:
+        agent_state = _agent_state(state, service)
+        if agent_state is None:
+            continue
+        # The agents run at the same time, so neither may write into the other's booking info
+        agent_state["booking_info"] = copy.deepcopy(state["booking_info"])
+        if service == "cab":
+            _link_cab_to_flight(state, agent_state)
+        prepared.append((service, agent_state, len(agent_state["messages"])))
+    return prepared
+
+def _call_agent(service: str, agent_state: Dict[str, Any], on_token: Optional[Callable[[str], None]] = None) -> Any:
+    try:
+        return _run_agent(service, agent_state, on_token)
+    except Exception as e:
+        return e
+
+def _call_agent_into(service: str, agent_state: Dict[str, Any], tokens: "Queue[Optional[str]]") -> Any:
+    """_call_agent for the pool: the reply goes into tokens, closed with None"""
+    try:
+        return _call_agent(service, agent_state, tokens.put)
+    finally:
+        tokens.put(None)
+
+async def _acall_agent(service: str, agent_state: Dict[str, Any],
+                       tokens: "Optional[asyncio.Queue[Optional[str]]]") -> Any:
+    try:
+        return await _arun_agent(service, agent_state, tokens.put_nowait if tokens is not None else None)
+    except Exception as e:
+        return e
+    finally:
+        if tokens is not None:
+            tokens.put_nowait(None)
+
+class _ReplyTokens:
+    """on_token for the replies of a combined booking: streamed one after another, a blank line apart"""
+
+    def __init__(self, on_token: Callable[[str], None]):
+        self.on_token = on_token
+        self.streamed = False
+        self._opening = True
+
+    def next_reply(self):
+        self._opening = True
+
+    def __call__(self, token: str):
+        if not token:
+            return
+        if self._opening and self.streamed:
+            self.on_token("\n\n")
+        self._opening = False
+        self.streamed = True
+        self.on_token(token)
+
+def _merge_combined(state: Dict[str, Any], prepared: List[Tuple[str, Dict[str, Any], int]],
+                    results: List[Any]) -> Dict[str, Any]:
+    for (service, _, view_size), result in zip(prepared, results):
+        if isinstance(result, Exception):
+            _agent_error(state, service, result)
+        elif isinstance(result, BaseException):
+            raise result
+        else:
+            _merge_result(state, service, result, view_size)
+    return state
+
+@traced("combined_agents")
+def combined_agents(state: Dict[str, Any], on_token: Optional[Callable[[str], None]] = None) -> Dict[str, Any]:
+    """Run the agents of a combined booking concurrently and merge their replies in booking order"""
+    if not AGENTS_IMPORTED:
+        return _agent_unavailable(state, "flight")
+    
+    prepared = _combined_states(state)
+    if not prepared:
+        return state
+    # The first agent runs on this thread, the others on the pool, each in a copy of the trace/usage context.
+    # Replies stream in booking order: the first as it is generated, each later one from its queue of
+    # tokens, which fills while the agents before it are still answering.
+    pool = _get_agent_pool()
+    queues: List["Queue[Optional[str]]"] = [Queue() for _ in prepared[1:]]
+    futures = [pool.submit(contextvars.copy_context().run, _call_agent_into, service, agent_state, tokens)
+               for (service, agent_state, _), tokens in zip(prepared[1:], queues)]
+    replies = _ReplyTokens(on_token) if on_token else None
+    service, agent_state, _ = prepared[0]
+    results = [_call_agent(service, agent_state, replies)]
+    for tokens, future in zip(queues, futures):
+        if replies:
+            replies.next_reply()
+        # Tokens are passed on from this thread, where the caller's on_token expects them
+        for token in iter(tokens.get, None):
+            if replies:
+                replies(token)
+        results.append(future.result())
+    return _merge_combined(state, prepared, results)
+
+@traced("combined_agents")
+async def acombined_agents(state: Dict[str, Any], on_token: Optional[Callable[[str], None]] = None) -> Dict[str, Any]:
+    """Async counterpart of combined_agents"""
+    if not AGENTS_IMPORTED:
+        return _agent_unavailable(state, "flight")
+    
+    prepared = _combined_states(state)
+    queues = [asyncio.Queue() if on_token else None for _ in prepared]
+    tasks = [asyncio.ensure_future(_acall_agent(service, agent_state, tokens))
+             for (service, agent_state, _), tokens in zip(prepared, queues)]
+    try:
+        if on_token:
+            replies = _ReplyTokens(on_token)
+            for tokens in queues:
+                replies.next_reply()
+                while True:
+                    token = await tokens.get()
+                    if token is None:
+                        break
+                    replies(token)
+        results = await asyncio.gather(*tasks)
+    finally:
+        for task in tasks:
+            task.cancel()  # no-op for finished agents; stops the others when the turn is cancelled
+    return _merge_combined(state, prepared, list(results))
+
+# --- Shared Agent State Enum ---
+class AgentState(str, Enum):
+    FLIGHT_AGENT = "flight_agent"
+    CAB_AGENT = "cab_agent"
+    END = "end"
+
+AGENT_FOR_SERVICE = {"flight": AgentState.FLIGHT_AGENT, "cab": AgentState.CAB_AGENT}
+
+def _sync_stage(state: Dict[str, Any]):
+    """Mirror the state machine into the conversation_stage/current_agent keys the UI reads"""
+    conversation = ensure_conversation(state)
+    state["conversation_stage"] = conversation.stage.value
+    # A combined booking shows up as its first service
+    service = conversation.service or next(iter(conversation.parallel), None)
+    state["current_agent"] = AGENT_FOR_SERVICE.get(service)
+
+# A user answering a confirmation is about to book; their LLM calls go ahead of other queued work
+CONFIRM_STAGES = (Stage.PENDING_CONFIRMATION, Stage.AWAITING_SPECIAL_REQUESTS)
+
+def turn_priority(state: Dict[str, Any]) -> str:
+    """Scheduling priority (agents/scheduler.py) of the next turn of this conversation.
+    Background work (a batch run) keeps the lower priority it was started with."""
+    current = current_priority()
+    if PRIORITIES[current] > PRIORITIES[DEFAULT_PRIORITY]:
+        return current
+    return "confirm" if state.get("conversation_stage") in CONFIRM_STAGES else "interactive"
+
+def start_booking(state: Dict[str, Any], service: str, handoff_from: Optional[str] = None):
+    ensure_conversation(state).start(service, handoff_from)
+    _sync_stage(state)
+
+def start_combined_booking(state: Dict[str, Any], services: List[str]):
+    ensure_conversation(state).start_combined(services)
+    _sync_stage(state)
+
+def stop_booking(state: Dict[str, Any]):
+    ensure_conversation(state).fire(Event.STOP)
+    _sync_stage(state)
+
+def _prepare_flight_turn(state: Dict[str, Any]):
+    """Clear cab-specific state and hand the cab booking context over to the flight agent"""
+    if "cab_context" in state:
+        del state["cab_context"]
+    
+    # Only pass context on the first turn after the user accepted the follow-up question
+    if ensure_conversation(state).take_handoff() == "cab":
+        last_cab_message = ensure_message_store(state).last_message("cab")
+        cab_summary = last_cab_message.get("content") if last_cab_message else None
+        last_user_input = state.get("user_input", "book flight")
+        
+        if cab_summary:
+            # Craft a message for the flight agent with the cab summary and user input
+            supervisor_message = (
+                f"The user wants to book a flight: '{last_user_input}'. They have just completed a cab booking. Here are the details:\n\n"
+                f"{cab_summary}\n\n"
+                f"Please assist the user in booking a flight based on this cab information. "
+                f"For example, suggest a flight that aligns with the cab's pickup or drop-off location and time."
+            )
+            state["messages"].append(Message("supervisor", supervisor_message))
+        else:
+            # Fallback if no cab summary is found
+            supervisor_message = (
+                f"The user wants to book a flight: '{last_user_input}'. I don't have prior cab booking details. "
+                f"Please assist them with the booking process by asking for their origin, destination, and preferred travel date and time."
+            )
+            state["messages"].append(Message("supervisor", supervisor_message))
+
+def _prepare_cab_turn(state: Dict[str, Any]):
+    """Clear flight-specific state and hand the flight booking context over to the cab agent"""
+    if "flight_context" in state:
+        del state["flight_context"]
+    
+    # Only pass context on the first turn after the user accepted the follow-up question
+    if ensure_conversation(state).take_handoff() == "flight":
+        last_flight_message = ensure_message_store(state).last_message("flight")
+        flight_summary = last_flight_message.get("content") if last_flight_message else None
+        last_user_input = state.get("user_input", "book cab")
+        
+        if flight_summary:
+            # Craft a message for the cab agent with the flight summary and user input
+            supervisor_message = (
+                f"The user wants to book a cab: '{last_user_input}'. They have just completed a flight booking. Here are the details:\n\n"
+                f"{flight_summary}\n\n"
+                f"Please assist the user in booking a cab based on this flight information. "
+                f"For example, suggest a cab to the departure airport a few hours before the flight, "
+                f"or a cab from the 'arrival airport' after landing "
+                f"or BOTH"
+            )
+            state["messages"].append(Message("supervisor", supervisor_message))
+        else:
+            # Fallback if no flight summary is found
+            supervisor_message = (
+                f"The user wants to book a cab: '{last_user_input}'. I don't have prior flight booking details. "
+                f"Please assist them with the booking process by asking for their pickup location, destination, and preferred time."
+            )
+            state["messages"].append(Message("supervisor", supervisor_message))
+
+def _greet(state: Dict[str, Any]):
+    # Handle initial case
+    if not state.get("messages") or state["messages"][-1]["agent"] != "supervisor":
+        state["messages"].append(Message("supervisor", "I can help you book flights and cabs. Would you like to book a flight or a cab?"))
+
+def _needs_supervisor_llm(state: Dict[str, Any]) -> bool:
+    """Whether the intent router left this turn's input for the supervisor LLM to route"""
+    conversation = ensure_conversation(state)
+    return AGENTS_IMPORTED and not conversation.service and not conversation.parallel and bool(state.get("user_input"))
+
+def _supervisor_llm_state(state: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        # A copy, so the supervisor agent's own messages are merged in the engine's format below
+        "messages": list(ensure_message_store(state)),
+        "current_agent": None,
+        "booking_info": state["booking_info"],
+        "supervisor_history_buffer": state.get("supervisor_history"),
+        "user_input": state["user_input"],
+    }
+
+def _apply_supervisor_route(state: Dict[str, Any], result: Any, seen: int,
+                            on_token: Optional[Callable[[str], None]]):
+    """Add the supervisor LLM's reply to the conversation and start the booking it routed to"""
+    if isinstance(result, BaseException):
+        _agent_error(state, "supervisor", result)
+        return
+    state["supervisor_history"] = result.get("supervisor_history_buffer")
+    replies = [msg["content"] for msg in result["messages"][seen:]]
+    for reply in replies:
+        state["messages"].append(Message("supervisor", reply))
+    service = {"flight_agent": "flight", "cab_agent": "cab"}.get(result.get("current_agent"))
+    if on_token and replies:
+        on_token("\n\n".join(replies) + ("\n\n" if service else ""))
+    if service:
+        start_booking(state, service)
+
+def _ask_supervisor(state: Dict[str, Any], on_token: Optional[Callable[[str], None]]):
+    llm_state = _supervisor_llm_state(state)
+    seen = len(llm_state["messages"])
+    try:
+        result = supervisor_agent(llm_state)
+    except Exception as e:
+        result = e
+    _apply_supervisor_route(state, result, seen, on_token)
+
+async def _aask_supervisor(state: Dict[str, Any], on_token: Optional[Callable[[str], None]]):
+    llm_state = _supervisor_llm_state(state)
+    seen = len(llm_state["messages"])
+    try:
+        result = await asupervisor_agent(llm_state)
+    except Exception as e:
+        result = e
+    _apply_supervisor_route(state, result, seen, on_token)
+
+@traced("supervisor")
+def supervisor(state: Dict[str, Any], on_token: Optional[Callable[[str], None]] = None) -> Dict[str, Any]:
+    """Supervisor function to route tasks to appropriate agents and share context"""
+    conversation = ensure_conversation(state)
+    if _needs_supervisor_llm(state):
+        # The intent router was unsure; the supervisor LLM reads the request and picks the agent
+        _ask_supervisor(state, on_token)
+    service = conversation.service
+    annotate(service=service or "+".join(conversation.parallel))
+    
+    # If we're switching agents, clear any previous agent-specific state
+    if conversation.parallel:
+        state = combined_agents(state, on_token)
+    elif service == "flight":
+        _prepare_flight_turn(state)
+        state = safe_flight_agent(state, on_token)
+    elif service == "cab":
+        _prepare_cab_turn(state)
+        state = safe_cab_agent(state, on_token)
+    else:
+        _greet(state)
+    
+    return state
+
+@traced("supervisor")
+async def asupervisor(state: Dict[str, Any], on_token: Optional[Callable[[str], None]] = None) -> Dict[str, Any]:
+    """Async counterpart of supervisor; a slow LLM call no longer holds a worker thread"""
+    conversation = ensure_conversation(state)
+    if _needs_supervisor_llm(state):
+        await _aask_supervisor(state, on_token)
+    service = conversation.service
+    annotate(service=service or "+".join(conversation.parallel))
+    
+    if conversation.parallel:
+        state = await acombined_agents(state, on_token)
+    elif service == "flight":
+        _prepare_flight_turn(state)
+        state = await asafe_flight_agent(state, on_token)
+    elif service == "cab":
+        _prepare_cab_turn(state)
+        state = await asafe_cab_agent(state, on_token)
+    else:
+        _greet(state)
+    
+    return state
+
+# --- Session state ---
+def new_session_state() -> Dict[str, Any]:
+    return {
+        "messages": MessageStore(),
+        "current_agent": None,
+        "booking_info": {
+            "flight": {},
+            "cab": {}
+        },
+        "user_input": "",
+        "conversation": ConversationFSM(),
+        "conversation_stage": "initial",  # mirrors conversation.stage, see agents/conversation.py
+        "follow_up_declined": False,
+        "usage": SessionUsage()
+    }
+
+def session_fields(state: Dict[str, Any]) -> Dict[str, Any]:
+    """Everything about a session except its messages and caches, as plain JSON data"""
+    current_agent = state.get("current_agent")
+    return {
+        "booking_info": state["booking_info"],
+        "current_agent": current_agent.value if isinstance(current_agent, Enum) else current_agent,
+        "conversation_stage": state.get("conversation_stage", "initial"),
+        "follow_up_declined": state.get("follow_up_declined", False),
+        "conversation": ensure_conversation(state).to_dict(),
+        "usage": usage_of(state).to_dict(),
+    }
+
+def restore_state(stored: StoredSession) -> Dict[str, Any]:
+    """Rebuild a session state from the store; history buffers are re-rendered on the next turn"""
+    state = new_session_state()
+    state["messages"] = MessageStore(stored.messages)
+    fields = stored.fields
+    state["booking_info"] = fields.get("booking_info", state["booking_info"])
+    state["current_agent"] = AgentState(fields["current_agent"]) if fields.get("current_agent") else None
+    state["conversation_stage"] = fields.get("conversation_stage", "initial")
+    state["follow_up_declined"] = fields.get("follow_up_declined", False)
+    if fields.get("conversation"):
+        state["conversation"] = ConversationFSM.from_dict(fields["conversation"])
+    if fields.get("usage"):
+        state["usage"] = SessionUsage.from_dict(fields["usage"])
+    return state
+
+# --- Turn handling ---
+UNCLEAR_REPLY = "I can help you book flights and cabs! Please specify if you'd like to book a flight or a cab/taxi."
+STOPPED_REPLY = "Booking process stopped. How can I assist you further?"
+FAREWELL_REPLY = "Thank you for using our travel booking service! Have a great trip!"
+DEADLINE_REPLY = "Sorry, that took too long to answer. Please try again."
+BUDGET_REPLY = "This conversation has reached its usage limit, so I can't continue it. Please start a new booking."
+
+def is_complete(state: Dict[str, Any]) -> bool:
+    """Check if both bookings are complete"""
+    flight_booked = state["booking_info"]["flight"].get("status") == "booked"
+    cab_booked = state["booking_info"]["cab"].get("status") == "booked"
+    return flight_booked and cab_booked
+
+def follow_up_service(state: Dict[str, Any]) -> Optional[str]:
+    """The service to offer after a completed booking, or None if no follow-up question is due"""
+    # If the user has already declined the follow-up, or an agent is active, don't ask
+    if state.get("follow_up_declined") or ensure_conversation(state).active:
+        return None
+    
+    flight_booked = state["booking_info"]["flight"].get("status") == "booked"
+    cab_booked = state["booking_info"]["cab"].get("status") == "booked"
+    if flight_booked and not cab_booked:
+        return "cab"
+    elif cab_booked and not flight_booked:
+        return "flight"
+    return None
+
+def follow_up_message(state: Dict[str, Any], service_name: str) -> str:
+    other_service = "flight" if service_name == "cab" else "cab"
+    
+    # Reuse the supervisor's logic to get the last agent message for context
+    booking_summary = None
+    last_message = ensure_message_store(state).last_message(other_service)
+    if last_message:
+        content = last_message.get("content")
+        if "from" in content:
+            booking_summary = content[content.lower().find("from"):]  # Extract from "from" onwards
+        else:
+            booking_summary = content  # fallback to full content
+    
+    # Construct dynamic follow-up message
+    if booking_summary:
+        return (
+            f"You have successfully booked your {other_service} {booking_summary}. "
+            f"Would you like to book a {service_name} as well to complement your trip?"
+        )
+    return (
+        f"You have successfully booked your {other_service}. "
+        f"Would you like to book a {service_name} as well to complement your trip?"
+    )
+
+def _refuse_over_budget(state: Dict[str, Any]) -> bool:
+    """Answer with BUDGET_REPLY instead of calling an agent when the session's budget says so"""
+    usage = usage_of(state)
+    if usage.over_budget() and usage.action == "refuse":
+        state["messages"].append(Message("supervisor", BUDGET_REPLY))
+        return True
+    return False
+
+def _begin_turn(state: Dict[str, Any], user_input: str) -> bool:
+    """Record the user's message and pick an agent; False if the turn needs no agent call"""
+    state.pop("last_error", None)
+    ensure_message_store(state).append(Message("user", user_input))
+    
+    # Check for kill switch
+    router = get_router()
+    if router.wants_stop(user_input):
+        state["messages"].append(Message("supervisor", STOPPED_REPLY))
+        stop_booking(state)
+        return False
+    
+    if _refuse_over_budget(state):
+        return False
+    
+    # Determine which agent to activate first
+    if state["current_agent"] is None:
+        services = [service for service in router.services(user_input) if service in AGENT_FOR_SERVICE]
+        intent = "combined" if COMBINED_BOOKING and len(services) > 1 else router.route(user_input)
+        if intent == "combined":
+            start_combined_booking(state, services)
+        elif intent in ("flight", "cab"):
+            start_booking(state, intent)
+        elif not AGENTS_IMPORTED:
+            state["messages"].append(Message("supervisor", UNCLEAR_REPLY))
+            return False
+        # Anything else is routed by the supervisor LLM (see supervisor)
+    
+    state["user_input"] = user_input
+    return True
+
+def handle_turn(state: Dict[str, Any], user_input: str,
+                on_token: Optional[Callable[[str], None]] = None) -> Dict[str, Any]:
+    """Run one user turn through the supervisor, streaming the agent reply to on_token"""
+    if _begin_turn(state, user_input):
+        state = supervisor(state, on_token)
+    return state
+
+async def ahandle_turn(state: Dict[str, Any], user_input: str,
+                       on_token: Optional[Callable[[str], None]] = None) -> Dict[str, Any]:
+    """Async counterpart of handle_turn"""
+    if _begin_turn(state, user_input):
+        state = await asupervisor(state, on_token)
+    return state
+
+def _begin_follow_up(state: Dict[str, Any]) -> Optional[str]:
+    service_name = follow_up_service(state)
+    if service_name is None or _refuse_over_budget(state):
+        return None
+    other_service = "flight" if service_name == "cab" else "cab"
+    state.pop("last_error", None)
+    
+    # Clear any previous booking context for the new service
+    state["booking_info"][service_name] = {}
+    # Clear any agent-specific context that might persist
+    state.pop("flight_context", None)
+    state.pop("cab_context", None)
+    
+    # Add messages to conversation
+    state["messages"].append(Message("supervisor", follow_up_message(state, service_name)))
+    state["messages"].append(Message("user", f"Yes, book {service_name}"))
+    
+    # Start the new booking, handing over the one just completed
+    start_booking(state, service_name, handoff_from=other_service)
+    state["user_input"] = f"book {service_name}"
+    return service_name
+
+def accept_follow_up(state: Dict[str, Any], on_token: Optional[Callable[[str], None]] = None) -> Dict[str, Any]:
+    """The user said yes to the follow-up question: start the other booking"""
+    if _begin_follow_up(state):
+        # Process through supervisor to initialize the new agent
+        state = supervisor(state, on_token)
+    return state
+
+async def aaccept_follow_up(state: Dict[str, Any],
+                            on_token: Optional[Callable[[str], None]] = None) -> Dict[str, Any]:
+    """Async counterpart of accept_follow_up"""
+    if _begin_follow_up(state):
+        state = await asupervisor(state, on_token)
+    return state
+
+def decline_follow_up(state: Dict[str, Any]) -> Dict[str, Any]:
+    service_name = follow_up_service(state)
+    if service_name is None:
+        return state
+    state["messages"].append(Message("supervisor", follow_up_message(state, service_name)))
+    state["messages"].append(Message("user", "No, thanks"))
+    state["messages"].append(Message("supervisor", FAREWELL_REPLY))
+    state["follow_up_declined"] = True
+    return state
+
+
+# --- Sessions ---
+def _wake(waiter: "asyncio.Future[None]"):
+    if not waiter.done():
+        waiter.set_result(None)
+
+
+class SessionLock:
+    """One lock for the sync (Streamlit) and async (ASGI) callers of a session.
+
+    `with` blocks the calling thread; `async with` waits for a release without
+    blocking the event loop. Both take the same underlying lock, so a sync and
+    an async turn of one session never run at the same time.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._guard = threading.Lock()  # orders async waiters against release()
+        self._waiters: Deque[Tuple[asyncio.AbstractEventLoop, "asyncio.Future[None]"]] = deque()
+
+    def locked(self) -> bool:
+        return self._lock.locked()
+
+    def acquire(self, blocking: bool = True) -> bool:
+        return self._lock.acquire(blocking)
+
+    async def aacquire(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            with self._guard:
+                if self._lock.acquire(blocking=False):
+                    return
+                waiter = loop.create_future()
+                self._waiters.append((loop, waiter))
+            await waiter
+
+    def release(self):
+        self._lock.release()
+        with self._guard:
+            waiters, self._waiters = self._waiters, deque()
+        # Every waiter retries; the ones that lose wait again
+        for loop, waiter in waiters:
+            try:
+                loop.call_soon_threadsafe(_wake, waiter)
+            except RuntimeError:  # its event loop is closed
+                pass
+
+    def __enter__(self) -> "SessionLock":
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.release()
+
+    async def __aenter__(self) -> "SessionLock":
+        await self.aacquire()
+        return self
+
+    async def __aexit__(self, *exc_info):
+        self.release()
+
+
+class Session:
+    def __init__(self, session_id: str, state: Optional[Dict[str, Any]] = None):
+        self.id = session_id
+        self.state = state if state is not None else new_session_state()
+        self.last_active = time.monotonic()
+        # Turns of one session run one at a time, whether they come from sync (Streamlit) or async (ASGI) callers
+        self.lock = SessionLock()
+        # Persistence bookkeeping: last record written, messages already in the store
+        self.seq = 0
+        self.persisted = 0
+        self.turns_since_snapshot = 0
+        # Bumped on every change; with the request content it identifies duplicate submissions
+        self.version = 0
+        self.in_flight: Dict[Hashable, Future] = {}
+        self.last_request: Optional[Hashable] = None
+        self.flight_lock = threading.Lock()
+        # Follow-up turn run ahead of time while the question is displayed
+        self.speculation: Optional[Speculation] = None
+        # Deadline of the turn running now; a stop command cancels it
+        self.deadline: Optional[Deadline] = None
+
+    def touch(self):
+        self.last_active = time.monotonic()
+
+
+class SessionManager:
+    """Sessions keyed by id, kept in memory while active.
+
+    Idle sessions (after `ttl` seconds, or beyond `max_sessions`) leave memory.
+    With a store they are persisted after every change and loaded back on the
+    next access, so they also survive restarts and can move between processes;
+    without one they are gone.
+    """
+
+    def __init__(self, ttl: float = SESSION_TTL, max_sessions: int = MAX_SESSIONS,
+                 store: Optional[SessionStore] = None):
+        self.ttl = ttl
+        self.max_sessions = max_sessions
+        self.store = store
+        self._sessions: "OrderedDict[str, Session]" = OrderedDict()  # least recently active first
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+    def create(self, session_id: Optional[str] = None) -> Session:
+        session = Session(session_id or uuid.uuid4().hex)
+        with self._lock:
+            self._sessions[session.id] = session
+            self._prune()
+        self.persist(session, snapshot=True)
+        return session
+
+    def get(self, session_id: str) -> Optional[Session]:
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is not None:
+                session.touch()
+                self._sessions.move_to_end(session_id)
+                return session
+        return self._load(session_id)
+
+    def _load(self, session_id: str) -> Optional[Session]:
+        if self.store is None:
+            return None
+        try:
+            stored = self.store.load(session_id)
+        except ValueError:  # not a valid session id
+            return None
+        except STORE_ERRORS:
+            logger.warning("Could not load session %s from the session store", session_id, exc_info=True)
+            return None
+        if stored is None:
+            return None
+        session = Session(session_id, restore_state(stored))
+        session.seq = stored.seq
+        session.persisted = len(stored.messages)
+        with self._lock:
+            # Another caller may have loaded it meanwhile; keep theirs
+            session = self._sessions.setdefault(session_id, session)
+            self._sessions.move_to_end(session_id)
+            self._prune()
+        return session
+
+    def persist(self, session: Session, snapshot: bool = False):
+        """Log what the last turn added, or write a full snapshot every SNAPSHOT_EVERY turns"""
+        if self.store is None:
+            return
+        messages = session.state["messages"]
+        fields = session_fields(session.state)
+        session.seq += 1
+        if snapshot or len(messages) < session.persisted or session.turns_since_snapshot + 1 >= SNAPSHOT_EVERY:
+            self.store.snapshot(session.id, session.seq, messages, fields)
+            session.turns_since_snapshot = 0
+        else:
+            self.store.append(session.id, session.seq, messages[session.persisted:], fields)
+            session.turns_since_snapshot += 1
+        session.persisted = len(messages)
+
+    def drop(self, session_id: str) -> bool:
+        with self._lock:
+            dropped = self._sessions.pop(session_id, None) is not None
+        if self.store is not None:
+            self.store.delete(session_id)
+        return dropped
+
+    def prune(self) -> int:
+        with self._lock:
+            return self._prune()
+
+    def _prune(self) -> int:
+        dropped = 0
+        cutoff = time.monotonic() - self.ttl
+        while self._sessions:
+            oldest = next(iter(self._sessions.values()))
+            if len(self._sessions) <= self.max_sessions and (self.ttl <= 0 or oldest.last_active >= cutoff):
+                break
+            self._sessions.popitem(last=False)
+            dropped += 1
+        return dropped
+
+
+# --- Engine ---
+class ConversationEngine:
+    """UI-independent front door to the booking flow, shared by the Streamlit app and the HTTP API.
+
+    Every method takes a session id; unknown ids raise KeyError. Turns of the
+    same session are serialised, different sessions run concurrently.
+    """
+
+    def __init__(self, sessions: Optional[SessionManager] = None):
+        self.sessions = sessions if sessions is not None else SessionManager(store=create_session_store())
+        self.requests = 0
+        self.coalesced = 0
+        self.speculation_budget = SpeculationBudget()
+        # Threads start on first use; created here so concurrent sessions share one pool
+        self._speculator = ThreadPoolExecutor(speculation.MAX_IN_FLIGHT, thread_name_prefix="speculation")
+
+    # --- Single flight ---
+    # A request is keyed on (kind, content, state version). A duplicate of a request that is
+    # still running waits for its result instead of calling the agents again; a duplicate of
+    # the request that produced the current version (e.g. a resubmitted form) gets the state.
+    def _join(self, session: Session, kind: str, content: Any,
+              version: Optional[int]) -> Tuple[Hashable, Future, bool]:
+        """The request's key, the future holding its result, and whether this caller has to produce it"""
+        with session.flight_lock:
+            key = (kind, content, session.version if version is None else version)
+            future = session.in_flight.get(key)
+            if future is None and key == session.last_request:
+                future = Future()
+                future.set_result(session.state)
+            if future is not None:
+                self.coalesced += 1
+                return key, future, False
+            future = session.in_flight[key] = Future()
+            self.requests += 1
+            return key, future, True
+
+    def _settle(self, session: Session, key: Hashable, future: Future,
+                result: Any = None, error: Optional[BaseException] = None):
+        with session.flight_lock:
+            session.in_flight.pop(key, None)
+            if error is None:
+                session.last_request = key
+        if error is None:
+            future.set_result(result)
+        else:
+            future.set_exception(error)
+
+    def _single_flight(self, session: Session, kind: str, content: Any, version: Optional[int],
+                       run: Callable[[], Dict[str, Any]]) -> Dict[str, Any]:
+        key, future, owner = self._join(session, kind, content, version)
+        if not owner:
+            return future.result()
+        try:
+            result = run()
+        except BaseException as e:
+            self._settle(session, key, future, error=e)
+            raise
+        self._settle(session, key, future, result)
+        return result
+
+    async def _asingle_flight(self, session: Session, kind: str, content: Any, version: Optional[int],
+                              run: Callable[[], Awaitable[Dict[str, Any]]]) -> Dict[str, Any]:
+        key, future, owner = self._join(session, kind, content, version)
+        if not owner:
+            return await asyncio.wrap_future(future)
+        try:
+            result = await run()
+        except BaseException as e:
+            self._settle(session, key, future, error=e)
+            raise
+        self._settle(session, key, future, result)
+        return result
+
+    def stats(self) -> Dict[str, Any]:
+        return {"requests": self.requests, "coalesced": self.coalesced, "sessions": len(self.sessions),
+                "speculation": self.speculation_budget.stats()}
+
+    # --- Speculative follow-up ---
+    # Once a booking is done the next step is predictable: the user is asked whether to book
+    # the other service. The opening turn of that agent is run in the background on a copy of
+    # the state; "Yes" adopts the copy if the session has not changed since, "No" drops it.
+    def _speculate(self, session: Session):
+        if not speculation.ENABLED or not AGENTS_IMPORTED:
+            return
+        # Never copy a state that a turn is in the middle of changing
+        if not session.lock.acquire(blocking=False):
+            return
+        try:
+            with session.flight_lock:
+                current = session.speculation
+                if current is not None and current.version == session.version and not current.expired():
+                    return
+                state = session.state
+                service = follow_up_service(state)
+                usage = usage_of(state)
+                if service is None or is_complete(state) or (usage.over_budget() and usage.action == "refuse"):
+                    return
+                reserved = self.speculation_budget.acquire()
+                if reserved is None:
+                    return
+                spec = session.speculation = Speculation(session.version, service, reserved)
+            state = copy.deepcopy(state)
+        finally:
+            session.lock.release()
+        self._speculator.submit(self._run_speculation, session.id, spec, state)
+
+    def _run_speculation(self, session_id: str, spec: Speculation, state: Dict[str, Any]):
+        usage = usage_of(state)
+        before = usage.total_tokens
+        try:
+            with span("speculate", session_id=session_id, service=spec.service), usage_scope(usage), \
+                    deadline_scope(spec.deadline), priority_scope(spec.priority):
+                spec.future.set_result(accept_follow_up(state, spec.tokens.append))
+        except BaseException as e:
+            spec.future.set_exception(e)
+        finally:
+            spec.spent = usage.total_tokens - before
+            self.speculation_budget.release(spec.spent, spec.reserved)
+
+    def _take_speculation(self, session: Session) -> Optional[Speculation]:
+        """The session's speculation if it is still valid; anything else is dropped"""
+        with session.flight_lock:
+            spec, session.speculation = session.speculation, None
+        if spec is None:
+            return None
+        if spec.version != session.version:
+            self._drop_speculation(spec, "discarded")
+            return None
+        if spec.expired():
+            self._drop_speculation(spec, "expired")
+            return None
+        return spec
+
+    def _discard_speculation(self, session: Session):
+        with session.flight_lock:
+            spec, session.speculation = session.speculation, None
+        if spec is not None:
+            self._drop_speculation(spec, "discarded")
+
+    def _drop_speculation(self, spec: Speculation, outcome: str):
+        # A speculative turn still running stops here instead of paying for a reply nobody reads
+        spec.deadline.cancel(outcome)
+        self.speculation_budget.count(outcome)
+
+    @staticmethod
+    def _claim(session: Session, spec: Speculation, deadline: Deadline):
+        """The user is now waiting for the speculation: it runs at their turn's priority and stops with their turn"""
+        spec.deadline.follow(deadline)
+        get_scheduler().promote(spec.priority, turn_priority(session.state))
+
+    def _adopt(self, session: Session, spec: Speculation, result: Optional[Dict[str, Any]],
+               on_token: Optional[Callable[[str], None]]) -> bool:
+        if result is None or result.get("last_error"):
+            self.speculation_budget.count("failed")
+            return False
+        session.state = result
+        annotate(speculative=True)
+        if on_token:
+            for token in spec.tokens:
+                on_token(token)
+        self.speculation_budget.count("used")
+        return True
+
+    @staticmethod
+    def _speculation_result(spec: Speculation) -> Optional[Dict[str, Any]]:
+        try:
+            return spec.future.result()  # still running: it is the same call a fresh turn would make
+        except Exception:
+            return None
+
+    # --- Deadlines and cancellation ---
+    # Every turn runs under a Deadline (agents/deadline.py) that reaches each LLM call made
+    # for it. A stop command cancels the turn still running, which releases its worker at once.
+    @contextmanager
+    def _turn_deadline(self, session: Session) -> Iterator[Deadline]:
+        deadline = session.deadline = Deadline()
+        try:
+            with deadline_scope(deadline):
+                yield deadline
+        finally:
+            if session.deadline is deadline:
+                session.deadline = None
+            if deadline.tripped:
+                get_cancellation_stats().count("turn", deadline.tripped)
+
+    def cancel(self, session_id: str, reason: str = "stopped") -> bool:
+        """Cancel the session's running turn and speculative work; False if nothing was running"""
+        session = self.session(session_id)
+        self._discard_speculation(session)
+        deadline = session.deadline
+        return deadline is not None and deadline.cancel(reason)
+
+    def _stop_requested(self, session: Session, user_input: str):
+        if get_router().wants_stop(user_input):
+            self.cancel(session.id)
+
+    def _persist(self, session: Session, snapshot: bool = False):
+        with session.flight_lock:
+            session.version += 1
+        annotate(stage=session.state.get("conversation_stage"))
+        with span("persist"):
+            self.sessions.persist(session, snapshot)
+
+    def session(self, session_id: str) -> Session:
+        session = self.sessions.get(session_id)
+        if session is None:
+            raise KeyError(session_id)
+        return session
+
+    def create_session(self, session_id: Optional[str] = None) -> str:
+        return self.sessions.create(session_id).id
+
+    def ensure_session(self, session_id: Optional[str]) -> str:
+        """Return session_id if it is still live, otherwise the id of a new session"""
+        if session_id is not None and self.sessions.get(session_id) is not None:
+            return session_id
+        return self.create_session()
+
+    def reset(self, session_id: str) -> Session:
+        session = self.session(session_id)
+        with session.lock:
+            self._discard_speculation(session)
+            usage = usage_of(session.state)
+            session.state = new_session_state()
+            # A fresh conversation starts from zero usage but keeps the session's budget
+            session.state["usage"] = SessionUsage(usage.budget, usage.action)
+            self._persist(session, snapshot=True)
+        return session
+
+    def close(self, session_id: str) -> bool:
+        session = self.sessions.get(session_id)
+        if session is not None and session.deadline is not None:
+            session.deadline.cancel("closed")
+        return self.sessions.drop(session_id)
+
+    def state(self, session_id: str) -> Dict[str, Any]:
+        return self.session(session_id).state
+
+    def version(self, session_id: str) -> int:
+        """Changes so far; clients can send it back with a request to make resubmissions harmless"""
+        return self.session(session_id).version
+
+    def usage(self, session_id: str) -> Dict[str, Any]:
+        """Token and latency totals of the session, per agent"""
+        return usage_of(self.state(session_id)).summary()
+
+    def set_token_budget(self, session_id: str, budget: int, action: Optional[str] = None):
+        """Cap the session at budget tokens (0 = unlimited); once over, compact its history or refuse turns"""
+        session = self.session(session_id)
+        with session.lock:
+            current = usage_of(session.state)
+            usage = SessionUsage(budget, action or current.action)
+            usage.agents = current.agents
+            session.state["usage"] = usage
+            self._persist(session)
+
+    def follow_up(self, session_id: str) -> Optional[Tuple[str, str]]:
+        """(service, question) when a follow-up booking should be offered"""
+        session = self.session(session_id)
+        state = session.state
+        service_name = follow_up_service(state)
+        if service_name is None or is_complete(state):
+            return None
+        self._speculate(session)
+        return service_name, follow_up_message(state, service_name)
+
+    def turn(self, session_id: str, user_input: str,
+             on_token: Optional[Callable[[str], None]] = None, version: Optional[int] = None) -> Dict[str, Any]:
+        session = self.session(session_id)
+        self._stop_requested(session, user_input)
+
+        def run():
+            with session.lock, span("turn", session_id=session_id), usage_scope(usage_of(session.state)), \
+                    self._turn_deadline(session), priority_scope(turn_priority(session.state)):
+                session.state = handle_turn(session.state, user_input, on_token)
+                self._persist(session)
+                return session.state
+        state = self._single_flight(session, "turn", user_input, version, run)
+        self._speculate(session)
+        return state
+
+    async def aturn(self, session_id: str, user_input: str,
+                    on_token: Optional[Callable[[str], None]] = None, version: Optional[int] = None) -> Dict[str, Any]:
+        session = self.session(session_id)
+        self._stop_requested(session, user_input)
+
+        async def run():
+            async with session.lock:
+                with span("turn", session_id=session_id), usage_scope(usage_of(session.state)), \
+                        self._turn_deadline(session), priority_scope(turn_priority(session.state)):
+                    session.state = await ahandle_turn(session.state, user_input, on_token)
+                    self._persist(session)
+                return session.state
+        state = await self._asingle_flight(session, "turn", user_input, version, run)
+        self._speculate(session)
+        return state
+
+    async def astream_turn(self, session_id: str, user_input: str, version: Optional[int] = None) -> AsyncIterator[str]:
+        """Run a turn and yield the reply tokens as they are generated.
+        A coalesced duplicate yields nothing and finishes with the original turn."""
+        self.session(session_id)  # fail before anything is started
+        queue: "asyncio.Queue[Optional[str]]" = asyncio.Queue()
+
+        async def run():
+            try:
+                await self.aturn(session_id, user_input, on_token=queue.put_nowait, version=version)
+            finally:
+                queue.put_nowait(None)
+
+        task = asyncio.create_task(run())
+        try:
+            while True:
+                token = await queue.get()
+                if token is None:
+                    break
+                yield token
+            await task
+        finally:
+            if not task.done():
+                task.cancel()  # the client went away mid-reply; its LLM requests are cancelled with it
+                get_cancellation_stats().count("turn", "disconnected")
+
+    def accept_follow_up(self, session_id: str, on_token: Optional[Callable[[str], None]] = None,
+                         version: Optional[int] = None) -> Dict[str, Any]:
+        session = self.session(session_id)
+
+        def run():
+            with session.lock, span("follow_up", session_id=session_id), usage_scope(usage_of(session.state)), \
+                    self._turn_deadline(session) as deadline:
+                spec = self._take_speculation(session)
+                if spec is not None:
+                    self._claim(session, spec, deadline)
+                if spec is None or not self._adopt(session, spec, self._speculation_result(spec), on_token):
+                    session.state = accept_follow_up(session.state, on_token)
+                self._persist(session)
+                return session.state
+        return self._single_flight(session, "follow_up", True, version, run)
+
+    async def aaccept_follow_up(self, session_id: str, on_token: Optional[Callable[[str], None]] = None,
+                                version: Optional[int] = None) -> Dict[str, Any]:
+        session = self.session(session_id)
+
+        async def run():
+            async with session.lock:
+                with span("follow_up", session_id=session_id), usage_scope(usage_of(session.state)), \
+                        self._turn_deadline(session) as deadline:
+                    spec = self._take_speculation(session)
+                    result = None
+                    if spec is not None:
+                        self._claim(session, spec, deadline)
+                        try:
+                            result = await asyncio.wrap_future(spec.future)
+                        except Exception:
+                            result = None
+                    if spec is None or not self._adopt(session, spec, result, on_token):
+                        session.state = await aaccept_follow_up(session.state, on_token)
+                    self._persist(session)
+                return session.state
+        return await self._asingle_flight(session, "follow_up", True, version, run)
+
+    def decline_follow_up(self, session_id: str, version: Optional[int] = None) -> Dict[str, Any]:
+        session = self.session(session_id)
+
+        def run():
+            with session.lock:
+                self._discard_speculation(session)
+                session.state = decline_follow_up(session.state)
+                self._persist(session)
+                return session.state
+        return self._single_flight(session, "follow_up", False, version, run)
+
+    async def adecline_follow_up(self, session_id: str, version: Optional[int] = None) -> Dict[str, Any]:
+        session = self.session(session_id)
+
+        async def run():
+            async with session.lock:
+                self._discard_speculation(session)
+                session.state = decline_follow_up(session.state)
+                self._persist(session)
+                return session.state
+        return await self._asingle_flight(session, "follow_up", False, version, run)
+
+
+_engine: Optional[ConversationEngine] = None
+_engine_lock = threading.Lock()
+
+def get_engine() -> ConversationEngine:
+    """Process-wide engine"""
+    global _engine
+    with _engine_lock:
+        if _engine is None:
+            _engine = ConversationEngine()
+        return _engine
@@ -1,16 +1,21 @@
 import os
-from typing import List, Dict, Any, Optional
+import re
+from typing import List, Dict, Any, Optional, Generator, Callable
 from enum import Enum
-from datetime import datetime
 
-from langchain_groq import ChatGroq
 from langchain_core.prompts import ChatPromptTemplate
-from langchain_core.messages import HumanMessage, SystemMessage
+from langchain_core.messages import BaseMessage, HumanMessage, SystemMessage
 
-# --- Model setup ---
-os.environ["GROQ_API_KEY"] = "API KEY"  # Replace with env variable in production
-MODEL = "llama3-70b-8192"
-flight_llm = ChatGroq(temperature=0, model_name=MODEL)
+from agents.streaming import BOOKING_COMPLETE, MarkerFilter
+from agents.flight_schedule import OFFER_LIMIT, PERIODS, Flight, FlightRequest, get_schedule
+from agents.history import HistoryBuffer, HistoryManager
+from agents.message import Message
+from agents.llm_pool import get_llm
+from agents.tracing import annotate, traced
+
+# --- History budget ---
+# Older turns beyond the budget are folded into a rolling summary
+history_manager = HistoryManager(token_budget=int(os.environ.get("FLIGHT_HISTORY_TOKEN_BUDGET", "3000")))
 
 # --- Agent states ---
 class AgentState(str, Enum):
@@ -20,32 +25,26 @@ class AgentState(str, Enum):
 # --- Conversation state management ---
 class ConversationState:
     def __init__(self):
-        self.messages: List[Dict[str, Any]] = []
+        self.messages: List[Message] = []
         self.current_agent: AgentState = AgentState.FLIGHT_AGENT
         self.booking_info: Dict[str, Any] = {
             "flight": {}
         }
+        self.history = HistoryBuffer()
 
     def add_message(self, role: str, content: str, agent: Optional[AgentState] = None):
-        self.messages.append({
-            "role": role,
-            "content": content,
-            "timestamp": datetime.now().isoformat(),
-            "agent": agent if agent else self.current_agent
-        })
+        self.messages.append(Message(agent if agent else self.current_agent, content, role))
 
     def get_conversation_history(self) -> str:
-        history = ""
-        for msg in self.messages:
-            agent_prefix = f"[{msg['agent']}] " if 'agent' in msg else ""
-            history += f"{agent_prefix}{msg['role']}: {msg['content']}\n\n"
-        return history
+        # Only messages added since the last turn are rendered
+        return history_manager.render(self.history, self.messages)
 
     def to_dict(self) -> Dict[str, Any]:
         return {
             "messages": self.messages,
             "current_agent": self.current_agent,
             "booking_info": self.booking_info,
+            "history_buffer": self.history,
             "user_input": ""
         }
 
@@ -55,6 +54,8 @@ class ConversationState:
         state.messages = state_dict.get("messages", [])
         state.current_agent = state_dict.get("current_agent", AgentState.FLIGHT_AGENT)
         state.booking_info = state_dict.get("booking_info", {"flight": {}})
+        if state_dict.get("history_buffer") is not None:
+            state.history = state_dict["history_buffer"]
         return state
 
 # --- Prompt template ---
@@ -73,75 +74,98 @@ and inform the user their flight has been booked successfully.
 
 IMPORTANT: When you have completed the booking, end your response with: "BOOKING_COMPLETE"
 
-Conversation history:
+{flight_options}Conversation history:
 {conversation_history}
 
 User: {user_input}
 Flight Agent:"""
 
-# --- LangGraph-compatible Flight Agent function ---
-# def flight_agent(state: Dict[str, Any]) -> Dict[str, Any]:
-#     state_obj = ConversationState.from_dict(state)
-#     user_input = state.get("user_input", "")
-
-#     prompt = ChatPromptTemplate.from_template(FLIGHT_AGENT_PROMPT)
-
-#     messages = [
-#         SystemMessage(content="You are a helpful Flight Booking Agent assistant."),
-#         HumanMessage(content=prompt.format(
-#             conversation_history=state_obj.get_conversation_history(),
-#             user_input=user_input
-#         ))
-#     ]
-
-#     response = flight_llm.invoke(messages)
-
-#     state_obj.add_message("user", user_input)
-#     agent_response = response.content
-#     state_obj.add_message("assistant", agent_response)
-
-#     if "BOOKING_COMPLETE" in agent_response:
-#         clean_response = agent_response.replace("BOOKING_COMPLETE", "").strip()
-#         state_obj.add_message("assistant", clean_response)
-#         state_obj.booking_info["flight"]["status"] = "booked"
-#         state_obj.booking_info["flight"]["details"] = "Flight booked based on user preferences"
-#         state_obj.current_agent = AgentState.END
-
-#     result = state_obj.to_dict()
-#     result["user_input"] = ""  # Clear input for next round
-#     return result
-
-def flight_agent(state: Dict[str, Any]) -> Dict[str, Any]:
-    state_obj = ConversationState.from_dict(state)
-    user_input = state.get("user_input", "")
-
+# --- Flight search tool ---
+# With a schedule configured (agents/flight_schedule.py), the route, date and time of day the
+# user gave are looked up before each reply, and the agent may only offer the flights found.
+
+# "6E 501" or "6E-501" as written by users, joined to match the schedule's "6E501"
+_FLIGHT_CODE_GAP = re.compile(r"\b([A-Z0-9]{2})[ -]+(\d{1,4})\b")
+
+
+class FlightSearch:
+    def __init__(self, request: FlightRequest, flights: List[Flight], cities: Dict[str, str]):
+        self.request = request
+        self.flights = flights
+        self.cities = cities
+
+    def prompt_section(self) -> str:
+        request = self.request
+        route = f"{request.origin} to {request.destination} on {request.date.isoformat()}"
+        if request.period:
+            route += f" ({request.period})"
+        if not self.flights:
+            return (f"Flight search: no flights found from {route}. Tell the user and suggest another date "
+                    f"or time of day. Never invent flights.\n\n")
+        offers = "\n".join(f"- {flight.describe(self.cities)}" for flight in self.flights)
+        return (f"Flight search results from {route}. Offer only these flights and never invent flight "
+                f"numbers, times or fares. Once the user picks one, you do not need to ask for a preferred time; "
+                f"mention its flight number when you confirm the booking.\n{offers}\n\n")
+
+    def chosen(self, texts: List[str]) -> Optional[Flight]:
+        """The offered flight named in the latest text that names one"""
+        # Without a carrier the code would be a bare number
+        patterns = [(re.compile(rf"\b{re.escape(flight.code)}\b"), flight)
+                    for flight in self.flights if flight.carrier and flight.number]
+        for text in reversed(texts):
+            normalised = _FLIGHT_CODE_GAP.sub(r"\1\2", text.upper())
+            for pattern, flight in patterns:
+                if pattern.search(normalised):
+                    return flight
+        return None
+
+
+@traced("search_flights", agent="flight")
+def _search_flights(state_obj: ConversationState, user_input: str) -> Optional[FlightSearch]:
+    schedule = get_schedule()
+    if schedule is None:
+        return None
+    texts = [msg.get("content", "") for msg in state_obj.messages if msg.get("role") == "user"] + [user_input]
+    request = schedule.request_from_text(texts)
+    if not request.searchable:
+        return None
+    earliest, latest = PERIODS.get(request.period, (0, 24 * 60))
+    flights = schedule.search(request.origin, request.destination, request.date, earliest, latest, OFFER_LIMIT)
+    annotate(flights_found=len(flights))
+    return FlightSearch(request, flights, schedule.cities)
+
+
+@traced("format_prompt")
+def _build_messages(state_obj: ConversationState, user_input: str,
+                    search: Optional[FlightSearch] = None) -> List[BaseMessage]:
     prompt = ChatPromptTemplate.from_template(FLIGHT_AGENT_PROMPT)
 
-    messages = [
+    return [
         SystemMessage(content="You are a helpful Flight Booking Agent assistant."),
         HumanMessage(content=prompt.format(
+            flight_options=search.prompt_section() if search else "",
             conversation_history=state_obj.get_conversation_history(),
             user_input=user_input
         ))
     ]
 
-    response = flight_llm.invoke(messages)
-
+def _record_turn(state_obj: ConversationState, user_input: str, agent_response: str,
+                 booking_complete: bool, search: Optional[FlightSearch] = None) -> Dict[str, Any]:
     # Add user message
     state_obj.add_message("user", user_input)
-    
-    # Process agent response
-    agent_response = response.content
-    
+
     # Check if booking is complete
-    if "BOOKING_COMPLETE" in agent_response:
-        # Clean the response by removing "BOOKING_COMPLETE"
-        clean_response = agent_response.replace("BOOKING_COMPLETE", "").strip()
+    if booking_complete:
         # Add only the cleaned response
-        state_obj.add_message("assistant", clean_response)
+        state_obj.add_message("assistant", agent_response)
         # Update booking info
         state_obj.booking_info["flight"]["status"] = "booked"
         state_obj.booking_info["flight"]["details"] = "Flight booked based on user preferences"
+        user_texts = [msg.get("content", "") for msg in state_obj.messages if msg.get("role") == "user"]
+        flight = search.chosen(user_texts + [agent_response]) if search else None
+        if flight is not None:
+            state_obj.booking_info["flight"]["details"] = flight.describe(search.cities)
+            state_obj.booking_info["flight"]["flight"] = flight.to_dict()
         state_obj.current_agent = AgentState.END
     else:
         # Add the response as-is if booking is not complete
@@ -149,4 +173,80 @@ def flight_agent(state: Dict[str, Any]) -> Dict[str, Any]:
 
     result = state_obj.to_dict()
     result["user_input"] = ""  # Clear input for next round
-    return result
\ No newline at end of file
+    return result
+
+def _record_reply(state_obj: ConversationState, user_input: str, agent_response: str,
+                  search: Optional[FlightSearch] = None) -> Dict[str, Any]:
+    # Check if booking is complete
+    booking_complete = BOOKING_COMPLETE in agent_response
+    if booking_complete:
+        # Clean the response by removing "BOOKING_COMPLETE"
+        agent_response = agent_response.replace(BOOKING_COMPLETE, "").strip()
+
+    return _record_turn(state_obj, user_input, agent_response, booking_complete, search)
+
+def _record_streamed_reply(state_obj: ConversationState, user_input: str, parts: List[str],
+                           markers: MarkerFilter, search: Optional[FlightSearch] = None) -> Dict[str, Any]:
+    booking_complete = BOOKING_COMPLETE in markers.found
+    agent_response = "".join(parts)
+    if booking_complete:
+        agent_response = agent_response.strip()
+
+    return _record_turn(state_obj, user_input, agent_response, booking_complete, search)
+
+@traced("flight_agent", agent="flight")
+def flight_agent(state: Dict[str, Any]) -> Dict[str, Any]:
+    state_obj = ConversationState.from_dict(state)
+    user_input = state.get("user_input", "")
+
+    search = _search_flights(state_obj, user_input)
+    response = get_llm("flight").invoke(_build_messages(state_obj, user_input, search))
+    return _record_reply(state_obj, user_input, response.content, search)
+
+@traced("flight_agent", agent="flight", streamed=True)
+def flight_agent_stream(state: Dict[str, Any]) -> Generator[str, None, Dict[str, Any]]:
+    """Streaming variant of flight_agent: yields reply tokens, returns the updated state"""
+    state_obj = ConversationState.from_dict(state)
+    user_input = state.get("user_input", "")
+
+    search = _search_flights(state_obj, user_input)
+    markers = MarkerFilter(BOOKING_COMPLETE)
+    parts: List[str] = []
+    for chunk in get_llm("flight").stream(_build_messages(state_obj, user_input, search)):
+        text = markers.feed(chunk.content)
+        if text:
+            parts.append(text)
+            yield text
+    tail = markers.flush()
+    if tail:
+        parts.append(tail)
+        yield tail
+
+    return _record_streamed_reply(state_obj, user_input, parts, markers, search)
+
+@traced("flight_agent", agent="flight")
+async def aflight_agent(state: Dict[str, Any],
+                        on_token: Optional[Callable[[str], None]] = None) -> Dict[str, Any]:
+    """Async counterpart of flight_agent; streams tokens to on_token when given"""
+    state_obj = ConversationState.from_dict(state)
+    user_input = state.get("user_input", "")
+    search = _search_flights(state_obj, user_input)
+    messages = _build_messages(state_obj, user_input, search)
+
+    if on_token is None:
+        response = await get_llm("flight").ainvoke(messages)
+        return _record_reply(state_obj, user_input, response.content, search)
+
+    markers = MarkerFilter(BOOKING_COMPLETE)
+    parts: List[str] = []
+    async for chunk in get_llm("flight").astream(messages):
+        text = markers.feed(chunk.content)
+        if text:
+            parts.append(text)
+            on_token(text)
+    tail = markers.flush()
+    if tail:
+        parts.append(tail)
+        on_token(tail)
+
+    return _record_streamed_reply(state_obj, user_input, parts, markers, search)
@@ -0,0 +1,357 @@
+# agents/flight_schedule.py
+import os
+import re
+import csv
+import threading
+from array import array
+from bisect import bisect_left
+from datetime import date, datetime, timedelta
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+# --- Schedule settings ---
+SCHEDULE_PATH = os.environ.get("FLIGHT_SCHEDULE_PATH", "")  # CSV or Parquet schedule; empty = no inventory
+HORIZON_DAYS = int(os.environ.get("FLIGHT_SCHEDULE_HORIZON_DAYS", "90"))  # recurring flights expanded this far ahead
+OFFER_LIMIT = int(os.environ.get("FLIGHT_OFFER_LIMIT", "5"))  # flights shown to the agent per search
+
+# Column names of common schedule dumps, mapped onto the ones used here
+COLUMN_ALIASES = {
+    "dep_airport": "origin", "departure_airport": "origin", "from": "origin",
+    "arr_airport": "destination", "arrival_airport": "destination", "to": "destination",
+    "dep_city": "origin_city", "arr_city": "destination_city",
+    "dep_time": "departure", "departure_time": "departure", "std": "departure",
+    "arr_time": "arrival", "arrival_time": "arrival", "sta": "arrival",
+    "flight_no": "flight_number", "flight": "flight_number", "airline": "carrier",
+    "days_of_operation": "days", "frequency": "days", "flight_date": "date",
+    "valid_from": "effective_from", "valid_to": "effective_to", "price": "fare",
+}
+
+# Departure windows (minutes after midnight) for the times of day users ask for
+PERIODS: Dict[str, Tuple[int, int]] = {
+    "early morning": (0, 8 * 60),
+    "morning": (5 * 60, 12 * 60),
+    "noon": (11 * 60, 14 * 60),
+    "afternoon": (12 * 60, 17 * 60),
+    "evening": (17 * 60, 21 * 60),
+    "night": (20 * 60, 24 * 60),
+}
+
+
+# --- Flights ---
+def _minutes(value: str) -> int:
+    """Minutes after midnight of "HH:MM", "HHMM" or an ISO datetime"""
+    value = value.strip()
+    if "T" in value or " " in value:
+        moment = datetime.fromisoformat(value)
+        return moment.hour * 60 + moment.minute
+    digits = value.replace(":", "")[:4].zfill(4)
+    return int(digits[:2]) * 60 + int(digits[2:])
+
+
+def _key(route: int, ordinal: int, minute: int) -> int:
+    return ((route << _DAY_BITS | ordinal - _EPOCH) << _MINUTE_BITS) | minute
+
+
+def _clock(minutes: int) -> str:
+    days, minutes = divmod(minutes, 24 * 60)
+    return f"{minutes // 60:02d}:{minutes % 60:02d}" + (f" (+{days})" if days else "")
+
+
+class Flight:
+    """One dated departure from the schedule"""
+
+    __slots__ = ("carrier", "number", "origin", "destination", "date", "departure", "arrival", "fare")
+
+    def __init__(self, carrier: str, number: str, origin: str, destination: str, day: date,
+                 departure: int, arrival: Optional[int], fare: Optional[str]):
+        self.carrier = carrier
+        self.number = number
+        self.origin = origin
+        self.destination = destination
+        self.date = day
+        self.departure = departure  # minutes after midnight
+        self.arrival = arrival  # minutes after midnight of the departure day; past 1440 the next day
+        self.fare = fare
+
+    @property
+    def code(self) -> str:
+        return f"{self.carrier}{self.number}"
+
+    def describe(self, cities: Optional[Dict[str, str]] = None) -> str:
+        cities = cities or {}
+        origin = f"{cities[self.origin]} ({self.origin})" if self.origin in cities else self.origin
+        destination = f"{cities[self.destination]} ({self.destination})" if self.destination in cities \
+            else self.destination
+        text = f"{self.code} {origin} {_clock(self.departure)}"
+        text += f" -> {destination} {_clock(self.arrival)}" if self.arrival is not None else f" -> {destination}"
+        text += f", {self.date.isoformat()}"
+        return text + (f", fare {self.fare}" if self.fare else "")
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "flight": self.code,
+            "origin": self.origin,
+            "destination": self.destination,
+            "date": self.date.isoformat(),
+            "departure": _clock(self.departure),
+            "arrival": _clock(self.arrival) if self.arrival is not None else None,
+            "fare": self.fare,
+        }
+
+
+# --- Schedule index ---
+# Each dated departure is one 64-bit key: route number, day and departure minute, most significant
+# first. Sorted, the keys are at once the (origin, destination, date) index and the departure-time
+# index: every route and day is a contiguous run, ordered by departure time within it.
+_MINUTE_BITS = 11  # minutes of the day, < 2048
+_DAY_BITS = 16  # days since _EPOCH
+_LEG_BITS = 32
+_EPOCH = date(2000, 1, 1).toordinal()
+
+
+class FlightSchedule:
+    """In-memory flight inventory indexed for route/date/time queries.
+
+    A search for a route, day and departure window is two bisections over the
+    sorted key array, so it takes a few microseconds whatever the schedule
+    size. Flights that repeat on several days share one leg record (carrier,
+    number, arrival, fare); each dated departure costs 12 bytes.
+    """
+
+    def __init__(self, rows: Iterable[Dict[str, Any]], today: Optional[date] = None,
+                 horizon_days: int = HORIZON_DAYS):
+        self.today = today or date.today()
+        self.horizon = self.today + timedelta(days=horizon_days)
+        self.cities: Dict[str, str] = {}  # airport code -> city name
+        self.airports: Set[str] = set()
+        self._routes: Dict[Tuple[str, str], int] = {}  # (origin, destination) -> route number
+        self._legs: List[Tuple[str, str, Optional[int], Optional[str]]] = []  # (carrier, number, arrival, fare)
+        packed: List[int] = []  # key << _LEG_BITS | leg, sorted below
+        for row in rows:
+            self._add(row, packed)
+        packed.sort()
+        mask = (1 << _LEG_BITS) - 1
+        self.keys = array("Q", [value >> _LEG_BITS for value in packed])
+        self.legs = array("I", [value & mask for value in packed])
+        self._codes = {city.lower(): code for code, city in self.cities.items()}
+        self._places = _place_pattern(self.cities)
+
+    def __len__(self) -> int:
+        return len(self.keys)
+
+    def _add(self, raw: Dict[str, Any], packed: List[int]):
+        row = {COLUMN_ALIASES.get(key.strip().lower(), key.strip().lower()): value
+               for key, value in raw.items() if key is not None and value not in (None, "")}
+        origin = str(row["origin"]).strip().upper()
+        destination = str(row["destination"]).strip().upper()
+        self.airports.update((origin, destination))
+        for code, city in ((origin, row.get("origin_city")), (destination, row.get("destination_city"))):
+            if city:
+                self.cities.setdefault(code, str(city).strip())
+        route = self._routes.setdefault((origin, destination), len(self._routes))
+        departure = _minutes(str(row["departure"]))
+        arrival = _minutes(str(row["arrival"])) if row.get("arrival") else None
+        if arrival is not None and arrival < departure:
+            arrival += 24 * 60
+        self._legs.append((str(row.get("carrier", "")).strip().upper(), str(row.get("flight_number", "")).strip(),
+                           arrival, str(row["fare"]).strip() if row.get("fare") else None))
+        leg = len(self._legs) - 1
+        packed.extend(_key(route, ordinal, departure) << _LEG_BITS | leg for ordinal in self._ordinals(row))
+
+    def _ordinals(self, row: Dict[str, Any]) -> Iterable[int]:
+        """Day ordinals a row departs on: its date, or every operating day in range for a recurring flight"""
+        if row.get("date"):
+            return [date.fromisoformat(str(row["date"])[:10]).toordinal()]
+        departure = str(row["departure"]).strip()
+        if "T" in departure or " " in departure:
+            return [datetime.fromisoformat(departure).date().toordinal()]
+        first = max(self.today, date.fromisoformat(str(row["effective_from"])[:10])) \
+            if row.get("effective_from") else self.today
+        last = min(self.horizon, date.fromisoformat(str(row["effective_to"])[:10])) \
+            if row.get("effective_to") else self.horizon
+        ordinals: List[int] = []
+        for weekday in {int(day) for day in str(row.get("days", "1234567")) if day in "1234567"}:  # 1 = Monday
+            start = first.toordinal() + (weekday - first.isoweekday()) % 7
+            ordinals.extend(range(start, last.toordinal() + 1, 7))
+        return ordinals
+
+    # --- queries ---
+    def _span(self, origin: str, destination: str, day: date, earliest: int, latest: int) -> Tuple[int, int]:
+        route = self._routes.get((origin.upper(), destination.upper()))
+        if route is None:
+            return 0, 0
+        ordinal = day.toordinal()
+        start = bisect_left(self.keys, _key(route, ordinal, max(earliest, 0)))
+        return start, bisect_left(self.keys, _key(route, ordinal, min(latest, 24 * 60)), start)
+
+    def search(self, origin: str, destination: str, day: date, earliest: int = 0, latest: int = 24 * 60,
+               limit: Optional[int] = None) -> List[Flight]:
+        """Flights on the route and day departing in [earliest, latest) minutes, by departure time"""
+        start, end = self._span(origin, destination, day, earliest, latest)
+        if limit is not None:
+            end = min(end, start + limit)
+        minute_mask = (1 << _MINUTE_BITS) - 1
+        flights = []
+        for position in range(start, end):
+            carrier, number, arrival, fare = self._legs[self.legs[position]]
+            flights.append(Flight(carrier, number, origin.upper(), destination.upper(), day,
+                                  self.keys[position] & minute_mask, arrival, fare))
+        return flights
+
+    def count(self, origin: str, destination: str, day: date, earliest: int = 0, latest: int = 24 * 60) -> int:
+        start, end = self._span(origin, destination, day, earliest, latest)
+        return end - start
+
+    def resolve(self, place: str) -> Optional[str]:
+        """Airport code of a code or city name the schedule knows"""
+        place = place.strip()
+        if place.upper() in self.airports:
+            return place.upper()
+        return self._codes.get(place.lower())
+
+    def request_from_text(self, texts: Iterable[str]) -> "FlightRequest":
+        """Route, date and time of day asked for over a conversation's user messages; later mentions win"""
+        request = FlightRequest()
+        for text in texts:
+            places = []
+            for match in self._places.finditer(text):
+                code = self.resolve(match.group(0))
+                if code is None:
+                    continue
+                before = _PRECEDING_RE.search(text, 0, match.start())
+                role = {"from": "origin", "to": "destination"}.get(before.group(1).lower()) if before else None
+                places.append((role, code))
+            _apply_places(request, places)
+            day = parse_date(text.lower(), self.today)
+            if day is not None:
+                request.date = day
+            for period in PERIODS:
+                if re.search(rf"\b{period}\b", text.lower()):
+                    request.period = period
+                    break
+        return request
+
+
+class FlightRequest:
+    """What a user asked for so far; any field may still be missing"""
+
+    __slots__ = ("origin", "destination", "date", "period")
+
+    def __init__(self):
+        self.origin: Optional[str] = None
+        self.destination: Optional[str] = None
+        self.date: Optional[date] = None
+        self.period: Optional[str] = None
+
+    @property
+    def searchable(self) -> bool:
+        return bool(self.origin and self.destination and self.date and self.origin != self.destination)
+
+
+def _apply_places(request: FlightRequest, places: List[Tuple[Optional[str], str]]):
+    if not places:
+        return
+    roles = [role for role, _ in places]
+    if len(places) >= 2 and not any(roles):
+        # "Pune to Goa" without "from": in the order given
+        request.origin, request.destination = places[0][1], places[1][1]
+        return
+    for role, code in places:
+        if role == "origin":
+            request.origin = code
+        elif role == "destination":
+            request.destination = code
+        elif request.origin is None:
+            request.origin = code
+        else:
+            request.destination = code
+
+
+_PRECEDING_RE = re.compile(r"\b(from|to)\s+$", re.I)
+
+
+def _place_pattern(cities: Dict[str, str]) -> "re.Pattern":
+    names = sorted(set(cities.values()), key=len, reverse=True)
+    city_alternatives = "|".join(re.escape(name) for name in names) or "(?!)"
+    # City names in any case; airport codes only as written in capitals
+    return re.compile(rf"(?i:\b(?:{city_alternatives})\b)|\b[A-Z]{{3}}\b")
+
+
+# --- Date parsing ---
+_MONTHS = ["jan", "feb", "mar", "apr", "may", "jun", "jul", "aug", "sep", "oct", "nov", "dec"]
+_DAYS = ["monday", "tuesday", "wednesday", "thursday", "friday", "saturday", "sunday"]
+_ISO_RE = re.compile(r"\b(\d{4})-(\d{2})-(\d{2})\b")
+_DAY_MONTH_RE = re.compile(r"\b(\d{1,2})(?:st|nd|rd|th)?\s+(?:of\s+)?(jan|feb|mar|apr|may|jun|jul|aug|sep|oct|nov|dec)[a-z]*\b")
+_MONTH_DAY_RE = re.compile(r"\b(jan|feb|mar|apr|may|jun|jul|aug|sep|oct|nov|dec)[a-z]*\s+(\d{1,2})(?:st|nd|rd|th)?\b")
+_SLASH_RE = re.compile(r"\b(\d{1,2})/(\d{1,2})(?:/(\d{2,4}))?\b")  # day/month, as written in India
+_WEEKDAY_RE = re.compile(rf"\b({'|'.join(_DAYS)})\b")
+
+
+def _upcoming(month: int, day: int, today: date) -> Optional[date]:
+    try:
+        candidate = date(today.year, month, day)
+        return candidate if candidate >= today else date(today.year + 1, month, day)
+    except ValueError:
+        return None
+
+
+def parse_date(text: str, today: date) -> Optional[date]:
+    """The travel date in lower-case text, or None; dates without a year are the next such date"""
+    found: List[Tuple[int, Optional[date]]] = []  # (position, date); the last mention wins
+    for match in _ISO_RE.finditer(text):
+        try:
+            found.append((match.start(), date(*map(int, match.groups()))))
+        except ValueError:
+            pass
+    for match in _DAY_MONTH_RE.finditer(text):
+        found.append((match.start(), _upcoming(_MONTHS.index(match.group(2)) + 1, int(match.group(1)), today)))
+    for match in _MONTH_DAY_RE.finditer(text):
+        found.append((match.start(), _upcoming(_MONTHS.index(match.group(1)) + 1, int(match.group(2)), today)))
+    for match in _SLASH_RE.finditer(text):
+        day, month, year = match.groups()
+        if year:
+            try:
+                found.append((match.start(), date(int(year) + (2000 if len(year) == 2 else 0), int(month), int(day))))
+            except ValueError:
+                pass
+        else:
+            found.append((match.start(), _upcoming(int(month), int(day), today)))
+    for word, offset in (("today", 0), ("(?<!after )tomorrow", 1), ("day after tomorrow", 2)):
+        for match in re.finditer(rf"\b{word}\b", text):
+            found.append((match.start(), today + timedelta(days=offset)))
+    for match in _WEEKDAY_RE.finditer(text):
+        ahead = (_DAYS.index(match.group(1)) - today.weekday()) % 7 or 7  # the coming one, never today
+        found.append((match.start(), today + timedelta(days=ahead)))
+    found = [(position, day) for position, day in found if day is not None]
+    return max(found, key=lambda item: item[0])[1] if found else None
+
+
+# --- Loading ---
+def _read_rows(path: str) -> Iterator[Dict[str, Any]]:
+    if path.endswith(".parquet"):
+        try:
+            import pyarrow.parquet as pq
+        except ImportError as e:
+            raise ImportError("Reading a Parquet flight schedule needs pyarrow: pip install pyarrow") from e
+        for batch in pq.ParquetFile(path).iter_batches():
+            yield from batch.to_pylist()
+        return
+    with open(path, newline="", encoding="utf-8") as f:
+        yield from csv.DictReader(f)
+
+
+def load_schedule(path: str, today: Optional[date] = None, horizon_days: int = HORIZON_DAYS) -> FlightSchedule:
+    return FlightSchedule(_read_rows(path), today, horizon_days)
+
+
+_schedule: Optional[FlightSchedule] = None
+_schedule_lock = threading.Lock()
+
+def get_schedule() -> Optional[FlightSchedule]:
+    """The schedule at FLIGHT_SCHEDULE_PATH, loaded on first use; None when no schedule is configured"""
+    global _schedule
+    if not SCHEDULE_PATH:
+        return None
+    with _schedule_lock:
+        if _schedule is None:
+            _schedule = load_schedule(SCHEDULE_PATH)
+        return _schedule
@@ -0,0 +1,211 @@
+# agents/history.py
+import re
+from bisect import bisect_left
+from functools import lru_cache
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+# --- Token counting ---
+_WORD_RE = re.compile(r"\w+|[^\w\s]")
+_SENTENCE_RE = re.compile(r"(.+?[.!?])(\s|$)", re.S)
+
+
+@lru_cache(maxsize=1)
+def _encoding():
+    try:
+        import tiktoken
+        return tiktoken.get_encoding("cl100k_base")
+    except Exception:  # tiktoken not installed, or its vocabulary is unavailable offline
+        return None
+
+
+def count_tokens(text: str) -> int:
+    """Count tokens locally; tiktoken when available, otherwise a word/punctuation estimate"""
+    encoding = _encoding()
+    if encoding is not None:
+        return len(encoding.encode(text))
+    return len(_WORD_RE.findall(text))
+
+
+# --- Incremental history rendering ---
+def _message_key(msg: Dict[str, Any]) -> Tuple[Any, Any, Any]:
+    return msg.get("agent"), msg.get("role"), msg.get("content")
+
+
+def render_message(msg: Dict[str, Any]) -> str:
+    agent_prefix = f"[{msg['agent']}] " if 'agent' in msg else ""
+    return f"{agent_prefix}{msg['role']}: {msg['content']}\n\n"
+
+
+class HistoryBuffer:
+    """Prompt history that is rendered once per message and reused across turns.
+
+    Agents rebuild their message list every turn, so the buffer is re-synced
+    against it: as long as the list still starts with the messages rendered
+    last time, only the new tail is formatted and appended. Transcripts only
+    grow, so that is checked in constant time: the list must be at least as
+    long, and its first and last rendered positions must hold the same agent,
+    role and content as before (the first one is an agent's system context,
+    which changes as the supervisor speaks). Anything else triggers a full
+    rebuild.
+    """
+
+    def __init__(self, render: Callable[[Dict[str, Any]], str] = render_message):
+        self.render = render
+        self._text = ""
+        self._offsets: List[int] = []  # start offset of each rendered message in _text
+        # (agent, role, content) of the first and last rendered messages
+        self._ends: Optional[Tuple[Tuple[Any, Any, Any], Tuple[Any, Any, Any]]] = None
+        self._token_totals: List[int] = [0]  # tokens in the first i rendered messages
+        # Rolling summary of the first `summarized` messages, maintained by HistoryManager
+        self.summary = ""
+        self.summarized = 0
+        # Tighter per-conversation cap (e.g. once a session is over its token budget); None keeps the agent's
+        self.token_budget: Optional[int] = None
+
+    def __len__(self) -> int:
+        return len(self._offsets)
+
+    def segment(self, index: int) -> str:
+        start = self._offsets[index]
+        end = self._offsets[index + 1] if index + 1 < len(self._offsets) else len(self._text)
+        return self._text[start:end]
+
+    def text_from(self, index: int) -> str:
+        return self._text[self._offsets[index]:] if index < len(self._offsets) else ""
+
+    def tokens(self, start: int = 0, end: Optional[int] = None) -> int:
+        end = len(self._offsets) if end is None else end
+        return self._token_totals[end] - self._token_totals[start]
+
+    def window_start(self, token_budget: int) -> int:
+        """First message index from which the rest of the history fits into token_budget"""
+        return bisect_left(self._token_totals, self._token_totals[-1] - token_budget)
+
+    def reset(self):
+        self._text = ""
+        self._offsets = []
+        self._ends = None
+        self._token_totals = [0]
+        self.summary = ""
+        self.summarized = 0
+
+    def _is_prefix_of(self, messages: Sequence[Dict[str, Any]]) -> bool:
+        rendered = len(self._offsets)
+        if rendered == 0:
+            return True
+        if rendered > len(messages):
+            return False
+        return self._ends == (_message_key(messages[0]), _message_key(messages[rendered - 1]))
+
+    def sync(self, messages: Sequence[Dict[str, Any]]) -> str:
+        """Render any messages not seen yet and return the full history"""
+        if not self._is_prefix_of(messages):
+            self.reset()
+        rendered = len(self._offsets)
+        if rendered < len(messages):
+            new_segments = []
+            offset = len(self._text)
+            for msg in messages[rendered:]:
+                segment = self.render(msg)
+                self._offsets.append(offset)
+                self._token_totals.append(self._token_totals[-1] + count_tokens(segment))
+                offset += len(segment)
+                new_segments.append(segment)
+            # Detach the string first so CPython can grow it in place instead of copying
+            text, self._text = self._text, ""
+            text += "".join(new_segments)
+            self._text = text
+            self._ends = (_message_key(messages[0]), _message_key(messages[-1]))
+        return self._text
+
+    @property
+    def text(self) -> str:
+        return self._text
+
+
+# --- Summarisers ---
+Summarizer = Callable[[str, List[str], int], str]
+
+
+def extractive_summary(previous: str, segments: List[str], token_budget: int) -> str:
+    """Fold segments into the summary as one line each (their first sentence), no LLM call"""
+    lines = previous.splitlines() if previous else []
+    for segment in segments:
+        text = " ".join(segment.split())
+        match = _SENTENCE_RE.match(text)
+        sentence = match.group(1) if match else text
+        lines.append(f"- {sentence[:200]}")
+    # Oldest lines go first once the summary itself outgrows its budget
+    while len(lines) > 1 and count_tokens("\n".join(lines)) > token_budget:
+        lines.pop(0)
+    return "\n".join(lines)
+
+
+SUMMARY_PROMPT = """Update the running summary of a travel booking conversation.
+Keep every booking detail (cities, airports, dates, times, passengers, class, cab type, special requests)
+and drop small talk. Use at most {token_budget} tokens.
+
+Current summary:
+{summary}
+
+New conversation turns:
+{turns}
+
+Updated summary:"""
+
+
+def llm_summarizer(llm: Any) -> Summarizer:
+    """Summariser that asks an LLM to fold turns into the summary (one extra call per fold)"""
+    from langchain_core.messages import HumanMessage, SystemMessage
+
+    def summarize(previous: str, segments: List[str], token_budget: int) -> str:
+        response = llm.invoke([
+            SystemMessage(content="You summarise conversations for a travel booking assistant."),
+            HumanMessage(content=SUMMARY_PROMPT.format(
+                token_budget=token_budget,
+                summary=previous or "(none)",
+                turns="".join(segments)
+            ))
+        ])
+        return response.content.strip()
+    return summarize
+
+
+# --- Token-budgeted history ---
+class HistoryManager:
+    """Caps the prompt history of an agent at token_budget tokens.
+
+    The most recent messages are kept verbatim; older ones are folded into a
+    rolling summary that is cached on the HistoryBuffer, so each message is
+    summarised at most once. Folding goes down to a low-water mark rather than
+    the exact budget so that it happens in batches, not on every turn.
+    """
+
+    def __init__(self, token_budget: int, keep_recent: int = 4, summary_budget: Optional[int] = None,
+                 summarizer: Summarizer = extractive_summary, low_water: float = 0.75):
+        self.token_budget = token_budget
+        self.keep_recent = keep_recent
+        self.summary_budget = summary_budget if summary_budget is not None else token_budget // 5
+        self.summarizer = summarizer
+        self.low_water = low_water
+
+    def render(self, buffer: HistoryBuffer, messages: Sequence[Dict[str, Any]]) -> str:
+        history = buffer.sync(messages)
+        token_budget = self.token_budget
+        if getattr(buffer, "token_budget", None):
+            token_budget = min(token_budget, buffer.token_budget)
+        summary_tokens = count_tokens(buffer.summary) if buffer.summary else 0
+        if buffer.tokens(buffer.summarized) + summary_tokens <= token_budget:
+            return history if buffer.summarized == 0 else self._with_summary(buffer)
+
+        target = int(token_budget * self.low_water) - self.summary_budget
+        start = min(buffer.window_start(max(target, 0)), len(buffer) - self.keep_recent)
+        if start > buffer.summarized:
+            folded = [buffer.segment(i) for i in range(buffer.summarized, start)]
+            buffer.summary = self.summarizer(buffer.summary, folded, self.summary_budget)
+            buffer.summarized = start
+        return self._with_summary(buffer)
+
+    @staticmethod
+    def _with_summary(buffer: HistoryBuffer) -> str:
+        return f"Summary of earlier conversation:\n{buffer.summary}\n\n{buffer.text_from(buffer.summarized)}"
@@ -0,0 +1,217 @@
+# agents/intent_router.py
+import os
+import re
+import math
+import threading
+from collections import Counter
+from typing import Dict, List, NamedTuple, Optional, Sequence
+
+# --- Router settings ---
+THRESHOLD = float(os.environ.get("INTENT_ROUTER_THRESHOLD", "0.85"))  # below this the supervisor LLM decides
+
+# Keyword phrases per intent; matched on word boundaries, so "ride" never fires inside "override"
+INTENT_KEYWORDS: Dict[str, Sequence[str]] = {
+    "flight": ("flight", "flights", "book a flight", "fly", "flying", "plane", "air ticket", "air tickets",
+               "airline", "airfare", "boarding pass"),
+    "cab": ("cab", "cabs", "taxi", "taxis", "ride", "airport drop", "airport pickup", "uber", "lyft",
+            "chauffeur", "car service"),
+}
+STOP_KEYWORDS: Sequence[str] = ("stop",)
+# A stop keyword is only a command when a sentence is an imperative built around it ("stop", "please stop
+# the booking", "ok, stop it"); "a flight with one stop" or "non-stop to Goa" keep the booking going
+STOP_LEADS: Sequence[str] = ("please", "ok", "okay", "just", "now", "wait", "actually", "can you", "could you",
+                             "i want to", "i'd like to", "let's")
+STOP_OBJECTS: Sequence[str] = ("it", "this", "that", "the", "my", "booking", "bookings", "process", "everything",
+                               "all", "now", "please", "here", "flight", "cab")
+# A service keyword only counts as asked for when one of these leads up to it, a few words before
+REQUEST_PHRASES: Sequence[str] = ("book", "booking", "need", "want", "get", "arrange", "reserve", "find", "order",
+                                  "call", "like", "require", "looking for", "both", "also")
+# ...or when it is joined to a service asked for just before ("a flight to Goa and a cab")
+JOINING_PHRASES: Sequence[str] = ("and", "plus", "with", "then", "as well as")
+# A possessive in between means an existing booking is being talked about ("I need to know when my flight lands")
+POSSESSIVES: Sequence[str] = ("my", "our", "your", "his", "her", "their")
+REQUEST_GAP = 3  # words allowed between a request phrase and the keyword
+
+# Seed utterances for the local classifier; "other" covers everything the router should not decide
+TRAINING_EXAMPLES: Dict[str, Sequence[str]] = {
+    "flight": (
+        "book a flight", "i want to book a flight", "i need a flight to delhi", "flights from mumbai to goa",
+        "can you get me a plane ticket", "i want to fly to london next week", "book an air ticket for two",
+        "find me a flight tomorrow morning", "i need to fly out on friday", "yes book flight",
+        "economy class flight for 3 passengers", "which airline flies to new york", "book flight",
+        "i'd like to fly business class", "get me on a plane to bangalore",
+    ),
+    "cab": (
+        "book a cab", "i need a taxi", "get me a cab to the airport", "book a ride to the station",
+        "i need an airport drop", "call an uber for me", "book a taxi from my hotel", "yes book cab",
+        "i need a ride tomorrow at 6am", "airport pickup for 2 people", "book cab",
+        "suv cab to the city centre", "can you arrange a car service", "i want a lyft to downtown",
+        "taxi from the airport to my home",
+    ),
+    "other": (
+        "hello", "hi there", "what can you do", "thanks", "thank you very much", "how are you",
+        "what is the weather like", "tell me a joke", "override the settings", "who are you",
+        "i have a question", "help", "what time is it", "ok", "sounds good",
+        "i need to plan my trip", "what are my options", "can you help me travel",
+    ),
+}
+
+_TOKEN_RE = re.compile(r"[a-z0-9']+")
+
+
+def _phrase_pattern(phrases: Sequence[str]) -> str:
+    # Longest phrases first so "book a flight" wins over "flight"
+    alternation = "|".join(re.escape(phrase) for phrase in sorted(phrases, key=len, reverse=True))
+    return rf"\b(?:{alternation})\b"
+
+
+def _command_pattern(commands: Sequence[str], leads: Sequence[str], objects: Sequence[str]) -> str:
+    """A whole sentence of commands, optionally after leads and followed by objects"""
+    lead, command, obj = (_phrase_pattern(phrases) for phrases in (leads, commands, objects))
+    return rf"(?:^|[.!?;])\s*(?:{lead}[\s,]*)*{command}(?!-)(?:[\s,]+{obj})*[\s,]*(?:[.!?;]|$)"
+
+
+def _leading_pattern(phrases: Sequence[str], gap: int) -> str:
+    """One of phrases, then at most gap words (no possessives, no punctuation), at the end of the text"""
+    possessive = "|".join(map(re.escape, POSSESSIVES))
+    return rf"{_phrase_pattern(phrases)}(?:\s+(?!(?:{possessive})\b)[\w'-]+){{0,{gap}}}\s*$"
+
+
+class Intent(NamedTuple):
+    label: str  # "flight", "cab", "stop" or "other"
+    confidence: float
+    keywords: List[str]  # keyword phrases found in the text
+
+
+# --- Local statistical classifier ---
+class NaiveBayesIntentClassifier:
+    """Multinomial naive Bayes over words plus keyword-hit features, trained on a few seed utterances"""
+
+    def __init__(self, examples: Dict[str, Sequence[Sequence[str]]], alpha: float = 1.0):
+        self.alpha = alpha
+        self.labels = list(examples)
+        self.counts: Dict[str, Counter] = {label: Counter() for label in self.labels}
+        for label, documents in examples.items():
+            for features in documents:
+                self.counts[label].update(features)
+        self.vocabulary = set().union(*self.counts.values())
+        self.totals = {label: sum(counts.values()) for label, counts in self.counts.items()}
+        documents = sum(len(docs) for docs in examples.values())
+        self.log_priors = {label: math.log(len(examples[label]) / documents) for label in self.labels}
+
+    def predict_proba(self, features: Sequence[str]) -> Dict[str, float]:
+        size = len(self.vocabulary)
+        scores = {}
+        for label in self.labels:
+            denominator = math.log(self.totals[label] + self.alpha * size)
+            score = self.log_priors[label]
+            for feature in features:
+                if feature in self.vocabulary:  # unseen words carry no evidence either way
+                    score += math.log(self.counts[label][feature] + self.alpha) - denominator
+            scores[label] = score
+        top = max(scores.values())
+        exp_scores = {label: math.exp(score - top) for label, score in scores.items()}
+        norm = sum(exp_scores.values())
+        return {label: value / norm for label, value in exp_scores.items()}
+
+
+# --- Compiled router ---
+class IntentRouter:
+    """Decides flight vs cab from the user's text without an LLM call when it can.
+
+    All keyword phrases are compiled into one word-boundary regex, so a message is
+    scanned once regardless of the number of keywords. The hits and the words
+    feed a small naive Bayes classifier whose posterior is the confidence;
+    callers fall back to the supervisor LLM below `threshold`.
+    """
+
+    def __init__(self, keywords: Dict[str, Sequence[str]] = INTENT_KEYWORDS,
+                 examples: Dict[str, Sequence[str]] = TRAINING_EXAMPLES,
+                 stop_keywords: Sequence[str] = STOP_KEYWORDS, threshold: float = THRESHOLD):
+        self.threshold = threshold
+        self._intent_of = {phrase: intent for intent, phrases in keywords.items() for phrase in phrases}
+        self._keyword_re = re.compile(_phrase_pattern(list(self._intent_of)))
+        self._stop_re = re.compile(_command_pattern(stop_keywords, STOP_LEADS, STOP_OBJECTS))
+        self._request_re = re.compile(_leading_pattern(REQUEST_PHRASES, REQUEST_GAP))
+        self._request_start_re = re.compile(_phrase_pattern(REQUEST_PHRASES))
+        self._joined_re = re.compile(_leading_pattern(JOINING_PHRASES, REQUEST_GAP))
+        self.classifier = NaiveBayesIntentClassifier(
+            {label: [self._features(text.lower())[0] for text in texts] for label, texts in examples.items()}
+        )
+        self.local_routes = 0
+        self.llm_fallbacks = 0
+        self._lock = threading.Lock()
+
+    def _features(self, lowered: str):
+        hits = self._keyword_re.findall(lowered)
+        features = _TOKEN_RE.findall(lowered) + [f"kw:{self._intent_of[hit]}" for hit in hits]
+        return features, hits
+
+    def wants_stop(self, text: str) -> bool:
+        """Whether the text is a command to stop ("please stop", not "a flight with one stop")"""
+        return self._stop_re.search(text.lower()) is not None
+
+    def classify(self, text: str) -> Intent:
+        lowered = text.lower()
+        if self._stop_re.search(lowered):
+            return Intent("stop", 1.0, [])
+        features, hits = self._features(lowered)
+        probabilities = self.classifier.predict_proba(features)
+        label = max(probabilities, key=probabilities.get)
+        return Intent(label, probabilities[label], hits)
+
+    def services(self, text: str) -> List[str]:
+        """Every service the text asks for, in order of first mention. More than one means the
+        user asked for a combined booking ("a flight and a cab").
+
+        A keyword only counts when a request ("book", "I need", "I'd like") leads up to it, or it
+        is joined to a service asked for just before it, so "my flight lands at 6, I need a cab"
+        asks for a cab only.
+        """
+        lowered = text.lower()
+        found: List[str] = []
+        start = 0
+        requested = False  # whether the previous keyword was asked for
+        for hit in self._keyword_re.finditer(lowered):
+            before = lowered[start:hit.start()]
+            start = hit.end()
+            requested = bool(self._request_start_re.match(hit.group()) or self._request_re.search(before)
+                             or (requested and self._joined_re.search(before)))
+            service = self._intent_of[hit.group()]
+            if requested and service not in found:
+                found.append(service)
+        return found
+
+    def route(self, text: str) -> Optional[str]:
+        """"flight", "cab" or "stop" when confident enough to skip the LLM, otherwise None"""
+        intent = self.classify(text)
+        # A service is only picked locally if one of its keywords actually occurs
+        confident = intent.confidence >= self.threshold and (
+            intent.label == "stop" or any(self._intent_of[hit] == intent.label for hit in intent.keywords)
+        )
+        with self._lock:
+            if confident:
+                self.local_routes += 1
+            else:
+                self.llm_fallbacks += 1
+        return intent.label if confident else None
+
+    def stats(self) -> Dict[str, float]:
+        decisions = self.local_routes + self.llm_fallbacks
+        return {
+            "local_routes": self.local_routes,
+            "llm_fallbacks": self.llm_fallbacks,
+            "local_rate": self.local_routes / decisions if decisions else 0.0,
+        }
+
+
+_router: Optional[IntentRouter] = None
+_router_lock = threading.Lock()
+
+def get_router() -> IntentRouter:
+    """Process-wide router, compiled and trained on first use"""
+    global _router
+    with _router_lock:
+        if _router is None:
+            _router = IntentRouter()
+        return _router
@@ -0,0 +1,231 @@
+# agents/llm_cache.py
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional, Tuple
+
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage
+
+from agents.resilience import from_fallback
+from agents.tracing import prompt_size, span
+from agents.usage import CallMeter
+
+# --- Cache settings ---
+CACHE_SIZE = int(os.environ.get("LLM_CACHE_SIZE", "1024"))
+CACHE_TTL = float(os.environ.get("LLM_CACHE_TTL", str(24 * 60 * 60)))  # seconds
+CACHE_PATH = os.environ.get("LLM_CACHE_PATH", ".llm_cache.sqlite")  # "" keeps the cache in memory only
+
+
+# --- Two-tier response cache ---
+class LLMResponseCache:
+    """Bounded in-memory LRU in front of an optional SQLite table, with a shared TTL"""
+
+    def __init__(self, max_entries: int = CACHE_SIZE, ttl: float = CACHE_TTL,
+                 path: Optional[str] = CACHE_PATH):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[str, Tuple[float, str]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._db: Optional[sqlite3.Connection] = None
+        if path:
+            self._db = sqlite3.connect(path, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS llm_cache ("
+                "key TEXT PRIMARY KEY, content TEXT NOT NULL, created REAL NOT NULL)"
+            )
+            self._db.commit()
+
+    @staticmethod
+    def make_key(model: str, temperature: float, messages: List[BaseMessage]) -> str:
+        rendered = json.dumps([[msg.type, msg.content] for msg in messages], ensure_ascii=False)
+        digest = hashlib.sha256(rendered.encode("utf-8")).hexdigest()
+        return f"{model}:{temperature}:{digest}"
+
+    def _fresh(self, created: float) -> bool:
+        return self.ttl <= 0 or time.time() - created < self.ttl
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if self._fresh(entry[0]):
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return entry[1]
+                del self._entries[key]
+
+            if self._db is not None:
+                row = self._db.execute(
+                    "SELECT content, created FROM llm_cache WHERE key = ?", (key,)
+                ).fetchone()
+                if row is not None:
+                    content, created = row
+                    if self._fresh(created):
+                        self._remember(key, created, content)
+                        self.hits += 1
+                        self.disk_hits += 1
+                        return content
+                    self._db.execute("DELETE FROM llm_cache WHERE key = ?", (key,))
+                    self._db.commit()
+
+            self.misses += 1
+            return None
+
+    def put(self, key: str, content: str):
+        created = time.time()
+        with self._lock:
+            self._remember(key, created, content)
+            if self._db is not None:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO llm_cache (key, content, created) VALUES (?, ?, ?)",
+                    (key, content, created)
+                )
+                self._db.commit()
+
+    def _remember(self, key: str, created: float, content: str):
+        self._entries[key] = (created, content)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            if self._db is not None:
+                self._db.execute("DELETE FROM llm_cache")
+                self._db.commit()
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "entries": len(self._entries),
+        }
+
+
+_response_cache: Optional[LLMResponseCache] = None
+_response_cache_lock = threading.Lock()
+
+def get_response_cache() -> LLMResponseCache:
+    """Process-wide cache shared by every agent"""
+    global _response_cache
+    with _response_cache_lock:
+        if _response_cache is None:
+            _response_cache = LLMResponseCache()
+        return _response_cache
+
+
+# --- Chat model wrapper ---
+class CachedChatModel:
+    """Serves repeated prompts of a deterministic (temperature=0) chat model from the cache.
+
+    Exposes the invoke/ainvoke/stream/astream subset of the LangChain chat model
+    interface used by the agents; anything else is delegated to the wrapped model.
+    """
+
+    def __init__(self, llm: Any, cache: Optional[LLMResponseCache] = None, agent: str = "unknown"):
+        self.llm = llm
+        self.cache = cache or get_response_cache()
+        self.agent = agent  # usage of every call is accounted to this agent (agents/usage.py)
+        self.model = getattr(llm, "model_name", type(llm).__name__)
+        self.temperature = getattr(llm, "temperature", None)
+        # Sampled replies differ between calls, so only temperature 0 is cached
+        self.enabled = self.temperature == 0
+
+    def __getattr__(self, name: str) -> Any:
+        if name == "llm":
+            raise AttributeError(name)
+        return getattr(self.llm, name)
+
+    def _key(self, messages: List[BaseMessage]) -> str:
+        return self.cache.make_key(self.model, self.temperature, messages)
+
+    def _span(self, call: str, messages: List[BaseMessage]):
+        """Tracing span of one LLM call; cache hits end with the outcome cache_hit"""
+        return span("llm", model=self.model, call=call, prompt_chars=prompt_size(messages))
+
+    @staticmethod
+    def _hit(trace_span, meter: CallMeter, content: str):
+        if trace_span:
+            trace_span.outcome = "cache_hit"
+        meter.done(content, cached=True)
+
+    def invoke(self, messages: List[BaseMessage], **kwargs) -> BaseMessage:
+        with self._span("invoke", messages) as trace_span:
+            meter = CallMeter(self.agent, messages)
+            key = self._key(messages) if self.enabled else None
+            content = self.cache.get(key) if key else None
+            if content is not None:
+                self._hit(trace_span, meter, content)
+                return AIMessage(content=content)
+            response = self.llm.invoke(messages, **kwargs)
+            meter.done(response.content, getattr(response, "usage_metadata", None))
+            # A reply of the fallback model is not what the primary would say, so it is not cached
+            if key and not from_fallback(response):
+                self.cache.put(key, response.content)
+            return response
+
+    async def ainvoke(self, messages: List[BaseMessage], **kwargs) -> BaseMessage:
+        with self._span("ainvoke", messages) as trace_span:
+            meter = CallMeter(self.agent, messages)
+            key = self._key(messages) if self.enabled else None
+            content = self.cache.get(key) if key else None
+            if content is not None:
+                self._hit(trace_span, meter, content)
+                return AIMessage(content=content)
+            response = await self.llm.ainvoke(messages, **kwargs)
+            meter.done(response.content, getattr(response, "usage_metadata", None))
+            if key and not from_fallback(response):
+                self.cache.put(key, response.content)
+            return response
+
+    def stream(self, messages: List[BaseMessage], **kwargs) -> Iterator[AIMessageChunk]:
+        with self._span("stream", messages) as trace_span:
+            meter = CallMeter(self.agent, messages)
+            key = self._key(messages) if self.enabled else None
+            content = self.cache.get(key) if key else None
+            if content is not None:
+                self._hit(trace_span, meter, content)
+                yield AIMessageChunk(content=content)
+                return
+            parts: List[str] = []
+            fallback = False
+            for chunk in self.llm.stream(messages, **kwargs):
+                meter.chunk(chunk)
+                parts.append(chunk.content)
+                fallback = fallback or from_fallback(chunk)
+                yield chunk
+            # Only complete replies are cached and metered; an abandoned stream never gets here
+            meter.done("".join(parts))
+            if key and not fallback:
+                self.cache.put(key, "".join(parts))
+
+    async def astream(self, messages: List[BaseMessage], **kwargs) -> AsyncIterator[AIMessageChunk]:
+        with self._span("astream", messages) as trace_span:
+            meter = CallMeter(self.agent, messages)
+            key = self._key(messages) if self.enabled else None
+            content = self.cache.get(key) if key else None
+            if content is not None:
+                self._hit(trace_span, meter, content)
+                yield AIMessageChunk(content=content)
+                return
+            parts: List[str] = []
+            fallback = False
+            async for chunk in self.llm.astream(messages, **kwargs):
+                meter.chunk(chunk)
+                parts.append(chunk.content)
+                fallback = fallback or from_fallback(chunk)
+                yield chunk
+            meter.done("".join(parts))
+            if key and not fallback:
+                self.cache.put(key, "".join(parts))
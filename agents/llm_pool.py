@@ -0,0 +1,97 @@
+# agents/llm_pool.py
+import os
+import logging
+import threading
+from typing import Any, Dict, Tuple
+
+from langchain_core.messages import HumanMessage
+
+from agents.backends import get_backend
+from agents.llm_cache import CachedChatModel
+from agents.resilience import FALLBACK_MODEL, ResilientChatModel
+from agents.scheduler import ScheduledChatModel, get_scheduler
+
+logger = logging.getLogger(__name__)
+
+# --- Pool settings ---
+MODEL = os.environ.get("GROQ_MODEL", "llama3-70b-8192")
+
+# Sampling settings of each agent
+ROLES: Dict[str, Dict[str, Any]] = {
+    "flight": {"temperature": 0},
+    "cab": {"temperature": 0},
+    "supervisor": {"temperature": 0.3},
+}
+
+_lock = threading.Lock()
+_models: Dict[Tuple[str, float], Any] = {}  # one resilient backend chat model per (model, temperature)
+_clients: Dict[str, CachedChatModel] = {}  # per-role wrappers around the shared models
+
+
+# --- Client registry ---
+def get_llm(role: str) -> CachedChatModel:
+    """Chat model for an agent role, created on first use and shared afterwards.
+
+    Roles with the same model and temperature share one backend client; each
+    role gets its own thin wrapper so token usage is accounted per agent.
+    """
+    client = _clients.get(role)
+    if client is not None:
+        return client
+
+    settings = ROLES[role]
+    key = (settings.get("model", MODEL), settings["temperature"])
+    with _lock:
+        if role not in _clients:
+            if key not in _models:
+                _models[key] = _create_model(*key)
+            _clients[role] = CachedChatModel(_models[key], agent=role)
+        return _clients[role]
+
+
+def _create_model(model: str, temperature: float) -> ResilientChatModel:
+    """Backend chat model behind timeouts, retries and hedging, with the fallback model as last resort.
+
+    Every attempt, hedge and fallback call waits for a rate-limit slot from the
+    shared scheduler, which also picks the API key it runs on.
+    """
+    fallback = None
+    if FALLBACK_MODEL and FALLBACK_MODEL != model:
+        fallback = _scheduled_model(FALLBACK_MODEL, temperature)
+    return ResilientChatModel(_scheduled_model(model, temperature), fallback)
+
+
+def _scheduled_model(model: str, temperature: float) -> ScheduledChatModel:
+    backend = get_backend()
+    scheduler = get_scheduler()
+    models = {key_id: backend.create_chat_model(model, temperature, api_key=api_key)
+              for key_id, api_key in zip(scheduler.key_ids(), scheduler.api_keys)}
+    return ScheduledChatModel(models, scheduler, rate_limited=backend.rate_limited)
+
+
+def reset_clients():
+    with _lock:
+        _clients.clear()
+        _models.clear()
+
+
+def warm_up(background: bool = True):
+    """Create the clients and open a pooled connection before the first user turn.
+
+    Sends a single one-token request through the same wrappers as a real call
+    (rate-limit scheduler, retries, usage); all roles share the connection pool,
+    so one request is enough to take the TLS handshake off every agent's first turn.
+    """
+    def _warm():
+        for role in ROLES:
+            get_llm(role)
+        try:
+            get_llm("supervisor").invoke([HumanMessage(content="ping")], max_tokens=1)
+        except Exception:
+            # Best effort: the app still starts, and the first real call retries the connection
+            logger.warning("LLM warm-up request failed", exc_info=True)
+
+    if background:
+        threading.Thread(target=_warm, name="llm-warm-up", daemon=True).start()
+    else:
+        _warm()
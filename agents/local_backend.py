@@ -0,0 +1,216 @@
+# agents/local_backend.py
+import os
+import re
+import time
+import asyncio
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional
+
+from pydantic import ConfigDict
+from langchain_core.callbacks import AsyncCallbackManagerForLLMRun, CallbackManagerForLLMRun
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+from agents.history import count_tokens
+from agents.streaming import AWAITING_CONFIRMATION, BOOKING_COMPLETE
+
+# --- Local model settings ---
+LATENCY = float(os.environ.get("LOCAL_LLM_LATENCY", "0.3"))  # seconds before the first token
+TOKENS_PER_SECOND = float(os.environ.get("LOCAL_LLM_TOKENS_PER_SECOND", "200"))  # 0 = no delay
+
+# --- Slot extraction ---
+_MONTHS = "jan|feb|mar|apr|may|jun|jul|aug|sep|sept|oct|nov|dec"
+_DAYS = "monday|tuesday|wednesday|thursday|friday|saturday|sunday"
+_ROUTE_RE = re.compile(r"\bfrom\s+([a-z][a-z .'-]*?)\s+to\s+([a-z][a-z .'-]*?)"
+                       r"(?=\s+(?:on|at|in|for|by|with|tomorrow|today|next|this)\b|[,.!?\n]|$)")
+_DATE_RE = re.compile(rf"\b(\d{{1,2}}(?:st|nd|rd|th)?\s+(?:{_MONTHS})[a-z]*|(?:{_MONTHS})[a-z]*\s+\d{{1,2}}(?:st|nd|rd|th)?"
+                      rf"|\d{{4}}-\d{{2}}-\d{{2}}|\d{{1,2}}/\d{{1,2}}(?:/\d{{2,4}})?|tomorrow|today"
+                      rf"|(?:next|this)\s+(?:week|{_DAYS})|{_DAYS}|the\s+\d{{1,2}}(?:st|nd|rd|th))\b")
+_TIME_RE = re.compile(r"\b(early morning|morning|afternoon|evening|night|noon|midnight"
+                      r"|\d{1,2}(?::\d{2})?\s*(?:am|pm)|\d{1,2}:\d{2})\b")
+_PASSENGERS_RE = re.compile(r"\b(\d+|one|two|three|four|five|six)\s+(?:passengers?|people|persons?|adults?|pax|travell?ers?)\b"
+                            r"|\b(just me|myself|alone|solo)\b")
+_CLASS_RE = re.compile(r"\b(economy|premium economy|business|first)\b")
+_CAB_TYPE_RE = re.compile(r"\b(standard|sedan|mini|hatchback|suv|luxury)\b")
+_AFFIRMATIVE_RE = re.compile(r"\b(yes|yeah|yep|sure|confirm|book it|go ahead|no special|none|nothing else|that's all|no)\b")
+
+FLIGHT_QUESTIONS = [
+    ("route", "Where will you be flying from, and where to?"),
+    ("date", "What date would you like to travel?"),
+    ("time", "Do you prefer a morning, afternoon or evening flight?"),
+    ("passengers", "How many passengers will be travelling?"),
+    ("class", "Which class would you like: economy, business or first?"),
+]
+CAB_QUESTIONS = [
+    ("route", "Where should the cab pick you up, and where are you going?"),
+    ("date", "Which date do you need the cab?"),
+    ("time", "What pickup time works for you?"),
+    ("passengers", "How many passengers will be riding?"),
+    ("cab_type", "Which type of cab would you like: standard, SUV or luxury?"),
+]
+CONFIRM_QUESTION = "Do you have any special instructions, or are you ready to confirm the booking?"
+
+
+def _extract_slots(text: str, kind: str) -> Dict[str, str]:
+    slots: Dict[str, str] = {}
+    route = None
+    for route in _ROUTE_RE.finditer(text):
+        pass  # the latest route mentioned wins
+    if route:
+        slots["route"] = f"from {route.group(1).strip().title()} to {route.group(2).strip().title()}"
+    for name, pattern in (("date", _DATE_RE), ("time", _TIME_RE), ("passengers", _PASSENGERS_RE)):
+        found = [match.group(0) for match in pattern.finditer(text)]
+        if found:
+            slots[name] = found[-1]
+    if kind == "flight":
+        found = _CLASS_RE.findall(text)
+        if found:
+            slots["class"] = found[-1]
+    else:
+        found = _CAB_TYPE_RE.findall(text)
+        if found:
+            slots["cab_type"] = found[-1]
+    return slots
+
+
+def _parse_prompt(prompt: str):
+    """Split an agent prompt into (user turns, last assistant turn, current user input)"""
+    history, _, user_input = prompt.rpartition("\nUser: ")
+    history = history.partition("Conversation history:\n")[2] or history
+    user_input = user_input.split("\n", 1)[0].strip()
+    user_turns: List[str] = []
+    last_assistant = ""
+    for block in history.split("\n\n"):
+        block = block.strip()
+        # Lines of the rolling summary ("- user: ...") count as turns too
+        lines = block.splitlines()[1:] if block.startswith("Summary of earlier") else [block]
+        for line in lines:
+            line = re.sub(r"^(?:- )?(?:\[[^\]]*\]\s*)?", "", line.strip())
+            if line.startswith("user:"):
+                user_turns.append(line[len("user:"):])
+            elif line.startswith("assistant:"):
+                last_assistant = line[len("assistant:"):]
+    return user_turns, last_assistant, user_input
+
+
+def _booking_reply(prompt: str, kind: str) -> str:
+    user_turns, last_assistant, user_input = _parse_prompt(prompt)
+    slots = _extract_slots(" \n".join(user_turns + [user_input]).lower(), kind)
+    questions = FLIGHT_QUESTIONS if kind == "flight" else CAB_QUESTIONS
+    missing = [question for slot, question in questions if slot not in slots]
+    if missing:
+        known = ", ".join(slots.values())
+        intro = f"Thanks! So far I have: {known}. " if known else "I'd be happy to help with that. "
+        return intro + missing[0]
+
+    summary = ", ".join(slots[slot] for slot, _ in questions)
+    if kind == "flight":
+        # With flight search results in the prompt, book the first flight offered
+        offer = re.search(r"^Flight search results .*\n- (\S+)", prompt, re.M)
+        flight = f" on flight {offer.group(1)}" if offer else ""
+        return (f"Great news! Your flight has been booked successfully{flight}: {summary} class. "
+                f"Have a pleasant journey! {BOOKING_COMPLETE}")
+
+    if CONFIRM_QUESTION in last_assistant:
+        if _AFFIRMATIVE_RE.search(user_input.lower()):
+            return (f"Perfect! Your cab has been booked successfully: {summary}. "
+                    f"Your driver's details will be shared before pickup. {BOOKING_COMPLETE}")
+        return (f"Noted, I've added this special instruction: \"{user_input}\". Here is your cab: {summary}. "
+                f"{CONFIRM_QUESTION} {AWAITING_CONFIRMATION}")
+    return f"Here is your cab booking: {summary}. {CONFIRM_QUESTION} {AWAITING_CONFIRMATION}"
+
+
+def _supervisor_reply(prompt: str) -> str:
+    user_input = prompt.rpartition("User input:")[2].split("\n", 1)[0].lower()
+    if re.search(r"\b(flight|fly|plane|air ticket)\b", user_input):
+        return "Routing you to the flight agent to book your flight."
+    if re.search(r"\b(cab|taxi|ride|uber|lyft)\b", user_input):
+        return "Routing you to the cab agent to book your cab."
+    return "Would you like to book a flight or a cab?"
+
+
+def scripted_reply(messages: List[BaseMessage]) -> str:
+    """Rule-based reply that follows the flight, cab and supervisor prompt contracts"""
+    system = " ".join(msg.content for msg in messages if msg.type == "system")
+    prompt = messages[-1].content if messages else ""
+    if "Flight Booking Agent" in system:
+        return _booking_reply(prompt, "flight")
+    if "Cab Booking Agent" in system:
+        return _booking_reply(prompt, "cab")
+    if "Supervisor Agent" in system:
+        return _supervisor_reply(prompt)
+    if "summarise" in system:
+        return prompt.rpartition("New conversation turns:")[2].strip()[:500]
+    return "OK"
+
+
+_TOKEN_RE = re.compile(r"\S+\s*|\s+")
+
+
+# --- Local chat model ---
+class LocalChatModel(BaseChatModel):
+    """Offline stand-in for ChatGroq that replies with scripted, prompt-aware text.
+
+    latency is the wait before the first token, tokens_per_second the streaming
+    rate, so load tests see realistic time-to-first-token and reply durations.
+    """
+
+    model_config = ConfigDict(protected_namespaces=())
+
+    model_name: str = "local"
+    temperature: float = 0
+    latency: float = LATENCY
+    tokens_per_second: float = TOKENS_PER_SECOND
+
+    @property
+    def _llm_type(self) -> str:
+        return "local-travel-agent"
+
+    def _token_delay(self) -> float:
+        return 1 / self.tokens_per_second if self.tokens_per_second > 0 else 0.0
+
+    def _usage(self, messages: List[BaseMessage], reply: str) -> Dict[str, int]:
+        input_tokens = sum(count_tokens(str(msg.content)) for msg in messages)
+        output_tokens = count_tokens(reply)
+        return {"input_tokens": input_tokens, "output_tokens": output_tokens,
+                "total_tokens": input_tokens + output_tokens}
+
+    def _generate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                  run_manager: Optional[CallbackManagerForLLMRun] = None, **kwargs: Any) -> ChatResult:
+        reply = scripted_reply(messages)
+        time.sleep(self.latency + len(_TOKEN_RE.findall(reply)) * self._token_delay())
+        message = AIMessage(content=reply, usage_metadata=self._usage(messages, reply))
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    async def _agenerate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                         run_manager: Optional[AsyncCallbackManagerForLLMRun] = None, **kwargs: Any) -> ChatResult:
+        reply = scripted_reply(messages)
+        await asyncio.sleep(self.latency + len(_TOKEN_RE.findall(reply)) * self._token_delay())
+        message = AIMessage(content=reply, usage_metadata=self._usage(messages, reply))
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    def _chunks(self, messages: List[BaseMessage]) -> List[AIMessageChunk]:
+        reply = scripted_reply(messages)
+        chunks = [AIMessageChunk(content=token) for token in _TOKEN_RE.findall(reply)]
+        if chunks:
+            chunks[-1].usage_metadata = self._usage(messages, reply)
+        return chunks
+
+    def _stream(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                run_manager: Optional[CallbackManagerForLLMRun] = None, **kwargs: Any) -> Iterator[ChatGenerationChunk]:
+        time.sleep(self.latency)
+        for chunk in self._chunks(messages):
+            time.sleep(self._token_delay())
+            if run_manager:
+                run_manager.on_llm_new_token(chunk.content)
+            yield ChatGenerationChunk(message=chunk)
+
+    async def _astream(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                       run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
+                       **kwargs: Any) -> AsyncIterator[ChatGenerationChunk]:
+        await asyncio.sleep(self.latency)
+        for chunk in self._chunks(messages):
+            await asyncio.sleep(self._token_delay())
+            if run_manager:
+                await run_manager.on_llm_new_token(chunk.content)
+            yield ChatGenerationChunk(message=chunk)
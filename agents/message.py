@@ -0,0 +1,118 @@
+# agents/message.py
+import sys
+import time
+from dataclasses import dataclass, field
+from datetime import datetime
+from enum import Enum
+from typing import Any, Dict, Iterator, Optional, Union
+
+_NS_PER_SECOND = 1_000_000_000
+
+
+# --- Interned speaker and role values ---
+class Speaker(str, Enum):
+    """Every agent name that appears in a transcript"""
+    USER = "user"
+    SUPERVISOR = "supervisor"
+    FLIGHT = "flight"
+    CAB = "cab"
+    FLIGHT_AGENT = "flight_agent"
+    CAB_AGENT = "cab_agent"
+    END = "end"
+
+    def __str__(self) -> str:
+        return self.value
+
+
+class Role(str, Enum):
+    USER = "user"
+    ASSISTANT = "assistant"
+    SYSTEM = "system"
+
+    def __str__(self) -> str:
+        return self.value
+
+
+def _intern(enum: Any, value: Any) -> Any:
+    """Map a name onto its shared enum member; unknown names become interned strings"""
+    if value is None or isinstance(value, enum):
+        return value
+    member = enum._value2member_map_.get(value)
+    return member if member is not None else sys.intern(str(value))
+
+
+def _timestamp_ns(value: Any) -> int:
+    if isinstance(value, int):
+        return value
+    if isinstance(value, str):
+        moment = datetime.fromisoformat(value)
+        return int(moment.timestamp()) * _NS_PER_SECOND + moment.microsecond * 1000
+    return time.time_ns()
+
+
+# --- Compact message record ---
+@dataclass(frozen=True, slots=True)
+class Message:
+    """A chat message stored without a per-message dict.
+
+    The agent and role are shared enum members and the timestamp is an int
+    (epoch nanoseconds). It still answers the dict-style reads the app uses
+    (msg["content"], msg.get("agent"), "agent" in msg), and to_dict/from_dict
+    convert to and from the original {"agent", "role", "content", "timestamp"} dicts.
+    """
+
+    agent: Optional[Union[Speaker, str]]
+    content: str
+    role: Optional[Union[Role, str]] = None
+    timestamp_ns: int = field(default_factory=time.time_ns, compare=False)
+
+    def __post_init__(self):
+        object.__setattr__(self, "agent", _intern(Speaker, self.agent))
+        object.__setattr__(self, "role", _intern(Role, self.role))
+
+    @property
+    def timestamp(self) -> str:
+        seconds, nanoseconds = divmod(self.timestamp_ns, _NS_PER_SECOND)
+        return datetime.fromtimestamp(seconds).replace(microsecond=nanoseconds // 1000).isoformat()
+
+    # --- dict compatibility ---
+    def _fields(self) -> Iterator[str]:
+        if self.agent is not None:
+            yield "agent"
+        if self.role is not None:
+            yield "role"
+        yield "content"
+        yield "timestamp"
+
+    def __getitem__(self, key: str) -> Any:
+        if key in ("agent", "role", "content", "timestamp"):
+            value = getattr(self, key)
+            if value is not None:
+                return value
+        raise KeyError(key)
+
+    def __contains__(self, key: str) -> bool:
+        return key in ("agent", "role", "content", "timestamp") and getattr(self, key) is not None
+
+    def get(self, key: str, default: Any = None) -> Any:
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def keys(self):
+        return list(self._fields())
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {key: self[key] for key in self._fields()}
+
+    @classmethod
+    def from_dict(cls, data: Union["Message", Dict[str, Any]]) -> "Message":
+        if isinstance(data, Message):
+            return data
+        return cls(
+            agent=data.get("agent"),
+            content=data.get("content", ""),
+            role=data.get("role"),
+            timestamp_ns=_timestamp_ns(data.get("timestamp"))
+        )
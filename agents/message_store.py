@@ -0,0 +1,144 @@
+# agents/message_store.py
+from collections import Counter
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple, Union
+
+from agents.message import Message, Role
+
+BOOKING_COMPLETE = "BOOKING_COMPLETE"
+
+# User messages that open a booking session with an agent
+SESSION_KEYWORDS: Dict[str, Tuple[str, ...]] = {
+    "flight": ("book flight", "flight", "yes, book flight"),
+    "cab": ("book cab", "cab", "taxi", "yes, book cab"),
+}
+
+
+# --- Indexed message list ---
+class MessageStore(list):
+    """Chat transcript (a list of Message records) with indexes kept up to date on append.
+
+    Duplicate checks, per-agent counters, completion flags, the last message
+    of each agent and each agent's view of the conversation are all O(1)
+    lookups instead of scans over the whole history. It is still a plain list for
+    iteration and rendering; any mutation other than append/extend rebuilds
+    the indexes. Message dicts are converted to Message records on the way in.
+
+    Live sessions track completed bookings in their state machine
+    (agents/conversation.py) and no longer store BOOKING_COMPLETE entries; the
+    completion flags read them from transcripts saved before that.
+    """
+
+    def __init__(self, messages: Iterable[Union[Message, Dict[str, Any]]] = ()):
+        super().__init__()
+        self._reset_indexes()
+        self.extend(messages)
+
+    def __reduce__(self):
+        return (type(self), (list(self),))
+
+    def _reset_indexes(self):
+        self._seen: Set[Tuple[Any, Any]] = set()
+        self._counts: Counter = Counter()
+        self._completed: Set[str] = set()
+        self._last: Dict[str, Message] = {}
+        # Per-service agent view: formatted messages since the session opened, plus system context
+        self._views: Dict[str, List[Message]] = {}
+        self._system_context: Dict[str, str] = {}
+
+    def _index(self, msg: Message):
+        agent = msg.agent
+        content = msg.content
+        self._seen.add((agent, content))
+        self._counts[agent] += 1
+        if content == BOOKING_COMPLETE:
+            self._completed.add(agent)
+        else:
+            self._last[agent] = msg
+        if agent == "user" and len(self._views) < len(SESSION_KEYWORDS):
+            lowered = content.lower()
+            for service, keywords in SESSION_KEYWORDS.items():
+                if service not in self._views and any(keyword in lowered for keyword in keywords):
+                    self._views[service] = []
+
+        for service, view in self._views.items():
+            if agent == "user":
+                view.append(Message(None, content, Role.USER, msg.timestamp_ns))
+            elif agent == service:
+                view.append(Message(None, content, Role.ASSISTANT, msg.timestamp_ns))
+            elif agent == "supervisor":
+                self._system_context[service] = content
+
+    def _reindex(self):
+        self._reset_indexes()
+        # insert/__setitem__ may have stored plain dicts
+        super().__setitem__(slice(None), [Message.from_dict(msg) for msg in self])
+        for msg in self:
+            self._index(msg)
+
+    # --- list mutators ---
+    def append(self, msg: Union[Message, Dict[str, Any]]):
+        msg = Message.from_dict(msg)
+        super().append(msg)
+        self._index(msg)
+
+    def extend(self, messages: Iterable[Union[Message, Dict[str, Any]]]):
+        for msg in messages:
+            self.append(msg)
+
+    def __iadd__(self, messages):
+        self.extend(messages)
+        return self
+
+    def _mutated(name):
+        def method(self, *args, **kwargs):
+            result = getattr(super(MessageStore, self), name)(*args, **kwargs)
+            self._reindex()
+            return result
+        method.__name__ = name
+        return method
+
+    insert = _mutated("insert")
+    pop = _mutated("pop")
+    remove = _mutated("remove")
+    clear = _mutated("clear")
+    sort = _mutated("sort")
+    reverse = _mutated("reverse")
+    __setitem__ = _mutated("__setitem__")
+    __delitem__ = _mutated("__delitem__")
+    del _mutated
+
+    # --- lookups ---
+    def contains(self, agent: str, content: str) -> bool:
+        return (agent, content) in self._seen
+
+    def agent_count(self, agent: str) -> int:
+        return self._counts[agent]
+
+    def is_complete(self, agent: str) -> bool:
+        """Whether a BOOKING_COMPLETE entry has been recorded for agent"""
+        return agent in self._completed
+
+    def last_message(self, agent: str) -> Optional[Message]:
+        """Latest message of agent, ignoring BOOKING_COMPLETE entries"""
+        return self._last.get(agent)
+
+    def agent_view(self, service: str) -> Optional[List[Message]]:
+        """Formatted messages since the user opened a session with service, or None if never opened.
+
+        The latest supervisor message is prepended as system context. The list is
+        a copy, so agents may append to it freely.
+        """
+        view = self._views.get(service)
+        if view is None:
+            return None
+        context = self._system_context.get(service)
+        return ([Message(None, context, Role.SYSTEM)] if context else []) + view
+
+
+def ensure_message_store(state: Dict[str, Any]) -> MessageStore:
+    """Return state["messages"] as a MessageStore, converting a plain list once"""
+    messages = state.get("messages")
+    if not isinstance(messages, MessageStore):
+        messages = MessageStore(messages or [])
+        state["messages"] = messages
+    return messages
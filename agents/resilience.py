@@ -0,0 +1,577 @@
+# agents/resilience.py
+import os
+import time
+import random
+import asyncio
+import threading
+import contextvars
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Any, AsyncIterator, Deque, Dict, Iterator, List, Optional, Tuple
+
+from agents.deadline import (Deadline, RequestClock, TurnCancelled, clock_scope, current_deadline, deadline_scope,
+                             get_cancellation_stats)
+
+# --- Resilience settings ---
+TIMEOUT = float(os.environ.get("LLM_TIMEOUT_SECONDS", "30"))  # per attempt; for streams, per chunk; 0 = no limit
+MAX_RETRIES = int(os.environ.get("LLM_MAX_RETRIES", "2"))  # retries of the primary model after the first attempt
+RETRY_BASE_DELAY = float(os.environ.get("LLM_RETRY_BASE_DELAY", "0.5"))  # seconds, doubled per retry
+RETRY_MAX_DELAY = float(os.environ.get("LLM_RETRY_MAX_DELAY", "8"))
+HEDGE = os.environ.get("LLM_HEDGE", "0") == "1"  # second request once the first is slower than the p95
+HEDGE_MIN_SAMPLES = int(os.environ.get("LLM_HEDGE_MIN_SAMPLES", "20"))  # latencies seen before hedging starts
+FALLBACK_MODEL = os.environ.get("GROQ_FALLBACK_MODEL", "llama3-8b-8192")  # "" = no fallback
+LATENCY_WINDOW = 500  # recent call latencies kept per model for the percentiles
+RETRYABLE_STATUS = (408, 409, 429)  # plus every 5xx
+
+
+class LLMTimeoutError(TimeoutError):
+    """An LLM attempt took longer than its timeout"""
+
+
+def _retryable(error: Exception) -> bool:
+    """Timeouts, connection errors, rate limits and server errors are worth another attempt;
+    other client errors (bad request, authentication) would fail the same way again."""
+    status = getattr(error, "status_code", None) or getattr(getattr(error, "response", None), "status_code", None)
+    if isinstance(status, int):
+        return status in RETRYABLE_STATUS or status >= 500
+    return not isinstance(error, (ValueError, TypeError, KeyError))
+
+
+def backoff_delay(retry: int, base: float = RETRY_BASE_DELAY, cap: float = RETRY_MAX_DELAY) -> float:
+    """Exponential backoff with full jitter, so clients that failed together do not retry together"""
+    return random.uniform(0, min(cap, base * 2 ** (retry - 1)))
+
+
+# --- Latency and outcome statistics ---
+class LatencyTracker:
+    """Recent successful call latencies of one model"""
+
+    def __init__(self, window: int = LATENCY_WINDOW):
+        self._samples: Deque[float] = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._samples)
+
+    def add(self, seconds: float):
+        with self._lock:
+            self._samples.append(seconds)
+
+    def percentile(self, q: float) -> Optional[float]:
+        with self._lock:
+            samples = sorted(self._samples)
+        if not samples:
+            return None
+        return samples[min(len(samples) - 1, int(len(samples) * q))]
+
+
+class ResilienceStats:
+    """Counts of timeouts, retries, hedges and fallbacks per model"""
+
+    EVENTS = ("attempts", "timeouts", "retries", "hedges", "hedge_wins", "fallbacks", "failures", "cancelled")
+
+    def __init__(self):
+        self.counts: Dict[Tuple[str, str], int] = {}
+        self._lock = threading.Lock()
+
+    def count(self, model: str, event: str):
+        with self._lock:
+            self.counts[(model, event)] = self.counts.get((model, event), 0) + 1
+
+    def snapshot(self) -> Dict[str, Dict[str, int]]:
+        with self._lock:
+            counts = dict(self.counts)
+        models: Dict[str, Dict[str, int]] = {}
+        for (model, event), value in sorted(counts.items()):
+            models.setdefault(model, dict.fromkeys(self.EVENTS, 0))[event] = value
+        return models
+
+
+_stats = ResilienceStats()
+_pool: Optional[ThreadPoolExecutor] = None
+_pool_lock = threading.Lock()
+
+def get_stats() -> ResilienceStats:
+    return _stats
+
+def _get_pool() -> ThreadPoolExecutor:
+    """Threads that run sync attempts, so a hung call can be timed out (and hedged) from outside"""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ThreadPoolExecutor(max_workers=32, thread_name_prefix="llm-call")
+    return _pool
+
+
+def _mark_fallback(message: Any, model: str) -> Any:
+    """Tag a reply of the fallback model, so the response cache does not keep it for the primary"""
+    metadata = dict(getattr(message, "response_metadata", None) or {})
+    metadata["fallback_model"] = model
+    message.response_metadata = metadata
+    return message
+
+
+def from_fallback(message: Any) -> bool:
+    return bool((getattr(message, "response_metadata", None) or {}).get("fallback_model"))
+
+
+class _Request:
+    """One sync request of an attempt, run on the pool.
+
+    It runs under a deadline of its own that follows the turn's. cancel() ends
+    it, so a request still queued for a scheduler slot gives up its ticket
+    instead of being sent once nobody waits for the reply; one already sent
+    finishes on its own.
+    """
+
+    __slots__ = ("deadline", "clock", "future")
+
+    def __init__(self, pool: ThreadPoolExecutor, turn: Optional[Deadline], fn: Any, *args, **kwargs):
+        self.deadline = Deadline(0)
+        if turn is not None:
+            self.deadline.follow(turn)
+        self.clock = RequestClock()
+        # The pool thread sees the caller's deadline and scheduling priority
+        self.future = pool.submit(contextvars.copy_context().run, self._run, fn, args, kwargs)
+
+    def _run(self, fn: Any, args: Tuple[Any, ...], kwargs: Dict[str, Any]) -> Any:
+        with deadline_scope(self.deadline), clock_scope(self.clock):
+            return fn(*args, **kwargs)
+
+    def cancel(self):
+        self.future.cancel()
+        self.deadline.cancel("abandoned")
+
+
+async def _clocked(clock: RequestClock, call: Any) -> Any:
+    """Await an async request, recording on `clock` its wait for a scheduler slot"""
+    with clock_scope(clock):
+        return await call
+
+
+# --- Chat model wrapper ---
+class ResilientChatModel:
+    """Puts timeouts, jittered retries, optional hedging and a fallback model around a chat model.
+
+    Each attempt is limited to `timeout` seconds. Failed attempts that may
+    succeed on a second try are retried with exponential backoff; when the
+    primary model is out of attempts the fallback model gets one. With hedging
+    on, invoke/ainvoke send a second request once the first has run past the
+    model's p95 latency and take whichever answers first. Streams are retried
+    and timed out (per chunk) until their first chunk, but never hedged.
+
+    Calls made inside a turn (agents/deadline.py) never outlive it: timeouts are
+    cut to the time the turn has left, and cancelling the turn abandons the
+    request at once. Async requests are cancelled outright; a sync request's
+    thread is left to finish on its own, but nobody waits for it, and one still
+    waiting for a scheduler slot is never sent. Timeouts and the latency used
+    for hedging count from when a request leaves the scheduler's queue.
+    """
+
+    def __init__(self, llm: Any, fallback: Any = None, timeout: float = TIMEOUT, max_retries: int = MAX_RETRIES,
+                 hedge: bool = HEDGE, stats: Optional[ResilienceStats] = None):
+        self.llm = llm
+        self.fallback = fallback
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.hedge = hedge
+        self.stats = stats if stats is not None else get_stats()
+        self.model_name = getattr(llm, "model_name", type(llm).__name__)
+        self.temperature = getattr(llm, "temperature", None)
+        self.latency = LatencyTracker()
+
+    def __getattr__(self, name: str) -> Any:
+        if name == "llm":
+            raise AttributeError(name)
+        return getattr(self.llm, name)
+
+    def _attempts(self) -> Iterator[Tuple[Any, int]]:
+        """(model, retry number) of every attempt: the primary with its retries, then the fallback"""
+        for retry in range(self.max_retries + 1):
+            yield self.llm, retry
+        if self.fallback is not None:
+            yield self.fallback, 0
+
+    def _name(self, model: Any) -> str:
+        return getattr(model, "model_name", type(model).__name__)
+
+    def _hedge_after(self, model: Any) -> Optional[float]:
+        if not self.hedge or model is not self.llm or len(self.latency) < HEDGE_MIN_SAMPLES:
+            return None
+        return self.latency.percentile(0.95)
+
+    def _budget(self) -> Tuple[float, Optional[Deadline]]:
+        """Timeout of the next wait, cut to the time the turn has left; raises TurnCancelled"""
+        deadline = current_deadline()
+        if deadline is None:
+            return self.timeout, None
+        deadline.check()
+        return deadline.clamp(self.timeout), deadline
+
+    def _cancelled(self, model: Any, deadline: Deadline) -> TurnCancelled:
+        self.stats.count(self._name(model), "cancelled")
+        error = deadline.trip()
+        get_cancellation_stats().count("llm_call", error.reason)
+        return error
+
+    def _timed_out(self, model: Any, deadline: Optional[Deadline], what: str) -> Exception:
+        if deadline is not None and deadline.reason is not None:
+            return self._cancelled(model, deadline)
+        return LLMTimeoutError(f"{self._name(model)} {what}")
+
+    def _failed(self, model: Any, error: Exception) -> bool:
+        """Count a failed attempt; True if the next attempt should follow"""
+        if isinstance(error, TurnCancelled):
+            return False
+        name = self._name(model)
+        if isinstance(error, LLMTimeoutError):
+            self.stats.count(name, "timeouts")
+        if not _retryable(error):
+            self.stats.count(name, "failures")
+            return False
+        return True
+
+    def _next_attempt(self, model: Any, retry: int) -> float:
+        """Count the attempt about to start and return how long to back off first"""
+        deadline = current_deadline()
+        if deadline is not None:
+            deadline.check()  # nothing new starts for a cancelled turn
+        if model is self.llm:
+            self.stats.count(self._name(model), "attempts")
+            if retry:
+                self.stats.count(self._name(model), "retries")
+                return backoff_delay(retry)
+        else:
+            self.stats.count(self._name(self.llm), "fallbacks")
+            self.stats.count(self._name(model), "attempts")
+        return 0.0
+
+    @staticmethod
+    def _pause(delay: float):
+        """Back off before a retry; a cancelled turn cuts the pause short"""
+        deadline = current_deadline()
+        if deadline is None:
+            time.sleep(delay)
+            return
+        if delay > 0:
+            wait([deadline.future], timeout=deadline.clamp(delay))
+        deadline.check()
+
+    @staticmethod
+    async def _apause(delay: float):
+        deadline = current_deadline()
+        if deadline is None:
+            await asyncio.sleep(delay)
+            return
+        if delay > 0:
+            waiter = deadline.waiter()
+            try:
+                await asyncio.wait({waiter}, timeout=deadline.clamp(delay))
+            finally:
+                waiter.cancel()
+        deadline.check()
+
+    def _exhausted(self, error: Exception) -> Exception:
+        self.stats.count(self._name(self.llm), "failures")
+        return error
+
+    def _timeout_from(self, sent: float, deadline: Optional[Deadline]) -> Optional[float]:
+        """When an attempt whose request was sent at `sent` times out"""
+        if deadline is None:
+            return sent + self.timeout if self.timeout > 0 else None
+        timeout = deadline.clamp(self.timeout)
+        return sent + timeout if timeout > 0 or deadline.expires is not None else None
+
+    def _answered(self, model: Any, started: float, message: Any) -> Any:
+        if model is self.llm:
+            self.latency.add(time.perf_counter() - started)
+            return message
+        return _mark_fallback(message, self._name(model))
+
+    # --- invoke ---
+    def _invoke_once(self, model: Any, messages: Any, kwargs: Dict[str, Any]) -> Any:
+        pool = _get_pool()
+        timeout, deadline = self._budget()
+        started = time.perf_counter()
+        expires = started + timeout if timeout > 0 else None
+        hedge_after = self._hedge_after(model)
+        hedge_at = started + hedge_after if hedge_after is not None else None
+        first = _Request(pool, deadline, model.invoke, messages, **kwargs)
+        clock = first.clock
+        requests = {first.future: first}
+        pending = {first.future}
+        queued = {clock.sent}
+        watch = {deadline.future} if deadline is not None else set()
+        hedge: Optional[Future] = None
+        error: Optional[BaseException] = None
+        try:
+            while pending:
+                if queued and clock.sent.done():
+                    # Timed from when the request left the scheduler's queue
+                    queued.clear()
+                    started = clock.sent.result()
+                    expires = self._timeout_from(started, deadline)
+                    hedge_at = started + hedge_after if hedge_after is not None and hedge is None else None
+                now = time.perf_counter()
+                if clock.waiting and any(t is not None and now >= t for t in (expires, hedge_at)):
+                    expires = hedge_at = None  # still waiting for a slot
+                if expires is not None and now >= expires:
+                    break
+                if hedge_at is not None and now >= hedge_at:
+                    self.stats.count(self._name(model), "hedges")
+                    request = _Request(pool, deadline, model.invoke, messages, **kwargs)
+                    hedge = request.future
+                    requests[hedge] = request
+                    pending.add(hedge)
+                    hedge_at = None
+                wake = min((t for t in (expires, hedge_at) if t is not None), default=None)
+                done, _ = wait(pending | queued | watch, timeout=None if wake is None else wake - now,
+                               return_when=FIRST_COMPLETED)
+                if deadline is not None and deadline.cancelled:
+                    raise self._cancelled(model, deadline)
+                pending -= done
+                for future in done & requests.keys():
+                    if future.exception() is None:
+                        if future is hedge:
+                            self.stats.count(self._name(model), "hedge_wins")
+                        return self._answered(model, started, future.result())
+                    error = future.exception()
+            if error is not None and not pending:
+                raise error
+            raise self._timed_out(model, deadline, f"did not answer within {timeout:g}s")
+        finally:
+            # A request already sent cannot be stopped; its thread finishes on its own
+            for future in pending:
+                requests[future].cancel()
+
+    def invoke(self, messages: Any, **kwargs) -> Any:
+        error: Optional[Exception] = None
+        for model, retry in self._attempts():
+            self._pause(self._next_attempt(model, retry))
+            try:
+                return self._invoke_once(model, messages, kwargs)
+            except Exception as e:
+                error = e
+                if not self._failed(model, e):
+                    raise
+        raise self._exhausted(error)
+
+    # --- ainvoke ---
+    async def _ainvoke_once(self, model: Any, messages: Any, kwargs: Dict[str, Any]) -> Any:
+        timeout, deadline = self._budget()
+        started = time.perf_counter()
+        expires = started + timeout if timeout > 0 else None
+        hedge_after = self._hedge_after(model)
+        hedge_at = started + hedge_after if hedge_after is not None else None
+        clock = RequestClock()
+        pending = {asyncio.ensure_future(_clocked(clock, model.ainvoke(messages, **kwargs)))}
+        sent = asyncio.wrap_future(clock.sent)
+        queued = {sent}
+        watch = {deadline.waiter()} if deadline is not None else set()
+        hedge: Optional[asyncio.Future] = None
+        error: Optional[BaseException] = None
+        try:
+            while pending:
+                if queued and clock.sent.done():
+                    queued.clear()
+                    started = clock.sent.result()
+                    expires = self._timeout_from(started, deadline)
+                    hedge_at = started + hedge_after if hedge_after is not None and hedge is None else None
+                now = time.perf_counter()
+                if clock.waiting and any(t is not None and now >= t for t in (expires, hedge_at)):
+                    expires = hedge_at = None
+                if expires is not None and now >= expires:
+                    break
+                if hedge_at is not None and now >= hedge_at:
+                    self.stats.count(self._name(model), "hedges")
+                    hedge = asyncio.ensure_future(model.ainvoke(messages, **kwargs))
+                    pending.add(hedge)
+                    hedge_at = None
+                wake = min((t for t in (expires, hedge_at) if t is not None), default=None)
+                done, _ = await asyncio.wait(pending | queued | watch, timeout=None if wake is None else wake - now,
+                                             return_when=asyncio.FIRST_COMPLETED)
+                if deadline is not None and deadline.cancelled:
+                    raise self._cancelled(model, deadline)
+                done.discard(sent)
+                pending -= done
+                for task in done:
+                    if task.exception() is None:
+                        if task is hedge:
+                            self.stats.count(self._name(model), "hedge_wins")
+                        return self._answered(model, started, task.result())
+                    error = task.exception()
+            if error is not None and not pending:
+                raise error
+            raise self._timed_out(model, deadline, f"did not answer within {timeout:g}s")
+        finally:
+            # The losing, timed-out or cancelled requests are cancelled for real
+            for task in pending | queued | watch:
+                task.cancel()
+
+    async def ainvoke(self, messages: Any, **kwargs) -> Any:
+        error: Optional[Exception] = None
+        for model, retry in self._attempts():
+            await self._apause(self._next_attempt(model, retry))
+            try:
+                return await self._ainvoke_once(model, messages, kwargs)
+            except Exception as e:
+                error = e
+                if not self._failed(model, e):
+                    raise
+        raise self._exhausted(error)
+
+    # --- stream ---
+    def _next_chunk(self, model: Any, chunks: Iterator[Any]) -> Any:
+        """The next chunk of a sync stream, waited for on the pool so it can time out or be cancelled"""
+        timeout, deadline = self._budget()
+        if timeout <= 0 and deadline is None:
+            return next(chunks, None)
+        # The pool thread sees the caller's deadline
+        future = _get_pool().submit(contextvars.copy_context().run, next, chunks, None)
+        watch = {deadline.future} if deadline is not None else set()
+        done, _ = wait({future} | watch, timeout=timeout if timeout > 0 else None, return_when=FIRST_COMPLETED)
+        if future in done:
+            return future.result()
+        raise self._timed_out(model, deadline, f"sent nothing for {timeout:g}s")
+
+    def _first_chunk(self, model: Any, chunks: Iterator[Any]) -> Tuple[Any, float]:
+        """The first chunk of a sync stream and when its request was sent.
+
+        The request may first wait for a scheduler slot; the timeout counts from
+        when it has one, and a request given up on while still queued is dropped.
+        """
+        timeout, deadline = self._budget()
+        started = time.perf_counter()
+        expires = self._timeout_from(started, deadline)
+        request = _Request(_get_pool(), deadline, next, chunks, None)
+        clock = request.clock
+        queued = {clock.sent}
+        watch = {deadline.future} if deadline is not None else set()
+        try:
+            while True:
+                if queued and clock.sent.done():
+                    queued.clear()
+                    started = clock.sent.result()
+                    expires = self._timeout_from(started, deadline)
+                now = time.perf_counter()
+                if expires is not None and now >= expires:
+                    if not clock.waiting:
+                        break
+                    expires = None
+                done, _ = wait({request.future} | queued | watch, timeout=None if expires is None else expires - now,
+                               return_when=FIRST_COMPLETED)
+                if request.future in done:
+                    return request.future.result(), started
+                if deadline is not None and deadline.cancelled:
+                    break
+        finally:
+            if not request.future.done():
+                request.cancel()
+        raise self._timed_out(model, deadline, f"sent nothing for {timeout:g}s")
+
+    def stream(self, messages: Any, **kwargs) -> Iterator[Any]:
+        error: Optional[Exception] = None
+        for model, retry in self._attempts():
+            self._pause(self._next_attempt(model, retry))
+            chunks = iter(model.stream(messages, **kwargs))
+            try:
+                chunk, started = self._first_chunk(model, chunks)
+            except Exception as e:
+                error = e
+                if not self._failed(model, e):
+                    raise
+                continue
+            # Once the first chunk is out the reply cannot be retried transparently
+            if model is self.llm:
+                self.latency.add(time.perf_counter() - started)
+            while chunk is not None:
+                yield chunk if model is self.llm else _mark_fallback(chunk, self._name(model))
+                chunk = self._next_chunk(model, chunks)
+            return
+        raise self._exhausted(error)
+
+    async def _anext_chunk(self, model: Any, chunks: AsyncIterator[Any]) -> Any:
+        timeout, deadline = self._budget()
+        task = asyncio.ensure_future(chunks.__anext__())
+        watch = {deadline.waiter()} if deadline is not None else set()
+        try:
+            done, _ = await asyncio.wait({task} | watch, timeout=timeout if timeout > 0 else None,
+                                         return_when=asyncio.FIRST_COMPLETED)
+            if task in done:
+                try:
+                    return task.result()
+                except StopAsyncIteration:
+                    return None
+            raise self._timed_out(model, deadline, f"sent nothing for {timeout:g}s")
+        finally:
+            for pending in {task} | watch:
+                pending.cancel()
+
+    async def _afirst_chunk(self, model: Any, chunks: AsyncIterator[Any]) -> Tuple[Any, float]:
+        """Async counterpart of _first_chunk"""
+        timeout, deadline = self._budget()
+        started = time.perf_counter()
+        expires = self._timeout_from(started, deadline)
+        clock = RequestClock()
+        task = asyncio.ensure_future(_clocked(clock, chunks.__anext__()))
+        queued = {asyncio.wrap_future(clock.sent)}
+        watch = {deadline.waiter()} if deadline is not None else set()
+        try:
+            while True:
+                if queued and clock.sent.done():
+                    queued.clear()
+                    started = clock.sent.result()
+                    expires = self._timeout_from(started, deadline)
+                now = time.perf_counter()
+                if expires is not None and now >= expires:
+                    if not clock.waiting:
+                        break
+                    expires = None
+                done, _ = await asyncio.wait({task} | queued | watch,
+                                             timeout=None if expires is None else expires - now,
+                                             return_when=asyncio.FIRST_COMPLETED)
+                if task in done:
+                    try:
+                        return task.result(), started
+                    except StopAsyncIteration:
+                        return None, started
+                if deadline is not None and deadline.cancelled:
+                    break
+            raise self._timed_out(model, deadline, f"sent nothing for {timeout:g}s")
+        finally:
+            for pending in {task} | queued | watch:
+                pending.cancel()
+
+    async def astream(self, messages: Any, **kwargs) -> AsyncIterator[Any]:
+        error: Optional[Exception] = None
+        for model, retry in self._attempts():
+            await self._apause(self._next_attempt(model, retry))
+            chunks = model.astream(messages, **kwargs).__aiter__()
+            try:
+                chunk, started = await self._afirst_chunk(model, chunks)
+            except Exception as e:
+                error = e
+                if not self._failed(model, e):
+                    raise
+                continue
+            if model is self.llm:
+                self.latency.add(time.perf_counter() - started)
+            while chunk is not None:
+                yield chunk if model is self.llm else _mark_fallback(chunk, self._name(model))
+                chunk = await self._anext_chunk(model, chunks)
+            return
+        raise self._exhausted(error)
+
+
+# --- Prometheus metrics ---
+def render_resilience_metrics() -> str:
+    """Timeouts, retries, hedges and fallbacks per model, in Prometheus text format"""
+    models = get_stats().snapshot()
+    lines: List[str] = [
+        "# HELP travel_llm_attempts_total LLM attempts by model and event.",
+        "# TYPE travel_llm_attempts_total counter",
+    ]
+    for model, counts in models.items():
+        for event, value in counts.items():
+            lines.append(f'travel_llm_attempts_total{{model="{model}",event="{event}"}} {value}')
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,514 @@
+# agents/scheduler.py
+import os
+import time
+import heapq
+import asyncio
+import itertools
+import threading
+from bisect import bisect_left
+from concurrent.futures import FIRST_COMPLETED, Future, wait
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, AsyncIterator, Dict, Iterator, List, Optional, Sequence, Set, Tuple, Union
+
+from agents.deadline import current_deadline, mark_queued, mark_sent
+from agents.history import count_tokens
+from agents.tracing import BUCKETS, annotate
+
+# --- Scheduler settings ---
+RPM_LIMIT = float(os.environ.get("LLM_RPM_LIMIT", "30"))  # requests per minute per API key and model; 0 = no limit
+TPM_LIMIT = float(os.environ.get("LLM_TPM_LIMIT", "6000"))  # tokens per minute per API key and model; 0 = no limit
+COMPLETION_RESERVE = int(os.environ.get("LLM_COMPLETION_RESERVE", "300"))  # tokens booked for a reply up front
+# Several keys spread the load: GROQ_API_KEYS="key1,key2"; otherwise the client's own GROQ_API_KEY
+API_KEYS: List[Optional[str]] = [key.strip() for key in os.environ.get("GROQ_API_KEYS", "").split(",") if key.strip()] \
+    or [None]
+
+# Lower runs first: a user confirming a booking goes ahead of a speculative or batch call
+PRIORITIES: Dict[str, int] = {"confirm": 0, "interactive": 1, "speculative": 2, "batch": 3}
+DEFAULT_PRIORITY = "interactive"
+
+
+# --- Priority scope ---
+def _check_priority(priority: str) -> str:
+    if priority not in PRIORITIES:
+        raise ValueError(f"Unknown priority '{priority}'. Choose one of: {', '.join(PRIORITIES)}")
+    return priority
+
+
+class PriorityGroup:
+    """The LLM calls of one piece of work, whose priority can be raised while it runs
+    (a speculative turn the user has just asked for); see LLMScheduler.promote"""
+
+    __slots__ = ("priority",)
+
+    def __init__(self, priority: str):
+        self.priority = _check_priority(priority)
+
+
+_priority: ContextVar[Union[str, PriorityGroup]] = ContextVar("llm_priority", default=DEFAULT_PRIORITY)
+
+
+@contextmanager
+def priority_scope(priority: Union[str, PriorityGroup]) -> Iterator[Union[str, PriorityGroup]]:
+    """Run the LLM calls made inside the block at `priority` (a PRIORITIES name, or a group)"""
+    if not isinstance(priority, PriorityGroup):
+        _check_priority(priority)
+    token = _priority.set(priority)
+    try:
+        yield priority
+    finally:
+        _priority.reset(token)
+
+
+def current_priority() -> str:
+    priority = _priority.get()
+    return priority.priority if isinstance(priority, PriorityGroup) else priority
+
+
+def current_priority_group() -> Optional[PriorityGroup]:
+    priority = _priority.get()
+    return priority if isinstance(priority, PriorityGroup) else None
+
+
+# --- Token buckets ---
+class TokenBucket:
+    """Holds up to `per_minute` units and refills continuously; a limit of 0 never runs out"""
+
+    __slots__ = ("capacity", "rate", "level", "updated")
+
+    def __init__(self, per_minute: float):
+        self.capacity = per_minute
+        self.rate = per_minute / 60.0
+        self.level = per_minute
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float):
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def need(self, amount: float) -> float:
+        # A single request larger than the whole bucket waits for a full bucket, not forever
+        return min(amount, self.capacity)
+
+    def available(self, amount: float, now: float) -> float:
+        """Seconds until `amount` can be taken (0 if it can be now)"""
+        if self.capacity <= 0:
+            return 0.0
+        self._refill(now)
+        missing = self.need(amount) - self.level
+        return max(0.0, missing / self.rate)
+
+    def take(self, amount: float):
+        if self.capacity > 0:
+            self.level -= self.need(amount)
+
+    def give_back(self, amount: float):
+        """Return over-booked units (or, when negative, charge what a call used beyond its booking)"""
+        if self.capacity > 0:
+            self.level = min(self.capacity, self.level + amount)
+
+    def drain(self):
+        if self.capacity > 0:
+            self.level = min(self.level, 0.0)
+
+
+class KeySlot:
+    """Rate limits and load of one API key for one model"""
+
+    __slots__ = ("key_id", "api_key", "requests", "tokens", "in_flight", "granted", "throttled")
+
+    def __init__(self, key_id: str, api_key: Optional[str], rpm: float, tpm: float):
+        self.key_id = key_id
+        self.api_key = api_key
+        self.requests = TokenBucket(rpm)
+        self.tokens = TokenBucket(tpm)
+        self.in_flight = 0
+        self.granted = 0
+        self.throttled = 0  # rate-limit errors the provider still returned
+
+    def wait_time(self, tokens: int, now: float) -> float:
+        return max(self.requests.available(1, now), self.tokens.available(tokens, now))
+
+
+class Ticket:
+    """One queued LLM call: granted an API key once the rate limits allow it"""
+
+    __slots__ = ("model", "priority", "group", "tokens", "enqueued", "granted", "slot", "future")
+
+    def __init__(self, model: str, priority: str, tokens: int, group: Optional[PriorityGroup] = None):
+        self.model = model
+        self.priority = priority
+        self.group = group
+        self.tokens = tokens
+        self.enqueued = time.monotonic()
+        self.granted = 0.0
+        self.slot: Optional[KeySlot] = None
+        self.future: Future = Future()
+
+    @property
+    def waited(self) -> float:
+        return self.granted - self.enqueued
+
+    @property
+    def key_id(self) -> Optional[str]:
+        return self.slot.key_id if self.slot else None
+
+
+# --- Scheduler ---
+class LLMScheduler:
+    """Central queue in front of every LLM call, across sessions.
+
+    Each (API key, model) pair has a requests-per-minute and a tokens-per-minute
+    bucket. A call books one request and its estimated tokens, waits in its
+    model's priority queue (FIFO within a priority) until some key can take it,
+    and goes to the least loaded such key. A call that has to wait keeps the key
+    it waits for; calls behind it may still go ahead on the model's other keys,
+    which never delays it. When a call finishes, the estimate is corrected with
+    the tokens actually used. A dispatcher thread grants waiting calls as the
+    buckets refill.
+    """
+
+    def __init__(self, api_keys: Sequence[Optional[str]] = API_KEYS, rpm: float = RPM_LIMIT, tpm: float = TPM_LIMIT,
+                 buckets: Sequence[float] = BUCKETS):
+        self.api_keys = list(api_keys)
+        self.rpm = rpm
+        self.tpm = tpm
+        self.buckets = tuple(buckets)
+        self._slots: Dict[str, List[KeySlot]] = {}
+        # model -> heap of (priority, order, ticket); models have separate limits, so separate queues
+        self._queues: Dict[str, List[Tuple[int, int, Ticket]]] = {}
+        self._order = itertools.count()
+        self._cond = threading.Condition()
+        self._thread: Optional[threading.Thread] = None
+        # priority -> [calls, total wait seconds, per-bucket counts]
+        self._waits: Dict[str, List[Any]] = {}
+
+    def key_ids(self) -> List[str]:
+        return [f"key{index}" for index in range(len(self.api_keys))]
+
+    def register(self, model: str, rate_limited: bool = True):
+        """Set up the key slots of a model; one without provider rate limits is only queued by priority"""
+        with self._cond:
+            self._model_slots(model, rate_limited)
+
+    def _model_slots(self, model: str, rate_limited: bool = True) -> List[KeySlot]:
+        slots = self._slots.get(model)
+        if slots is None:
+            rpm, tpm = (self.rpm, self.tpm) if rate_limited else (0, 0)
+            slots = self._slots[model] = [KeySlot(key_id, api_key, rpm, tpm)
+                                          for key_id, api_key in zip(self.key_ids(), self.api_keys)]
+        return slots
+
+    # --- queue ---
+    def submit(self, model: str, tokens: int, priority: Optional[str] = None) -> Ticket:
+        group = None if priority else current_priority_group()
+        with self._cond:
+            # A group's priority is read under the lock, so promote() never misses a call
+            ticket = Ticket(model, priority or current_priority(), tokens, group)
+            self._model_slots(model)
+            heapq.heappush(self._queues.setdefault(model, []), (PRIORITIES[ticket.priority], next(self._order), ticket))
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._dispatch, name="llm-scheduler", daemon=True)
+                self._thread.start()
+            self._cond.notify()
+        return ticket
+
+    def _dispatch(self):
+        with self._cond:
+            while True:
+                self._cond.wait(self._grant())
+
+    def _grant(self) -> Optional[float]:
+        """Grant queued calls; seconds until a waiting call can go, None if nothing is queued"""
+        now = time.monotonic()
+        delays = [delay for delay in (self._grant_model(model, queue, now) for model, queue in self._queues.items())
+                  if delay is not None]
+        return min(delays) if delays else None
+
+    def _grant_model(self, model: str, queue: List[Tuple[int, int, Ticket]], now: float) -> Optional[float]:
+        """Grant one model's calls in priority order; a call that has to wait holds on to its best key"""
+        slots = self._model_slots(model)
+        held: Set[int] = set()  # keys kept for calls ahead in the queue
+        waiting: List[Tuple[int, int, Ticket]] = []
+        delay: Optional[float] = None
+        while queue and len(held) < len(slots):
+            entry = heapq.heappop(queue)
+            ticket = entry[2]
+            if ticket.future.cancelled():
+                continue
+            waits = [(slot.wait_time(ticket.tokens, now), slot.in_flight, -slot.tokens.level, index)
+                     for index, slot in enumerate(slots) if index not in held]
+            wait_time, _, _, index = min(waits)
+            if wait_time > 0:
+                held.add(index)
+                waiting.append(entry)
+                delay = wait_time if delay is None else min(delay, wait_time)
+                continue
+            slot = slots[index]
+            if not ticket.future.set_running_or_notify_cancel():
+                continue
+            slot.requests.take(1)
+            slot.tokens.take(ticket.tokens)
+            slot.in_flight += 1
+            slot.granted += 1
+            ticket.slot = slot
+            ticket.granted = now
+            self._record_wait(ticket)
+            ticket.future.set_result(slot)
+        for entry in waiting:
+            heapq.heappush(queue, entry)
+        return delay
+
+    def promote(self, group: PriorityGroup, priority: str):
+        """Raise a group's calls, queued and still to come, to `priority`; never lowers it"""
+        _check_priority(priority)
+        with self._cond:
+            if PRIORITIES[priority] >= PRIORITIES[group.priority]:
+                return
+            group.priority = priority
+            for queue in self._queues.values():
+                promoted = False
+                for index, (_, order, ticket) in enumerate(queue):
+                    if ticket.group is group:
+                        ticket.priority = priority
+                        queue[index] = (PRIORITIES[priority], order, ticket)
+                        promoted = True
+                if promoted:
+                    heapq.heapify(queue)
+            self._cond.notify()
+
+    def _queued(self) -> Iterator[Ticket]:
+        for queue in self._queues.values():
+            for _, _, ticket in queue:
+                if not ticket.future.cancelled():
+                    yield ticket
+
+    def _record_wait(self, ticket: Ticket):
+        series = self._waits.get(ticket.priority)
+        if series is None:
+            series = self._waits[ticket.priority] = [0, 0.0, [0] * len(self.buckets)]
+        series[0] += 1
+        series[1] += ticket.waited
+        index = bisect_left(self.buckets, ticket.waited)
+        if index < len(self.buckets):
+            series[2][index] += 1
+
+    def release(self, ticket: Ticket, used_tokens: Optional[int] = None, rate_limited: bool = False):
+        """Finish a granted call: correct its token booking and free the key"""
+        slot = ticket.slot
+        if slot is None:
+            return
+        with self._cond:
+            slot.in_flight -= 1
+            if used_tokens is not None:
+                slot.tokens.give_back(ticket.tokens - used_tokens)
+            if rate_limited:
+                # The provider disagrees with our accounting; hold the key back until it refills
+                slot.throttled += 1
+                slot.requests.drain()
+            ticket.slot = None
+            self._cond.notify()
+
+    def _abandon(self, ticket: Ticket):
+        """A caller that stops waiting: drop its ticket, or give back the slot it was just granted"""
+        if not ticket.future.cancel():
+            self.release(ticket, used_tokens=0)
+
+    # --- waiting ---
+    def acquire(self, model: str, tokens: int) -> Ticket:
+        """Block until the call may run; a cancelled turn stops waiting at once"""
+        ticket = self.submit(model, tokens)
+        mark_queued()
+        deadline = current_deadline()
+        if deadline is None:
+            ticket.future.result()
+        else:
+            wait({ticket.future, deadline.future}, timeout=deadline.remaining(), return_when=FIRST_COMPLETED)
+            # A call granted just as its caller gave up on it is not sent either
+            if not ticket.future.done() or deadline.reason is not None:
+                self._abandon(ticket)
+                deadline.check()
+        self._granted(ticket)
+        return ticket
+
+    async def aacquire(self, model: str, tokens: int) -> Ticket:
+        ticket = self.submit(model, tokens)
+        mark_queued()
+        deadline = current_deadline()
+        granted = asyncio.ensure_future(asyncio.wrap_future(ticket.future))
+        watch = {deadline.waiter()} if deadline is not None else set()
+        try:
+            await asyncio.wait({granted} | watch, timeout=deadline.remaining() if deadline else None,
+                               return_when=asyncio.FIRST_COMPLETED)
+        except asyncio.CancelledError:
+            self._abandon(ticket)
+            raise
+        finally:
+            for waiter in watch:
+                waiter.cancel()
+        if not granted.done() or (deadline is not None and deadline.reason is not None):
+            self._abandon(ticket)
+            granted.cancel()
+            deadline.check()
+        granted.result()
+        self._granted(ticket)
+        return ticket
+
+    @staticmethod
+    def _granted(ticket: Ticket):
+        annotate(queue_wait_ms=round(ticket.waited * 1000, 3), api_key=ticket.key_id, priority=ticket.priority)
+        mark_sent()
+
+    # --- stats ---
+    def stats(self) -> Dict[str, Any]:
+        with self._cond:
+            depth: Dict[str, int] = dict.fromkeys(PRIORITIES, 0)
+            for ticket in self._queued():
+                depth[ticket.priority] += 1
+            return {
+                "queued": depth,
+                "waits": {priority: {"calls": calls, "avg_wait_ms": round(total / calls * 1000, 3) if calls else 0.0}
+                          for priority, (calls, total, _) in sorted(self._waits.items())},
+                "keys": {model: {slot.key_id: {"in_flight": slot.in_flight, "granted": slot.granted,
+                                               "throttled": slot.throttled} for slot in slots}
+                         for model, slots in sorted(self._slots.items())},
+            }
+
+    def render(self) -> str:
+        """Queue waits, depth and per-key load in Prometheus text format"""
+        with self._cond:
+            waits = sorted((priority, [calls, total, list(counts)])
+                           for priority, (calls, total, counts) in self._waits.items())
+            depth: Dict[str, int] = dict.fromkeys(PRIORITIES, 0)
+            for ticket in self._queued():
+                depth[ticket.priority] += 1
+            slots = [(model, slot.key_id, slot.in_flight, slot.granted, slot.throttled)
+                     for model, model_slots in sorted(self._slots.items()) for slot in model_slots]
+        lines = [
+            "# HELP travel_llm_queue_wait_seconds Time LLM calls waited for a rate-limit slot.",
+            "# TYPE travel_llm_queue_wait_seconds histogram",
+        ]
+        for priority, (calls, total, counts) in waits:
+            cumulative = 0
+            for bound, hits in zip(self.buckets, counts):
+                cumulative += hits
+                lines.append(f'travel_llm_queue_wait_seconds_bucket{{priority="{priority}",le="{bound}"}} {cumulative}')
+            lines.append(f'travel_llm_queue_wait_seconds_bucket{{priority="{priority}",le="+Inf"}} {calls}')
+            lines.append(f'travel_llm_queue_wait_seconds_sum{{priority="{priority}"}} {total}')
+            lines.append(f'travel_llm_queue_wait_seconds_count{{priority="{priority}"}} {calls}')
+        lines += ["# HELP travel_llm_queue_depth LLM calls waiting for a rate-limit slot.",
+                  "# TYPE travel_llm_queue_depth gauge"]
+        lines += [f'travel_llm_queue_depth{{priority="{priority}"}} {count}' for priority, count in depth.items()]
+        lines += ["# HELP travel_llm_key_in_flight LLM calls running per API key.",
+                  "# TYPE travel_llm_key_in_flight gauge"]
+        lines += [f'travel_llm_key_in_flight{{model="{model}",key="{key}"}} {in_flight}'
+                  for model, key, in_flight, _, _ in slots]
+        lines += ["# HELP travel_llm_key_calls_total LLM calls granted per API key.",
+                  "# TYPE travel_llm_key_calls_total counter"]
+        lines += [f'travel_llm_key_calls_total{{model="{model}",key="{key}"}} {granted}'
+                  for model, key, _, granted, _ in slots]
+        lines += ["# HELP travel_llm_key_rate_limited_total Rate-limit errors returned per API key.",
+                  "# TYPE travel_llm_key_rate_limited_total counter"]
+        lines += [f'travel_llm_key_rate_limited_total{{model="{model}",key="{key}"}} {throttled}'
+                  for model, key, _, _, throttled in slots]
+        return "\n".join(lines) + "\n"
+
+
+_scheduler: Optional[LLMScheduler] = None
+_scheduler_lock = threading.Lock()
+
+def get_scheduler() -> LLMScheduler:
+    """Process-wide scheduler shared by every agent"""
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is None:
+            _scheduler = LLMScheduler()
+        return _scheduler
+
+def render_scheduler_metrics() -> str:
+    return get_scheduler().render()
+
+
+# --- Chat model wrapper ---
+def _rate_limited(error: Exception) -> bool:
+    status = getattr(error, "status_code", None) or getattr(getattr(error, "response", None), "status_code", None)
+    return status == 429
+
+
+def _used_tokens(message: Any) -> Optional[int]:
+    usage = getattr(message, "usage_metadata", None)
+    if not usage:
+        return None
+    return usage.get("total_tokens") or usage.get("input_tokens", 0) + usage.get("output_tokens", 0)
+
+
+class ScheduledChatModel:
+    """One model reachable through several API keys; every call first waits for a slot from the scheduler"""
+
+    def __init__(self, models: Dict[str, Any], scheduler: Optional[LLMScheduler] = None, rate_limited: bool = True):
+        self.models = models  # key id -> chat model using that key
+        self.scheduler = scheduler if scheduler is not None else get_scheduler()
+        first = next(iter(models.values()))
+        self.model_name = getattr(first, "model_name", type(first).__name__)
+        self.temperature = getattr(first, "temperature", None)
+        self.scheduler.register(self.model_name, rate_limited)
+
+    def __getattr__(self, name: str) -> Any:
+        if name == "models":
+            raise AttributeError(name)
+        return getattr(next(iter(self.models.values())), name)
+
+    def _estimate(self, messages: Any, kwargs: Dict[str, Any]) -> int:
+        if isinstance(messages, str):
+            prompt = count_tokens(messages)
+        else:
+            prompt = sum(count_tokens(str(getattr(message, "content", ""))) for message in messages)
+        return prompt + int(kwargs.get("max_tokens") or COMPLETION_RESERVE)
+
+    def invoke(self, messages: Any, **kwargs) -> Any:
+        ticket = self.scheduler.acquire(self.model_name, self._estimate(messages, kwargs))
+        try:
+            response = self.models[ticket.key_id].invoke(messages, **kwargs)
+        except Exception as e:
+            self.scheduler.release(ticket, rate_limited=_rate_limited(e))
+            raise
+        self.scheduler.release(ticket, _used_tokens(response))
+        return response
+
+    async def ainvoke(self, messages: Any, **kwargs) -> Any:
+        ticket = await self.scheduler.aacquire(self.model_name, self._estimate(messages, kwargs))
+        try:
+            response = await self.models[ticket.key_id].ainvoke(messages, **kwargs)
+        except BaseException as e:
+            self.scheduler.release(ticket, rate_limited=isinstance(e, Exception) and _rate_limited(e))
+            raise
+        self.scheduler.release(ticket, _used_tokens(response))
+        return response
+
+    def stream(self, messages: Any, **kwargs) -> Iterator[Any]:
+        ticket = self.scheduler.acquire(self.model_name, self._estimate(messages, kwargs))
+        used: Optional[int] = None
+        rate_limited = False
+        try:
+            for chunk in self.models[ticket.key_id].stream(messages, **kwargs):
+                used = _used_tokens(chunk) or used  # streamed usage arrives on the final chunk
+                yield chunk
+        except Exception as e:
+            rate_limited = _rate_limited(e)
+            raise
+        finally:
+            self.scheduler.release(ticket, used, rate_limited)
+
+    async def astream(self, messages: Any, **kwargs) -> AsyncIterator[Any]:
+        ticket = await self.scheduler.aacquire(self.model_name, self._estimate(messages, kwargs))
+        used: Optional[int] = None
+        rate_limited = False
+        try:
+            async for chunk in self.models[ticket.key_id].astream(messages, **kwargs):
+                used = _used_tokens(chunk) or used
+                yield chunk
+        except Exception as e:
+            rate_limited = _rate_limited(e)
+            raise
+        finally:
+            self.scheduler.release(ticket, used, rate_limited)
@@ -0,0 +1,337 @@
+# agents/session_store.py
+import os
+import re
+import json
+import zlib
+import time
+import struct
+import logging
+import sqlite3
+import threading
+from typing import Any, Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+from agents.message import Message
+
+logger = logging.getLogger(__name__)
+
+# --- Store settings ---
+STORE_BACKEND = os.environ.get("SESSION_STORE", "sqlite")  # "sqlite", "file" or "none"
+DEFAULT_PATHS = {"sqlite": ".sessions.sqlite", "file": ".sessions"}
+STORE_PATH = os.environ.get("SESSION_STORE_PATH", "")  # database file, or directory for "file"; "" = DEFAULT_PATHS
+FLUSH_INTERVAL = float(os.environ.get("SESSION_STORE_FLUSH_SECONDS", "0.05"))  # write-behind delay
+FLUSH_RETRY = float(os.environ.get("SESSION_STORE_RETRY_SECONDS", "1.0"))  # pause before retrying a failed batch
+SNAPSHOT_EVERY = int(os.environ.get("SESSION_SNAPSHOT_EVERY", "20"))  # turns between snapshots
+
+_SESSION_ID_RE = re.compile(r"^[0-9A-Za-z_-]{1,64}$")
+
+
+class StoredSession(NamedTuple):
+    fields: Dict[str, Any]  # booking_info, current_agent, conversation_stage, ... (see engine.session_fields)
+    messages: List[Message]
+    seq: int  # sequence number of the last record read
+
+
+# --- Encoding ---
+def _encode(payload: Any) -> bytes:
+    """Compact binary record: JSON without whitespace, zlib-compressed"""
+    return zlib.compress(json.dumps(payload, separators=(",", ":"), ensure_ascii=False).encode("utf-8"), 1)
+
+
+def _decode(data: bytes) -> Any:
+    return json.loads(zlib.decompress(data).decode("utf-8"))
+
+
+def _encode_messages(messages: Sequence[Message]) -> List[list]:
+    return [[msg.agent and str(msg.agent), msg.role and str(msg.role), msg.content, msg.timestamp_ns]
+            for msg in messages]
+
+
+def _decode_messages(rows: List[list]) -> List[Message]:
+    return [Message(agent, content, role, timestamp_ns) for agent, role, content, timestamp_ns in rows]
+
+
+def _check_id(session_id: str) -> str:
+    if not _SESSION_ID_RE.match(session_id):
+        raise ValueError(f"Invalid session id '{session_id}'")
+    return session_id
+
+
+# Raised by a store that cannot be read or written for now (locked database, full disk)
+STORE_ERRORS = (sqlite3.Error, OSError)
+
+
+# --- Base store ---
+class SessionStore:
+    """Durable sessions as a snapshot plus an append-only log of turns.
+
+    A turn is logged as the messages it added and the (small) session fields
+    after it, so persisting it is one short sequential write however long the
+    transcript is. Snapshots fold the log back into a single record. Writes are
+    queued and flushed in batches by a background thread; `flush()` forces them
+    out. A batch that fails to write (e.g. another process holds the database
+    lock) stays queued and is retried. Sessions are only read back when they
+    are asked for; queued writes are applied on top of what is read, so a
+    load sees them without waiting for (or failing with) a flush.
+    """
+
+    def __init__(self, flush_interval: float = FLUSH_INTERVAL):
+        self.flush_interval = flush_interval
+        self._pending: List[Tuple[str, str, int, Optional[bytes]]] = []  # (op, session_id, seq, data)
+        self._lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._closed = False
+        self.batches = 0
+        self.records = 0
+        self.failures = 0
+        self._flusher = threading.Thread(target=self._flush_loop, name="session-store-flush", daemon=True)
+        self._flusher.start()
+
+    # --- write side ---
+    def append(self, session_id: str, seq: int, messages: Sequence[Message], fields: Dict[str, Any]):
+        self._queue("turn", session_id, seq, _encode({"m": _encode_messages(messages), "f": fields}))
+
+    def snapshot(self, session_id: str, seq: int, messages: Sequence[Message], fields: Dict[str, Any]):
+        self._queue("snapshot", session_id, seq, _encode({"m": _encode_messages(messages), "f": fields}))
+
+    def delete(self, session_id: str):
+        self._queue("delete", session_id, 0, None)
+
+    def _queue(self, op: str, session_id: str, seq: int, data: Optional[bytes]):
+        with self._lock:
+            self._pending.append((op, _check_id(session_id), seq, data))
+        if self.flush_interval <= 0:
+            self.flush()
+        else:
+            self._wake.set()
+
+    def flush(self):
+        with self._write_lock:
+            with self._lock:
+                batch, self._pending = self._pending, []
+            if not batch:
+                return
+            try:
+                self._write_batch(batch)
+            except Exception:
+                # Every op is idempotent, so the whole batch goes back in front of anything queued since
+                with self._lock:
+                    self._pending[:0] = batch
+                self.failures += 1
+                raise
+            self.batches += 1
+            self.records += len(batch)
+
+    def _flush_loop(self):
+        while not self._closed:
+            self._wake.wait()
+            self._wake.clear()
+            if not self._closed:
+                time.sleep(self.flush_interval)  # let a batch build up
+            try:
+                self.flush()
+            except Exception:
+                logger.warning("Session store flush failed, retrying %d records in %.1fs",
+                               len(self._pending), FLUSH_RETRY, exc_info=True)
+                time.sleep(FLUSH_RETRY)
+                self._wake.set()
+
+    def close(self):
+        self._closed = True
+        self._wake.set()
+        self.flush()
+
+    # --- read side ---
+    def load(self, session_id: str) -> Optional[StoredSession]:
+        session_id = _check_id(session_id)
+        # Under the write lock no batch is half way between the queue and the backend
+        with self._write_lock:
+            with self._lock:
+                queued = [(op, seq, data) for op, queued_id, seq, data in self._pending if queued_id == session_id]
+            records = self._read(session_id)
+        snapshot, turns = records if records is not None else (None, [])
+        known = records is not None
+        for op, seq, data in queued:  # read your own writes
+            if op == "delete":
+                snapshot, turns, known = None, [], False
+            elif op == "snapshot":
+                snapshot, turns, known = (seq, data), [turn for turn in turns if turn[0] > seq], True
+            elif seq > max(turns[-1][0] if turns else 0, snapshot[0] if snapshot else 0):
+                turns.append((seq, data))
+                known = True
+        if not known:
+            return None
+        fields: Dict[str, Any] = {}
+        messages: List[Message] = []
+        seq = 0
+        if snapshot is not None:
+            seq, data = snapshot
+            payload = _decode(data)
+            fields, messages = payload["f"], _decode_messages(payload["m"])
+        for turn_seq, data in turns:
+            payload = _decode(data)
+            messages.extend(_decode_messages(payload["m"]))
+            fields = payload["f"]
+            seq = turn_seq
+        return StoredSession(fields, messages, seq)
+
+    # --- backend hooks ---
+    def _write_batch(self, batch: List[Tuple[str, str, int, Optional[bytes]]]):
+        raise NotImplementedError
+
+    def _read(self, session_id: str) -> Optional[Tuple[Optional[Tuple[int, bytes]], List[Tuple[int, bytes]]]]:
+        """(snapshot as (seq, data) or None, turns after it as [(seq, data)]), or None if unknown"""
+        raise NotImplementedError
+
+
+# --- SQLite backend ---
+class SQLiteSessionStore(SessionStore):
+    def __init__(self, path: str = DEFAULT_PATHS["sqlite"], flush_interval: float = FLUSH_INTERVAL):
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db_lock = threading.Lock()
+        with self._db_lock:
+            if path != ":memory:":
+                self._db.execute("PRAGMA journal_mode=WAL")  # appends become sequential log writes
+                self._db.execute("PRAGMA synchronous=NORMAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS session_snapshots ("
+                "session_id TEXT PRIMARY KEY, seq INTEGER NOT NULL, data BLOB NOT NULL)"
+            )
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS session_turns ("
+                "session_id TEXT NOT NULL, seq INTEGER NOT NULL, data BLOB NOT NULL, "
+                "PRIMARY KEY (session_id, seq))"
+            )
+            self._db.commit()
+        super().__init__(flush_interval)
+
+    def _write_batch(self, batch):
+        with self._db_lock:
+            with self._db:  # one transaction per batch
+                for op, session_id, seq, data in batch:
+                    if op == "turn":
+                        self._db.execute(
+                            "INSERT OR REPLACE INTO session_turns (session_id, seq, data) VALUES (?, ?, ?)",
+                            (session_id, seq, data)
+                        )
+                    elif op == "snapshot":
+                        self._db.execute(
+                            "INSERT OR REPLACE INTO session_snapshots (session_id, seq, data) VALUES (?, ?, ?)",
+                            (session_id, seq, data)
+                        )
+                        self._db.execute("DELETE FROM session_turns WHERE session_id = ? AND seq <= ?",
+                                         (session_id, seq))
+                    elif op == "delete":
+                        self._db.execute("DELETE FROM session_snapshots WHERE session_id = ?", (session_id,))
+                        self._db.execute("DELETE FROM session_turns WHERE session_id = ?", (session_id,))
+
+    def _read(self, session_id: str):
+        with self._db_lock:
+            snapshot = self._db.execute(
+                "SELECT seq, data FROM session_snapshots WHERE session_id = ?", (session_id,)
+            ).fetchone()
+            turns = self._db.execute(
+                "SELECT seq, data FROM session_turns WHERE session_id = ? AND seq > ? ORDER BY seq",
+                (session_id, snapshot[0] if snapshot else -1)
+            ).fetchall()
+        if snapshot is None and not turns:
+            return None
+        return snapshot, turns
+
+    def close(self):
+        super().close()
+        with self._db_lock:
+            self._db.close()
+
+
+# --- File backend ---
+_RECORD_HEADER = struct.Struct("<QI")  # seq, length
+
+
+class FileSessionStore(SessionStore):
+    """One snapshot file and one append-only log file per session in `directory`"""
+
+    def __init__(self, directory: str = DEFAULT_PATHS["file"], flush_interval: float = FLUSH_INTERVAL):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        super().__init__(flush_interval)
+
+    def _path(self, session_id: str, suffix: str) -> str:
+        return os.path.join(self.directory, f"{session_id}.{suffix}")
+
+    def _write_batch(self, batch):
+        logs: Dict[str, Any] = {}
+        try:
+            for op, session_id, seq, data in batch:
+                if op == "turn":
+                    log = logs.get(session_id)
+                    if log is None:
+                        log = logs[session_id] = open(self._path(session_id, "log"), "ab")
+                    log.write(_RECORD_HEADER.pack(seq, len(data)) + data)
+                    continue
+                if session_id in logs:
+                    logs.pop(session_id).close()
+                if op == "snapshot":
+                    tmp = self._path(session_id, "snap.tmp")
+                    with open(tmp, "wb") as f:
+                        f.write(_RECORD_HEADER.pack(seq, len(data)) + data)
+                    os.replace(tmp, self._path(session_id, "snap"))
+                    # Everything logged so far is in the snapshot
+                    open(self._path(session_id, "log"), "wb").close()
+                elif op == "delete":
+                    for suffix in ("snap", "log"):
+                        if os.path.exists(self._path(session_id, suffix)):
+                            os.remove(self._path(session_id, suffix))
+        finally:
+            for log in logs.values():
+                log.close()
+
+    @staticmethod
+    def _records(data: bytes) -> List[Tuple[int, bytes]]:
+        records = []
+        offset = 0
+        while offset + _RECORD_HEADER.size <= len(data):
+            seq, length = _RECORD_HEADER.unpack_from(data, offset)
+            offset += _RECORD_HEADER.size
+            if offset + length > len(data):
+                break  # torn write at the end of the log
+            records.append((seq, data[offset:offset + length]))
+            offset += length
+        return records
+
+    def _read(self, session_id: str):
+        snapshot = None
+        turns: List[Tuple[int, bytes]] = []
+        found = False
+        snap_path = self._path(session_id, "snap")
+        if os.path.exists(snap_path):
+            found = True
+            with open(snap_path, "rb") as f:
+                records = self._records(f.read())
+            snapshot = records[0] if records else None
+        log_path = self._path(session_id, "log")
+        if os.path.exists(log_path):
+            found = True
+            with open(log_path, "rb") as f:
+                after = snapshot[0] if snapshot else -1
+                for record in self._records(f.read()):
+                    # A retried batch may have logged a turn twice
+                    if record[0] > after:
+                        turns.append(record)
+                        after = record[0]
+        return (snapshot, turns) if found else None
+
+
+STORES = {
+    "sqlite": SQLiteSessionStore,
+    "file": FileSessionStore,
+}
+
+
+def create_session_store() -> Optional[SessionStore]:
+    """Store configured by SESSION_STORE / SESSION_STORE_PATH; None keeps sessions in memory only"""
+    if STORE_BACKEND in ("", "none"):
+        return None
+    if STORE_BACKEND not in STORES:
+        raise ValueError(f"Unknown SESSION_STORE '{STORE_BACKEND}'. Choose one of: {', '.join(STORES)}, none")
+    return STORES[STORE_BACKEND](STORE_PATH or DEFAULT_PATHS[STORE_BACKEND])
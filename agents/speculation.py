@@ -0,0 +1,102 @@
+# agents/speculation.py
+import os
+import time
+import threading
+from collections import deque
+from concurrent.futures import Future
+from typing import Any, Deque, Dict, List, Optional, Tuple
+
+from agents.deadline import Deadline
+from agents.scheduler import PriorityGroup
+
+# --- Speculation settings ---
+ENABLED = os.environ.get("SPECULATIVE_FOLLOW_UP", "1") == "1"
+TTL = float(os.environ.get("SPECULATION_TTL_SECONDS", "120"))  # unused results are dropped after this
+MAX_IN_FLIGHT = int(os.environ.get("SPECULATION_MAX_IN_FLIGHT", "4"))  # speculative turns running at once
+TOKENS_PER_HOUR = int(os.environ.get("SPECULATION_TOKENS_PER_HOUR", "20000"))  # speculative spend cap; 0 = no cap
+# Tokens reserved for a speculative turn before any has finished; later ones reserve the recent average
+TOKEN_ESTIMATE = int(os.environ.get("SPECULATION_TOKEN_ESTIMATE", "800"))
+
+
+# --- Speculative results ---
+class Speculation:
+    """A follow-up turn run ahead of time on a copy of the session state.
+
+    It is only valid for the session version it was started from; the result
+    (the copied state plus the streamed tokens) replaces the real state if the
+    user accepts before anything else changes.
+    """
+
+    __slots__ = ("version", "service", "future", "tokens", "started", "reserved", "spent", "deadline", "priority")
+
+    def __init__(self, version: int, service: str, reserved: int = 0):
+        self.version = version
+        self.service = service
+        self.future: Future = Future()
+        self.tokens: List[str] = []
+        self.started = time.monotonic()
+        self.reserved = reserved  # tokens held against the hourly cap until the spend is known
+        self.spent = 0
+        self.deadline = Deadline()  # cancelled once the result can no longer be used
+        self.priority = PriorityGroup("speculative")  # raised once the user is waiting for the result
+
+    def expired(self, ttl: float = TTL) -> bool:
+        return ttl > 0 and time.monotonic() - self.started > ttl
+
+
+class SpeculationBudget:
+    """Caps speculative work: turns running at once, and tokens spent over the last hour.
+
+    A turn reserves its expected spend when it starts, so turns running at once
+    cannot each overshoot the hourly cap; release() settles the difference.
+    """
+
+    def __init__(self, max_in_flight: int = MAX_IN_FLIGHT, tokens_per_hour: int = TOKENS_PER_HOUR,
+                 estimate: int = TOKEN_ESTIMATE):
+        self.max_in_flight = max_in_flight
+        self.tokens_per_hour = tokens_per_hour
+        self.estimate = estimate
+        self.in_flight = 0
+        self._spent: Deque[Tuple[float, int]] = deque()  # (time, tokens) of finished speculations
+        self._spent_total = 0
+        self._reserved = 0  # expected spend of the running ones
+        self._lock = threading.Lock()
+        self.counts: Dict[str, int] = {"started": 0, "used": 0, "discarded": 0, "expired": 0,
+                                       "failed": 0, "skipped": 0}
+
+    def _trim(self, now: float):
+        while self._spent and now - self._spent[0][0] > 3600:
+            self._spent_total -= self._spent.popleft()[1]
+
+    def acquire(self) -> Optional[int]:
+        """Reserve a slot and the expected tokens for one speculative turn; None (counted as skipped)
+        if either would go over the cap"""
+        with self._lock:
+            self._trim(time.monotonic())
+            reserve = self._spent_total // len(self._spent) if self._spent else self.estimate
+            over_tokens = self.tokens_per_hour > 0 and \
+                self._spent_total + self._reserved + reserve > self.tokens_per_hour
+            if self.in_flight >= self.max_in_flight or over_tokens:
+                self.counts["skipped"] += 1
+                return None
+            self.in_flight += 1
+            self._reserved += reserve
+            self.counts["started"] += 1
+            return reserve
+
+    def release(self, tokens: int, reserved: int = 0):
+        with self._lock:
+            self.in_flight -= 1
+            self._reserved -= reserved
+            self._spent.append((time.monotonic(), tokens))
+            self._spent_total += tokens
+
+    def count(self, outcome: str):
+        with self._lock:
+            self.counts[outcome] += 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            self._trim(time.monotonic())
+            return dict(self.counts, in_flight=self.in_flight, tokens_last_hour=self._spent_total,
+                        tokens_reserved=self._reserved)
@@ -0,0 +1,61 @@
+from typing import Any, Callable, Generator, Optional, Set
+
+BOOKING_COMPLETE = "BOOKING_COMPLETE"
+AWAITING_CONFIRMATION = "AWAITING_CONFIRMATION"
+
+# --- Marker filtering ---
+class MarkerFilter:
+    """Removes control markers (e.g. BOOKING_COMPLETE) from a token stream.
+
+    Only the few trailing characters that could still be the start of a marker
+    are held back, so text reaches the user as soon as it is known to be safe.
+    """
+
+    def __init__(self, *markers: str):
+        self.markers = markers or (BOOKING_COMPLETE,)
+        self.found: Set[str] = set()
+        self._pending = ""
+        self._started = False
+
+    def _held_back(self, text: str) -> int:
+        longest = 0
+        for marker in self.markers:
+            for size in range(min(len(marker) - 1, len(text)), longest, -1):
+                if marker.startswith(text[-size:]):
+                    longest = size
+                    break
+        return longest
+
+    def feed(self, token: str) -> str:
+        text = self._pending + token
+        for marker in self.markers:
+            if marker in text:
+                self.found.add(marker)
+                text = text.replace(marker, "")
+        hold = self._held_back(text)
+        self._pending = text[len(text) - hold:] if hold else ""
+        text = text[:len(text) - hold]
+        # Replies are stored stripped, so never stream leading whitespace
+        if not self._started:
+            text = text.lstrip()
+            self._started = bool(text)
+        return text
+
+    def flush(self) -> str:
+        text, self._pending = self._pending, ""
+        return text if self._started else text.lstrip()
+
+
+# --- Stream helpers ---
+def consume_stream(
+    stream: Generator[str, None, Any],
+    on_token: Optional[Callable[[str], None]] = None
+) -> Any:
+    """Drive an agent stream to completion and return the generator's final state"""
+    while True:
+        try:
+            token = next(stream)
+        except StopIteration as stop:
+            return stop.value
+        if on_token:
+            on_token(token)
@@ -1,18 +1,22 @@
 # agents/supervisor_agent.py
 import os
+import re
 from typing import List, Dict, Any, Optional
 from enum import Enum
-from datetime import datetime
 import json
 
-from langchain_groq import ChatGroq
 from langchain_core.prompts import ChatPromptTemplate
-from langchain_core.messages import HumanMessage, SystemMessage
+from langchain_core.messages import BaseMessage, HumanMessage, SystemMessage
 
-# --- Model setup ---
-os.environ["GROQ_API_KEY"] = "API_KEY"  # Replace with secure method in prod
-MODEL = "llama3-70b-8192"
-supervisor_llm = ChatGroq(temperature=0.3, model_name=MODEL)
+from agents.history import HistoryBuffer, HistoryManager
+from agents.message import Message
+from agents.intent_router import get_router
+from agents.llm_pool import get_llm
+from agents.deadline import TurnCancelled
+from agents.tracing import annotate, set_outcome, traced
+
+# --- History budget ---
+history_manager = HistoryManager(token_budget=int(os.environ.get("SUPERVISOR_HISTORY_TOKEN_BUDGET", "1000")))
 
 # --- Agent states ---
 class AgentState(str, Enum):
@@ -22,37 +26,35 @@ class AgentState(str, Enum):
     END = "end"
 
 # --- Conversation state management ---
+def render_supervisor_message(msg: Dict[str, Any]) -> str:
+    agent_prefix = f"[{msg.get('agent', msg.get('role', 'unknown'))}] "
+    content = msg.get('content', 'No content')
+    role = msg.get('role', msg.get('agent', 'unknown'))
+    return f"{agent_prefix}{role}: {content}\n\n"
+
 class SupervisorState:
     def __init__(self):
-        self.messages: List[Dict[str, Any]] = []
+        self.messages: List[Message] = []
         self.current_agent: Optional[AgentState] = None
         self.booking_info: Dict[str, Any] = {
             "flight": {},
             "cab": {}
         }
+        self.history = HistoryBuffer(render=render_supervisor_message)
 
     def add_message(self, role: str, content: str, agent: Optional[AgentState] = None):
-        self.messages.append({
-            "role": role,
-            "content": content,
-            "timestamp": datetime.now().isoformat(),
-            "agent": agent if agent else AgentState.SUPERVISOR
-        })
+        self.messages.append(Message(agent if agent else AgentState.SUPERVISOR, content, role))
 
     def get_conversation_history(self) -> str:
-        history = ""
-        for msg in self.messages[-5:]:  # Limit to last 5 messages for context
-            agent_prefix = f"[{msg.get('agent', msg.get('role', 'unknown'))}] "
-            content = msg.get('content', 'No content')
-            role = msg.get('role', msg.get('agent', 'unknown'))
-            history += f"{agent_prefix}{role}: {content}\n\n"
-        return history
+        # Recent messages verbatim, older ones summarised, within the token budget
+        return history_manager.render(self.history, self.messages)
 
     def to_dict(self) -> Dict[str, Any]:
         return {
             "messages": self.messages,
             "current_agent": self.current_agent,
             "booking_info": self.booking_info,
+            "supervisor_history_buffer": self.history,
             "user_input": ""
         }
 
@@ -62,6 +64,8 @@ class SupervisorState:
         state.messages = state_dict.get("messages", [])
         state.current_agent = state_dict.get("current_agent")
         state.booking_info = state_dict.get("booking_info", {"flight": {}, "cab": {}})
+        if state_dict.get("supervisor_history_buffer") is not None:
+            state.history = state_dict["supervisor_history_buffer"]
         return state
 
 # --- Prompt template for Supervisor Agent ---
@@ -78,7 +82,7 @@ Booking status:
 Booking details:
 {booking_details}
 
-Conversation history (last 5 messages):
+Conversation history:
 {conversation_history}
 
 User input: {user_input}
@@ -88,17 +92,15 @@ Instructions:
 - If the user specifies "cab" or related keywords (e.g., "book a cab", "taxi", "ride"), route to the cab agent with a concise message like "Routing you to the cab agent to book your cab."
 - If a flight is booked but no cab is booked, you MUST suggest booking a cab based on flight details. Use a message like "Your flight is booked. Would you like to book a cab to the departure airport or from the arrival airport to complete your travel plans?"
 - If a cab is booked but no flight is booked, you MUST suggest booking a flight that aligns with the cab's schedule (e.g., "Your cab is booked. Would you like to book a flight that aligns with your cab schedule?").
-- If the input is unclear, ask for clarification (e.g., "Would you like to book a flight or a cab?").
+- If the input is unclear, ask for clarification (e.g., "Would you like to book a flight or a cab?") without naming an agent.
 - If the user says "stop", end the current booking process and ask how to assist further.
 - If both flight and cab are booked, confirm completion and ask if the user wants to start a new booking.
 - Do NOT repeat the user's input in your response. Summarize or rephrase it if needed for context.
 
 Supervisor Response:"""
 
-def supervisor_agent(state: Dict[str, Any]) -> Dict[str, Any]:
-    state_obj = SupervisorState.from_dict(state)
-    user_input = state.get("user_input", "").lower()
-
+@traced("format_prompt")
+def _build_messages(state_obj: SupervisorState, user_input: str) -> List[BaseMessage]:
     # Prepare booking status and details
     flight_booked = state_obj.booking_info["flight"].get("status") == "booked"
     cab_booked = state_obj.booking_info["cab"].get("status") == "booked"
@@ -108,7 +110,7 @@ def supervisor_agent(state: Dict[str, Any]) -> Dict[str, Any]:
 
     # Create prompt
     prompt = ChatPromptTemplate.from_template(SUPERVISOR_PROMPT)
-    messages = [
+    return [
         SystemMessage(content="You are a helpful Supervisor Agent for a travel booking system."),
         HumanMessage(content=prompt.format(
             flight_status=flight_status,
@@ -119,18 +121,33 @@ def supervisor_agent(state: Dict[str, Any]) -> Dict[str, Any]:
         ))
     ]
 
-    # Call LLM
-    try:
-        response = supervisor_llm.invoke(messages)
-        supervisor_response = response.content.strip()
-    except Exception as e:
-        supervisor_response = f"Error processing request: {str(e)}. Please try again."
+# The route is read back from the reply, which names the agent it hands over to
+_ROUTE_RE = re.compile(r"\b(flight|cab) agent\b", re.IGNORECASE)
+
+def route_of_reply(reply: str) -> Optional[str]:
+    """"flight" or "cab" when the supervisor's reply routes to exactly one agent, otherwise None"""
+    routes = {route.lower() for route in _ROUTE_RE.findall(reply)}
+    return routes.pop() if len(routes) == 1 else None
+
+# Replies used when the intent router is confident enough to skip the LLM call
+ROUTED_REPLIES = {
+    "flight": "Sure! I'll connect you with our flight booking agent to get your flight booked.",
+    "cab": "Sure! I'll connect you with our cab booking agent to arrange your ride.",
+    "stop": "Okay, stopping here.",
+}
+
+def _route(state_obj: SupervisorState, user_input: str, supervisor_response: str,
+           intent: Optional[str] = None) -> Dict[str, Any]:
+    flight_booked = state_obj.booking_info["flight"].get("status") == "booked"
+    cab_booked = state_obj.booking_info["cab"].get("status") == "booked"
+    if intent is None:
+        intent = "stop" if get_router().wants_stop(user_input) else route_of_reply(supervisor_response)
 
     # Always add the supervisor response as a new message
     state_obj.add_message("assistant", supervisor_response, agent=AgentState.SUPERVISOR)
 
     # Determine next steps with fallback logic
-    if "stop" in user_input:
+    if intent == "stop":
         state_obj.current_agent = None
         state_obj.add_message("assistant", "Booking process stopped. How can I assist you further?", agent=AgentState.SUPERVISOR)
     elif flight_booked and not cab_booked and state_obj.current_agent != AgentState.CAB_AGENT:
@@ -145,9 +162,9 @@ def supervisor_agent(state: Dict[str, Any]) -> Dict[str, Any]:
             supervisor_response = f"Your cab from {state_obj.booking_info['cab'].get('pickup_location', 'your pickup location')} at {state_obj.booking_info['cab'].get('pickup_time', 'your pickup time')} is booked. Would you like to book a flight that aligns with your cab schedule?"
             state_obj.add_message("assistant", supervisor_response, agent=AgentState.SUPERVISOR)
         state_obj.current_agent = None
-    elif any(k in user_input for k in ["flight", "book a flight", "plane", "air ticket", "fly"]):
+    elif intent == "flight":
         state_obj.current_agent = AgentState.FLIGHT_AGENT
-    elif any(k in user_input for k in ["cab", "taxi", "ride", "airport drop", "uber", "lyft"]):
+    elif intent == "cab":
         state_obj.current_agent = AgentState.CAB_AGENT
     elif (flight_booked and cab_booked and 
           state_obj.current_agent not in [AgentState.FLIGHT_AGENT, AgentState.CAB_AGENT]):
@@ -158,65 +175,49 @@ def supervisor_agent(state: Dict[str, Any]) -> Dict[str, Any]:
     result["user_input"] = ""  # Clear input for next step
     return result
 
-# def supervisor_agent(state: Dict[str, Any]) -> Dict[str, Any]:
-#     state_obj = SupervisorState.from_dict(state)
-#     user_input = state.get("user_input", "").lower()
-
-#     # Prepare booking status and details
-#     flight_booked = state_obj.booking_info["flight"].get("status") == "booked"
-#     cab_booked = state_obj.booking_info["cab"].get("status") == "booked"
-#     flight_status = "booked" if flight_booked else "not booked"
-#     cab_status = "booked" if cab_booked else "not booked"
-#     booking_details = json.dumps(state_obj.booking_info, indent=2)
-
-#     # Create prompt
-#     prompt = ChatPromptTemplate.from_template(SUPERVISOR_PROMPT)
-#     messages = [
-#         SystemMessage(content="You are a helpful Supervisor Agent for a travel booking system."),
-#         HumanMessage(content=prompt.format(
-#             flight_status=flight_status,
-#             cab_status=cab_status,
-#             booking_details=booking_details,
-#             conversation_history=state_obj.get_conversation_history(),
-#             user_input=user_input
-#         ))
-#     ]
-
-#     # Call LLM
-#     try:
-#         response = supervisor_llm.invoke(messages)
-#         supervisor_response = response.content.strip()
-#     except Exception as e:
-#         supervisor_response = f"Error processing request: {str(e)}. Please try again."
-
-#     # Always add the supervisor response as a new message
-#     state_obj.add_message("assistant", supervisor_response, agent=AgentState.SUPERVISOR.value)
-
-#     # Determine next steps with fallback logic
-#     if "stop" in user_input:
-#         state_obj.current_agent = None
-#         state_obj.add_message("assistant", "Booking process stopped. How can I assist you further?", agent=AgentState.SUPERVISOR.value)
-#     elif flight_booked and not cab_booked and state_obj.current_agent != AgentState.CAB_AGENT.value:
-#         # Ensure cab suggestion if not already in the response
-#         if "cab" not in supervisor_response.lower():
-#             supervisor_response = f"Your flight from {state_obj.booking_info['flight'].get('origin', 'your departure city')} to {state_obj.booking_info['flight'].get('destination', 'your destination')} on {state_obj.booking_info['flight'].get('date', 'your travel date')} at {state_obj.booking_info['flight'].get('time', 'your travel time')} is booked. Would you like to book a cab to the departure airport or from the arrival airport to complete your travel plans?"
-#             state_obj.add_message("assistant", supervisor_response, agent=AgentState.SUPERVISOR.value)
-#         state_obj.current_agent = None
-#     elif cab_booked and not flight_booked and state_obj.current_agent != AgentState.FLIGHT_AGENT.value:
-#         # Ensure flight suggestion
-#         if "flight" not in supervisor_response.lower():
-#             supervisor_response = f"Your cab from {state_obj.booking_info['cab'].get('pickup_location', 'your pickup location')} at {state_obj.booking_info['cab'].get('pickup_time', 'your pickup time')} is booked. Would you like to book a flight that aligns with your cab schedule?"
-#             state_obj.add_message("assistant", supervisor_response, agent=AgentState.SUPERVISOR.value)
-#         state_obj.current_agent = None
-#     elif any(k in user_input for k in ["flight", "book a flight", "plane", "air ticket", "fly"]):
-#         state_obj.current_agent = AgentState.FLIGHT_AGENT.value
-#     elif any(k in user_input for k in ["cab", "taxi", "ride", "airport drop", "uber", "lyft"]):
-#         state_obj.current_agent = AgentState.CAB_AGENT.value
-#     elif (flight_booked and cab_booked and 
-#           state_obj.current_agent not in [AgentState.FLIGHT_AGENT.value, AgentState.CAB_AGENT.value]):
-#         state_obj.current_agent = AgentState.END.value
-#         state_obj.add_message("assistant", "Both flight and cab bookings are complete! Would you like to start a new booking?", agent=AgentState.SUPERVISOR.value)
-
-#     result = state_obj.to_dict()
-#     result["user_input"] = ""  # Clear input for next step
-#     return result
\ No newline at end of file
+@traced("supervisor_agent", agent="supervisor")
+def supervisor_agent(state: Dict[str, Any]) -> Dict[str, Any]:
+    state_obj = SupervisorState.from_dict(state)
+    user_input = state.get("user_input", "").lower()
+
+    # Confident intents are routed locally; only unclear input costs an LLM round-trip
+    intent = get_router().route(user_input)
+    annotate(routed_by="router" if intent is not None else "llm")
+    if intent is not None:
+        return _route(state_obj, user_input, ROUTED_REPLIES[intent], intent)
+
+    # Call LLM
+    try:
+        response = get_llm("supervisor").invoke(_build_messages(state_obj, user_input))
+        supervisor_response = response.content.strip()
+    except TurnCancelled:
+        set_outcome("cancelled")
+        raise
+    except Exception as e:
+        set_outcome("error")
+        supervisor_response = f"Error processing request: {str(e)}. Please try again."
+
+    return _route(state_obj, user_input, supervisor_response)
+
+@traced("supervisor_agent", agent="supervisor")
+async def asupervisor_agent(state: Dict[str, Any]) -> Dict[str, Any]:
+    """Async counterpart of supervisor_agent"""
+    state_obj = SupervisorState.from_dict(state)
+    user_input = state.get("user_input", "").lower()
+
+    intent = get_router().route(user_input)
+    annotate(routed_by="router" if intent is not None else "llm")
+    if intent is not None:
+        return _route(state_obj, user_input, ROUTED_REPLIES[intent], intent)
+
+    try:
+        response = await get_llm("supervisor").ainvoke(_build_messages(state_obj, user_input))
+        supervisor_response = response.content.strip()
+    except TurnCancelled:
+        set_outcome("cancelled")
+        raise
+    except Exception as e:
+        set_outcome("error")
+        supervisor_response = f"Error processing request: {str(e)}. Please try again."
+
+    return _route(state_obj, user_input, supervisor_response)
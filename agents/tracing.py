@@ -0,0 +1,323 @@
+# agents/tracing.py
+import os
+import json
+import time
+import uuid
+import random
+import asyncio
+import inspect
+import logging
+import functools
+import threading
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+# --- Trace settings ---
+SAMPLE_RATE = float(os.environ.get("TRACE_SAMPLE_RATE", "0.1"))  # share of traces exported; metrics see every trace
+TRACE_PATH = os.environ.get("TRACE_PATH", "")  # JSONL file for sampled traces; "" only feeds the metrics
+MAX_PENDING = int(os.environ.get("TRACE_MAX_PENDING", "10000"))  # traces waiting for the writer before new ones are dropped
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)  # seconds
+# Attributes a span takes over from its parent unless it sets its own
+INHERITED = ("session_id", "agent")
+
+
+# --- Spans ---
+class Span:
+    """One timed step of a trace. Children inherit the session id and agent of their parent.
+
+    Only sampled traces get ids and keep their finished spans for export.
+    """
+
+    __slots__ = ("trace_id", "span_id", "parent_id", "name", "attributes", "start", "duration",
+                 "outcome", "sampled", "_started", "_finished")
+
+    def __init__(self, name: str, parent: Optional["Span"], attributes: Dict[str, Any], sampled: bool = False):
+        self.name = name
+        if parent is None:
+            self.sampled = sampled
+            self.trace_id = uuid.uuid4().hex if sampled else None
+            self.parent_id = None
+            # Every span of a sampled trace, exported when the root ends
+            self._finished: Optional[List["Span"]] = [] if sampled else None
+            self.attributes = attributes
+        else:
+            self.sampled = parent.sampled
+            self.trace_id = parent.trace_id
+            self.parent_id = parent.span_id
+            self._finished = parent._finished
+            self.attributes = {key: parent.attributes[key] for key in INHERITED if key in parent.attributes}
+            self.attributes.update(attributes)
+        self.span_id = uuid.uuid4().hex[:16] if self.sampled else None
+        self.start = time.time()
+        self._started = time.perf_counter()
+        self.duration = 0.0
+        self.outcome = "ok"
+
+    def set(self, **attributes: Any):
+        self.attributes.update(attributes)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "start": self.start,
+            "duration_ms": round(self.duration * 1000, 3),
+            "outcome": self.outcome,
+            "attributes": self.attributes,
+        }
+
+
+_current: ContextVar[Optional[Span]] = ContextVar("trace_span", default=None)
+
+
+def current_span() -> Optional[Span]:
+    return _current.get()
+
+
+def annotate(**attributes: Any):
+    """Add attributes to the current span; a no-op outside any span"""
+    span = _current.get()
+    if span is not None:
+        span.attributes.update(attributes)
+
+
+def set_outcome(outcome: str):
+    span = _current.get()
+    if span is not None:
+        span.outcome = outcome
+
+
+@contextmanager
+def span(name: str, **attributes: Any) -> Iterator[Optional[Span]]:
+    """Time the enclosed block as a child of the current span.
+
+    Outside any span this starts a trace. Every span feeds the metrics; the
+    trace is exported to TRACE_PATH with probability SAMPLE_RATE.
+    """
+    parent = _current.get()
+    sampled = parent is None and SAMPLE_RATE > 0 and random.random() < SAMPLE_RATE
+    current = Span(name, parent, attributes, sampled)
+    token = _current.set(current)
+    try:
+        yield current
+    except (GeneratorExit, asyncio.CancelledError):
+        current.outcome = "cancelled"
+        raise
+    except BaseException:
+        current.outcome = "error"
+        raise
+    finally:
+        current.duration = time.perf_counter() - current._started
+        _reset(token, parent)
+        get_metrics().observe(current, root=parent is None)
+        if current.sampled:
+            current._finished.append(current)
+            if parent is None:
+                get_exporter().export(current._finished)
+
+
+def _reset(token, parent):
+    try:
+        _current.reset(token)
+    except ValueError:  # a generator closed from another context (e.g. by the garbage collector)
+        _current.set(parent)
+
+
+def traced(name: str, **attributes: Any) -> Callable:
+    """Decorator form of span() for plain, async and generator functions"""
+    def decorate(func: Callable) -> Callable:
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                with span(name, **attributes):
+                    return await func(*args, **kwargs)
+            return async_wrapper
+
+        if inspect.isgeneratorfunction(func):
+            @functools.wraps(func)
+            def generator_wrapper(*args, **kwargs):
+                with span(name, **attributes):
+                    return (yield from func(*args, **kwargs))
+            return generator_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(name, **attributes):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+def prompt_size(messages: Sequence[Any]) -> int:
+    """Characters in a prompt (a string or a list of LangChain messages)"""
+    if isinstance(messages, str):
+        return len(messages)
+    return sum(len(getattr(message, "content", "") or "") for message in messages)
+
+
+# --- JSONL export ---
+class TraceExporter:
+    """Appends each finished trace to a JSONL file, one span per line.
+
+    Traces are queued and serialised and written in batches by a background
+    thread, so no file I/O happens on the request path. When the writer falls
+    more than max_pending traces behind, new traces are dropped and counted.
+    """
+
+    def __init__(self, path: Optional[str] = TRACE_PATH, max_pending: int = MAX_PENDING):
+        self.path = path
+        self.max_pending = max_pending
+        self.exported = 0
+        self.dropped = 0
+        self._pending: List[List[Span]] = []
+        self._file = None
+        self._lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._writer: Optional[threading.Thread] = None
+
+    def export(self, spans: List[Span]):
+        if not self.path:
+            return
+        with self._lock:
+            if len(self._pending) >= self.max_pending:
+                self.dropped += 1
+                return
+            self._pending.append(spans)
+            if self._writer is None:
+                self._writer = threading.Thread(target=self._write_loop, name="trace-export", daemon=True)
+                self._writer.start()
+        self._wake.set()
+
+    def _write_loop(self):
+        while True:
+            self._wake.wait()
+            self._wake.clear()
+            self.flush()
+
+    def flush(self):
+        """Write every queued trace now"""
+        with self._write_lock:
+            with self._lock:
+                batch, self._pending = self._pending, []
+            if not batch:
+                return
+            lines = "".join(json.dumps(span.to_dict(), ensure_ascii=False, default=str) + "\n"
+                            for spans in batch for span in spans)
+            try:
+                if self._file is None:
+                    self._file = open(self.path, "a", encoding="utf-8")
+                self._file.write(lines)
+                self._file.flush()
+            except OSError:
+                logger.warning("Could not write %d traces to %s", len(batch), self.path, exc_info=True)
+                return
+            self.exported += len(batch)
+
+    def close(self):
+        self.flush()
+        with self._write_lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+
+# --- Prometheus metrics ---
+def _label(value: Any) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+class SpanMetrics:
+    """Duration histograms per (span, agent, outcome), rendered in Prometheus text format"""
+
+    def __init__(self, buckets: Sequence[float] = BUCKETS):
+        self.buckets = tuple(buckets)
+        self.traces = 0
+        # (span, agent, outcome) -> [count, total seconds, prompt chars, per-bucket counts]
+        self._series: Dict[Tuple[str, str, str], List[Any]] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, span: Span, root: bool = False):
+        key = (span.name, str(span.attributes.get("agent", "")), span.outcome)
+        index = bisect_left(self.buckets, span.duration)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [0, 0.0, 0, [0] * len(self.buckets)]
+            series[0] += 1
+            series[1] += span.duration
+            series[2] += span.attributes.get("prompt_chars", 0)
+            if index < len(self.buckets):
+                series[3][index] += 1
+            if root:
+                self.traces += 1
+
+    def render(self) -> str:
+        with self._lock:
+            series = sorted((key, [count, total, chars, list(buckets)])
+                            for key, (count, total, chars, buckets) in self._series.items())
+            traces = self.traces
+        lines = [
+            "# HELP travel_trace_sample_rate Share of traces that are exported to TRACE_PATH.",
+            "# TYPE travel_trace_sample_rate gauge",
+            f"travel_trace_sample_rate {SAMPLE_RATE}",
+            "# HELP travel_traces_total Traces.",
+            "# TYPE travel_traces_total counter",
+            f"travel_traces_total {traces}",
+            "# HELP travel_span_duration_seconds Duration of spans.",
+            "# TYPE travel_span_duration_seconds histogram",
+        ]
+        for (name, agent, outcome), (count, total, _, buckets) in series:
+            labels = f'span="{_label(name)}",agent="{_label(agent)}",outcome="{_label(outcome)}"'
+            cumulative = 0
+            for bound, hits in zip(self.buckets, buckets):
+                cumulative += hits
+                lines.append(f'travel_span_duration_seconds_bucket{{{labels},le="{bound}"}} {cumulative}')
+            lines.append(f'travel_span_duration_seconds_bucket{{{labels},le="+Inf"}} {count}')
+            lines.append(f"travel_span_duration_seconds_sum{{{labels}}} {total}")
+            lines.append(f"travel_span_duration_seconds_count{{{labels}}} {count}")
+        lines += [
+            "# HELP travel_span_prompt_chars_total Prompt characters sent by spans.",
+            "# TYPE travel_span_prompt_chars_total counter",
+        ]
+        for (name, agent, outcome), (_, _, chars, _) in series:
+            if chars:
+                lines.append(f'travel_span_prompt_chars_total{{span="{_label(name)}",agent="{_label(agent)}",'
+                             f'outcome="{_label(outcome)}"}} {chars}')
+        return "\n".join(lines) + "\n"
+
+    def reset(self):
+        with self._lock:
+            self._series.clear()
+            self.traces = 0
+
+
+_metrics: Optional[SpanMetrics] = None
+_exporter: Optional[TraceExporter] = None
+_lock = threading.Lock()
+
+def get_metrics() -> SpanMetrics:
+    global _metrics
+    if _metrics is None:
+        with _lock:
+            if _metrics is None:
+                _metrics = SpanMetrics()
+    return _metrics
+
+def get_exporter() -> TraceExporter:
+    global _exporter
+    if _exporter is None:
+        with _lock:
+            if _exporter is None:
+                _exporter = TraceExporter()
+    return _exporter
+
+def render_metrics() -> str:
+    """Prometheus text exposition of the span metrics"""
+    return get_metrics().render()
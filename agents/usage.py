@@ -0,0 +1,234 @@
+# agents/usage.py
+import os
+import time
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from agents.history import count_tokens
+from agents.tracing import annotate
+
+# --- Budget settings ---
+SESSION_TOKEN_BUDGET = int(os.environ.get("SESSION_TOKEN_BUDGET", "0"))  # prompt + completion tokens; 0 = unlimited
+BUDGET_ACTION = os.environ.get("SESSION_BUDGET_ACTION", "compact")  # "compact" or "refuse"
+COMPACT_HISTORY_TOKENS = int(os.environ.get("COMPACT_HISTORY_TOKENS", "600"))  # agent history budget once over
+BUDGET_ACTIONS = ("compact", "refuse")
+
+
+# --- Usage records ---
+class AgentUsage:
+    """Token and latency totals of one agent's LLM calls"""
+
+    __slots__ = ("calls", "cache_hits", "prompt_tokens", "completion_tokens", "ttft", "latency", "estimated")
+
+    def __init__(self):
+        self.calls = 0
+        self.cache_hits = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.ttft = 0.0  # seconds, summed over calls
+        self.latency = 0.0
+        self.estimated = 0  # calls whose tokens were counted locally because the provider sent no usage
+
+    def add(self, prompt_tokens: int, completion_tokens: int, ttft: float, latency: float,
+            cached: bool = False, estimated: bool = False):
+        self.calls += 1
+        self.cache_hits += cached
+        self.prompt_tokens += prompt_tokens
+        self.completion_tokens += completion_tokens
+        self.ttft += ttft
+        self.latency += latency
+        self.estimated += estimated
+
+    @property
+    def total_tokens(self) -> int:
+        return self.prompt_tokens + self.completion_tokens
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {name: getattr(self, name) for name in self.__slots__}
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "AgentUsage":
+        usage = cls()
+        for name in cls.__slots__:
+            if name in data:
+                setattr(usage, name, data[name])
+        return usage
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            "calls": self.calls,
+            "cache_hits": self.cache_hits,
+            "prompt_tokens": self.prompt_tokens,
+            "completion_tokens": self.completion_tokens,
+            "total_tokens": self.total_tokens,
+            "avg_ttft_ms": round(self.ttft / self.calls * 1000, 1) if self.calls else 0.0,
+            "avg_latency_ms": round(self.latency / self.calls * 1000, 1) if self.calls else 0.0,
+        }
+
+
+class SessionUsage:
+    """Per-agent usage of one session, with the session's token budget"""
+
+    def __init__(self, budget: int = SESSION_TOKEN_BUDGET, action: str = BUDGET_ACTION):
+        if action not in BUDGET_ACTIONS:
+            raise ValueError(f"Unknown budget action '{action}'. Choose one of: {', '.join(BUDGET_ACTIONS)}")
+        self.budget = budget
+        self.action = action
+        self.agents: Dict[str, AgentUsage] = {}
+
+    def record(self, agent: str, prompt_tokens: int, completion_tokens: int, ttft: float, latency: float,
+               cached: bool = False, estimated: bool = False):
+        usage = self.agents.get(agent)
+        if usage is None:
+            usage = self.agents[agent] = AgentUsage()
+        usage.add(prompt_tokens, completion_tokens, ttft, latency, cached, estimated)
+
+    @property
+    def prompt_tokens(self) -> int:
+        return sum(usage.prompt_tokens for usage in self.agents.values())
+
+    @property
+    def completion_tokens(self) -> int:
+        return sum(usage.completion_tokens for usage in self.agents.values())
+
+    @property
+    def total_tokens(self) -> int:
+        return self.prompt_tokens + self.completion_tokens
+
+    def over_budget(self) -> bool:
+        return self.budget > 0 and self.total_tokens >= self.budget
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "budget": self.budget,
+            "action": self.action,
+            "agents": {agent: usage.to_dict() for agent, usage in self.agents.items()},
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "SessionUsage":
+        usage = cls(data.get("budget", SESSION_TOKEN_BUDGET), data.get("action", BUDGET_ACTION))
+        usage.agents = {agent: AgentUsage.from_dict(values) for agent, values in data.get("agents", {}).items()}
+        return usage
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            "prompt_tokens": self.prompt_tokens,
+            "completion_tokens": self.completion_tokens,
+            "total_tokens": self.total_tokens,
+            "budget": self.budget,
+            "over_budget": self.over_budget(),
+            "agents": {agent: usage.summary() for agent, usage in sorted(self.agents.items())},
+        }
+
+
+def usage_of(state: Dict[str, Any]) -> SessionUsage:
+    """state["usage"] as a SessionUsage, converting stored dicts once"""
+    usage = state.get("usage")
+    if not isinstance(usage, SessionUsage):
+        usage = SessionUsage.from_dict(usage) if isinstance(usage, dict) else SessionUsage()
+        state["usage"] = usage
+    return usage
+
+
+# --- Accounting scope ---
+# The session whose turn is running; LLM calls outside any session only count towards the process totals
+_scope: ContextVar[Optional[SessionUsage]] = ContextVar("usage_scope", default=None)
+_totals = SessionUsage(budget=0)
+_totals_lock = threading.Lock()
+
+
+@contextmanager
+def usage_scope(usage: SessionUsage) -> Iterator[SessionUsage]:
+    token = _scope.set(usage)
+    try:
+        yield usage
+    finally:
+        _scope.reset(token)
+
+
+def record_call(agent: str, prompt_tokens: int, completion_tokens: int, ttft: float, latency: float,
+                cached: bool = False, estimated: bool = False):
+    session_usage = _scope.get()
+    if session_usage is not None:
+        session_usage.record(agent, prompt_tokens, completion_tokens, ttft, latency, cached, estimated)
+    with _totals_lock:
+        _totals.record(agent, prompt_tokens, completion_tokens, ttft, latency, cached, estimated)
+    annotate(prompt_tokens=prompt_tokens, completion_tokens=completion_tokens)
+
+
+def total_usage() -> Dict[str, Any]:
+    """Usage of every LLM call made by this process"""
+    with _totals_lock:
+        return _totals.summary()
+
+
+def _usage_tokens(metadata: Any) -> Optional[Tuple[int, int]]:
+    """(prompt, completion) tokens from LangChain usage_metadata, if the provider sent any"""
+    if not metadata:
+        return None
+    return metadata.get("input_tokens", 0), metadata.get("output_tokens", 0)
+
+
+class CallMeter:
+    """Times one LLM call (time to first token and total latency) and records its usage when done"""
+
+    __slots__ = ("agent", "messages", "started", "first_token", "usage")
+
+    def __init__(self, agent: str, messages: Any):
+        self.agent = agent
+        self.messages = messages
+        self.started = time.perf_counter()
+        self.first_token: Optional[float] = None
+        self.usage: Optional[Tuple[int, int]] = None
+
+    def chunk(self, chunk: Any):
+        if self.first_token is None and chunk.content:
+            self.first_token = time.perf_counter()
+        # Streamed usage arrives on the final chunk
+        usage = _usage_tokens(getattr(chunk, "usage_metadata", None))
+        if usage is not None:
+            self.usage = usage
+
+    def done(self, content: str, metadata: Any = None, cached: bool = False):
+        finished = time.perf_counter()
+        ttft = (self.first_token or finished) - self.started
+        usage = _usage_tokens(metadata) or self.usage
+        estimated = False
+        if cached:
+            usage = (0, 0)  # served from the response cache, nothing was billed
+        elif usage is None:
+            usage = (_prompt_tokens(self.messages), count_tokens(content))
+            estimated = True
+        record_call(self.agent, usage[0], usage[1], ttft, finished - self.started, cached, estimated)
+
+
+def _prompt_tokens(messages: Any) -> int:
+    if isinstance(messages, str):
+        return count_tokens(messages)
+    return sum(count_tokens(str(getattr(message, "content", ""))) for message in messages)
+
+
+# --- Prometheus metrics ---
+def render_usage_metrics() -> str:
+    """Per-agent token and latency counters of this process, in Prometheus text format"""
+    with _totals_lock:
+        agents: List[Tuple[str, AgentUsage]] = sorted(
+            (agent, AgentUsage.from_dict(usage.to_dict())) for agent, usage in _totals.agents.items())
+    counters = (
+        ("travel_llm_calls_total", "LLM calls.", "calls"),
+        ("travel_llm_cache_hits_total", "LLM calls served from the response cache.", "cache_hits"),
+        ("travel_llm_prompt_tokens_total", "Prompt tokens sent to the LLM.", "prompt_tokens"),
+        ("travel_llm_completion_tokens_total", "Completion tokens received from the LLM.", "completion_tokens"),
+        ("travel_llm_ttft_seconds_total", "Time to first token, summed over calls.", "ttft"),
+        ("travel_llm_latency_seconds_total", "LLM call latency, summed over calls.", "latency"),
+    )
+    lines: List[str] = []
+    for metric, help_text, field in counters:
+        lines.append(f"# HELP {metric} {help_text}")
+        lines.append(f"# TYPE {metric} counter")
+        for agent, usage in agents:
+            lines.append(f'{metric}{{agent="{agent}"}} {getattr(usage, field)}')
+    return "\n".join(lines) + "\n"
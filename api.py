@@ -0,0 +1,243 @@
+# HTTP API for the travel booking engine (agents/engine.py), as a plain ASGI app.
+# Run it with any ASGI server, e.g.:  uvicorn api:app --workers 4
+#
+#   POST   /sessions                       create a session, optionally {"token_budget": N, "budget_action": "compact"|"refuse"}
+#   GET    /sessions/{id}?since=N          session state, messages from index N on
+#   DELETE /sessions/{id}                  end a session
+#   POST   /sessions/{id}/turns            {"text": "..."} run a turn, reply when done
+#   POST   /sessions/{id}/turns/stream     {"text": "..."} run a turn, reply as server-sent events
+#   POST   /sessions/{id}/follow-up        {"accept": true|false} answer the follow-up question
+#
+# Turn and follow-up requests may carry the "version" of the session they were made from;
+# a resubmitted or concurrent duplicate then shares the first request's result.
+#   GET    /metrics                        span timings in Prometheus text format (agents/tracing.py)
+
+import os
+import re
+import json
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import parse_qs
+
+from agents.engine import ConversationEngine, get_engine, is_complete
+from agents.deadline import render_cancellation_metrics
+from agents.scheduler import render_scheduler_metrics
+from agents.resilience import render_resilience_metrics
+from agents.tracing import render_metrics
+from agents.usage import BUDGET_ACTIONS, render_usage_metrics
+
+MAX_BODY_BYTES = int(os.environ.get("API_MAX_BODY_BYTES", str(64 * 1024)))
+
+_SESSION_RE = re.compile(r"^/sessions/([0-9A-Za-z_-]+)(/turns|/turns/stream|/follow-up)?$")
+
+
+class HTTPError(Exception):
+    def __init__(self, status: int, detail: str):
+        super().__init__(detail)
+        self.status = status
+        self.detail = detail
+
+
+# --- Serialisation ---
+def snapshot(engine: ConversationEngine, session_id: str, since: int = 0) -> Dict[str, Any]:
+    """JSON view of a session; only messages from index `since` on are included"""
+    state = engine.state(session_id)
+    follow_up = engine.follow_up(session_id)
+    messages = state["messages"]
+    return {
+        "session_id": session_id,
+        "version": engine.version(session_id),
+        "conversation_stage": state["conversation_stage"],
+        "current_agent": state["current_agent"],
+        "booking_info": state["booking_info"],
+        "complete": is_complete(state),
+        "follow_up": {"service": follow_up[0], "question": follow_up[1]} if follow_up else None,
+        "error": state.get("last_error"),
+        "usage": engine.usage(session_id),
+        "message_count": len(messages),
+        "messages": [msg.to_dict() for msg in messages[since:]],
+    }
+
+
+def _engine_metrics(engine: ConversationEngine) -> str:
+    stats = engine.stats()
+    return (
+        "# HELP travel_requests_total Turn and follow-up requests that ran.\n"
+        "# TYPE travel_requests_total counter\n"
+        f"travel_requests_total {stats['requests']}\n"
+        "# HELP travel_coalesced_requests_total Duplicate requests answered with another request's result.\n"
+        "# TYPE travel_coalesced_requests_total counter\n"
+        f"travel_coalesced_requests_total {stats['coalesced']}\n"
+        "# HELP travel_sessions Sessions held in memory.\n"
+        "# TYPE travel_sessions gauge\n"
+        f"travel_sessions {stats['sessions']}\n"
+        "# HELP travel_speculations_total Speculative follow-up turns by outcome.\n"
+        "# TYPE travel_speculations_total counter\n"
+        + "".join(f'travel_speculations_total{{outcome="{outcome}"}} {count}\n'
+                  for outcome, count in stats["speculation"].items()
+                  if outcome not in ("in_flight", "tokens_last_hour", "tokens_reserved"))
+    )
+
+
+def _json_body(payload: Any) -> bytes:
+    return json.dumps(payload, ensure_ascii=False, default=str).encode("utf-8")
+
+
+def _sse(event: str, payload: Any) -> bytes:
+    return f"event: {event}\ndata: {json.dumps(payload, ensure_ascii=False, default=str)}\n\n".encode("utf-8")
+
+
+# --- ASGI plumbing ---
+async def _read_json(receive) -> Dict[str, Any]:
+    chunks: List[bytes] = []
+    size = 0
+    while True:
+        message = await receive()
+        chunk = message.get("body", b"")
+        size += len(chunk)
+        if size > MAX_BODY_BYTES:
+            raise HTTPError(413, "Request body too large")
+        chunks.append(chunk)
+        if not message.get("more_body"):
+            break
+    if not size:
+        return {}
+    try:
+        body = json.loads(b"".join(chunks))
+    except ValueError:
+        raise HTTPError(400, "Request body must be JSON")
+    if not isinstance(body, dict):
+        raise HTTPError(400, "Request body must be a JSON object")
+    return body
+
+
+async def _respond(send, status: int, payload: Any = None):
+    body = b"" if payload is None else _json_body(payload)
+    headers = [(b"content-type", b"application/json")] if payload is not None else []
+    await send({"type": "http.response.start", "status": status, "headers": headers})
+    await send({"type": "http.response.body", "body": body})
+
+
+async def _respond_text(send, status: int, text: str, content_type: bytes = b"text/plain; charset=utf-8"):
+    await send({"type": "http.response.start", "status": status, "headers": [(b"content-type", content_type)]})
+    await send({"type": "http.response.body", "body": text.encode("utf-8")})
+
+
+def _text(body: Dict[str, Any]) -> str:
+    text = body.get("text")
+    if not isinstance(text, str) or not text.strip():
+        raise HTTPError(422, "'text' must be a non-empty string")
+    return text
+
+
+def _version(body: Dict[str, Any]) -> Optional[int]:
+    version = body.get("version")
+    if version is not None and (not isinstance(version, int) or isinstance(version, bool)):
+        raise HTTPError(422, "'version' must be an integer")
+    return version
+
+
+def _budget(body: Dict[str, Any]) -> Tuple[Optional[int], Optional[str]]:
+    budget = body.get("token_budget")
+    action = body.get("budget_action")
+    if budget is not None and (not isinstance(budget, int) or isinstance(budget, bool) or budget < 0):
+        raise HTTPError(422, "'token_budget' must be a non-negative integer")
+    if action is not None and action not in BUDGET_ACTIONS:
+        raise HTTPError(422, f"'budget_action' must be one of: {', '.join(BUDGET_ACTIONS)}")
+    return budget, action
+
+
+def _route(method: str, path: str) -> Tuple[str, Optional[str]]:
+    if path == "/metrics":
+        if method != "GET":
+            raise HTTPError(405, "Method not allowed")
+        return "metrics", None
+    if path == "/sessions":
+        if method != "POST":
+            raise HTTPError(405, "Method not allowed")
+        return "create", None
+    match = _SESSION_RE.match(path)
+    if match is None:
+        raise HTTPError(404, "Not found")
+    session_id, action = match.groups()
+    routes = {
+        (None, "GET"): "get",
+        (None, "DELETE"): "delete",
+        ("/turns", "POST"): "turn",
+        ("/turns/stream", "POST"): "stream",
+        ("/follow-up", "POST"): "follow_up",
+    }
+    name = routes.get((action, method))
+    if name is None:
+        raise HTTPError(405, "Method not allowed")
+    return name, session_id
+
+
+async def _stream_turn(send, engine: ConversationEngine, session_id: str, text: str, version: Optional[int]):
+    before = len(engine.state(session_id)["messages"])
+    await send({
+        "type": "http.response.start",
+        "status": 200,
+        "headers": [(b"content-type", b"text/event-stream"), (b"cache-control", b"no-cache")],
+    })
+    async for token in engine.astream_turn(session_id, text, version):
+        await send({"type": "http.response.body", "body": _sse("token", {"text": token}), "more_body": True})
+    await send({"type": "http.response.body", "body": _sse("done", snapshot(engine, session_id, before))})
+
+
+async def handle_http(scope, receive, send, engine: ConversationEngine):
+    try:
+        name, session_id = _route(scope["method"], scope["path"])
+        body = await _read_json(receive) if scope["method"] == "POST" else {}
+
+        if name == "metrics":
+            metrics = (render_metrics() + render_usage_metrics() + render_resilience_metrics()
+                       + render_cancellation_metrics() + render_scheduler_metrics()
+                       + _engine_metrics(engine))
+            return await _respond_text(send, 200, metrics, b"text/plain; version=0.0.4; charset=utf-8")
+        if name == "create":
+            budget, action = _budget(body)
+            session_id = engine.create_session()
+            if budget is not None or action is not None:
+                engine.set_token_budget(session_id, budget or 0, action)
+            return await _respond(send, 201, snapshot(engine, session_id))
+
+        try:
+            engine.session(session_id)
+        except KeyError:
+            raise HTTPError(404, "Unknown session")
+        if name == "get":
+            since = parse_qs(scope.get("query_string", b"").decode()).get("since", ["0"])[0]
+            return await _respond(send, 200, snapshot(engine, session_id, int(since) if since.isdigit() else 0))
+        if name == "delete":
+            engine.close(session_id)
+            return await _respond(send, 204)
+        if name == "turn":
+            text = _text(body)
+            before = len(engine.state(session_id)["messages"])
+            await engine.aturn(session_id, text, version=_version(body))
+            return await _respond(send, 200, snapshot(engine, session_id, before))
+        if name == "stream":
+            return await _stream_turn(send, engine, session_id, _text(body), _version(body))
+        if name == "follow_up":
+            before = len(engine.state(session_id)["messages"])
+            if body.get("accept"):
+                await engine.aaccept_follow_up(session_id, version=_version(body))
+            else:
+                await engine.adecline_follow_up(session_id, version=_version(body))
+            return await _respond(send, 200, snapshot(engine, session_id, before))
+    except HTTPError as e:
+        await _respond(send, e.status, {"detail": e.detail})
+
+
+async def app(scope, receive, send):
+    """ASGI entry point"""
+    if scope["type"] == "lifespan":
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+    elif scope["type"] == "http":
+        await handle_http(scope, receive, send, get_engine())
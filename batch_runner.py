@@ -0,0 +1,285 @@
+# Offline batch runner: replays recorded conversations from a JSONL file through the booking
+# engine (agents/engine.py) without the UI, and writes every finished conversation, with its
+# transcript and booking_info, as one JSON line.
+#
+#   python batch_runner.py conversations.jsonl -o results.jsonl
+#   python batch_runner.py conversations.jsonl -o results.jsonl --mode async --workers 32
+#   LLM_BACKEND=local python batch_runner.py requests.jsonl -o /tmp/results.jsonl --workers 4
+#
+# Each input line is one conversation:
+#   {"id": "c1", "turns": ["I need a flight", "from Pune to Goa tomorrow", {"follow_up": false}]}
+# A turn is a user message, or {"follow_up": true|false} to answer the offer of the other service.
+# Lines without "turns" are replayed as a single message taken from "text" or "body", so the
+# backlog-style requests.jsonl can be replayed as it is.
+#
+# The file is streamed: only a few conversations per worker are held at a time, and results are
+# written in the order they finish. LLM calls run at the scheduler's "batch" priority, behind
+# interactive users sharing the same keys. Sessions live only until their result is written, so
+# they are not persisted unless SESSION_STORE is set. Throughput is reported on stderr at the end.
+
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, as_completed, wait
+from typing import Any, Callable, Dict, Iterator, Optional, Set, Tuple
+
+os.environ.setdefault("SPECULATIVE_FOLLOW_UP", "0")  # replayed follow-ups are answered right away
+os.environ.setdefault("SESSION_STORE", "none")  # sessions are closed with their result; workers don't share a database
+
+from agents.engine import ConversationEngine, get_engine, is_complete
+from agents.scheduler import get_scheduler, priority_scope
+
+# --- Batch settings ---
+WORKERS = int(os.environ.get("BATCH_WORKERS", str(os.cpu_count() or 4)))  # processes, or conversations in async mode
+READ_AHEAD = int(os.environ.get("BATCH_READ_AHEAD", "2"))  # conversations queued per worker
+
+
+# --- Input ---
+def read_conversations(path: str) -> Iterator[Dict[str, Any]]:
+    """Conversations of a JSONL file, read one line at a time; "-" reads stdin"""
+    f = sys.stdin if path == "-" else open(path, encoding="utf-8")
+    try:
+        for number, line in enumerate(f, 1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError as e:
+                yield {"id": f"line-{number}", "line": number, "turns": [], "error": f"invalid JSON: {e}"}
+                continue
+            yield conversation_of(record, number)
+    finally:
+        if f is not sys.stdin:
+            f.close()
+
+
+def conversation_of(record: Dict[str, Any], number: int) -> Dict[str, Any]:
+    turns = record.get("turns") or record.get("messages")
+    if turns is None:
+        text = record.get("text") or record.get("body")
+        turns = [text] if text else []
+    conversation_id = record.get("id") or record.get("conversation_id") or record.get("request_id") or f"line-{number}"
+    return {"id": str(conversation_id), "line": number, "turns": turns}
+
+
+def _action(turn: Any) -> Tuple[str, Any]:
+    """("turn", text), ("follow_up", accept), or ("skip", None) for recorded assistant messages"""
+    if isinstance(turn, dict):
+        if "follow_up" in turn:
+            return "follow_up", bool(turn["follow_up"])
+        if turn.get("role", "user") != "user":
+            return "skip", None
+        return "turn", str(turn.get("text") or turn.get("content") or "")
+    return "turn", str(turn)
+
+
+# --- Running conversations ---
+def _result(conversation: Dict[str, Any], engine: Optional[ConversationEngine] = None,
+            session_id: Optional[str] = None, turns: int = 0, seconds: float = 0.0,
+            error: Optional[str] = None) -> Dict[str, Any]:
+    result: Dict[str, Any] = {
+        "id": conversation["id"],
+        "line": conversation["line"],
+        "ok": error is None,
+        "error": error,
+        "turns": turns,
+        "seconds": round(seconds, 4),
+    }
+    if session_id is not None:
+        state = engine.state(session_id)
+        result.update(
+            conversation_stage=state["conversation_stage"],
+            complete=is_complete(state),
+            booking_info=state["booking_info"],
+            last_error=state.get("last_error"),
+            usage=engine.usage(session_id),
+            transcript=[msg.to_dict() for msg in state["messages"]],
+        )
+    return result
+
+
+def run_conversation(engine: ConversationEngine, conversation: Dict[str, Any]) -> Dict[str, Any]:
+    """Replay one conversation in a fresh session and return its result line"""
+    if conversation.get("error"):
+        return _result(conversation, error=conversation["error"])
+    started = time.perf_counter()
+    session_id = engine.create_session()
+    turns = 0
+    error = None
+    try:
+        with priority_scope("batch"):
+            for kind, value in map(_action, conversation["turns"]):
+                if kind == "turn":
+                    engine.turn(session_id, value)
+                elif kind == "follow_up" and engine.follow_up(session_id):
+                    if value:
+                        engine.accept_follow_up(session_id)
+                    else:
+                        engine.decline_follow_up(session_id)
+                else:
+                    continue
+                turns += 1
+    except Exception as e:
+        error = f"{type(e).__name__}: {e}"
+    try:
+        return _result(conversation, engine, session_id, turns, time.perf_counter() - started, error)
+    finally:
+        engine.close(session_id)
+
+
+async def arun_conversation(engine: ConversationEngine, conversation: Dict[str, Any]) -> Dict[str, Any]:
+    if conversation.get("error"):
+        return _result(conversation, error=conversation["error"])
+    started = time.perf_counter()
+    session_id = engine.create_session()
+    turns = 0
+    error = None
+    try:
+        with priority_scope("batch"):
+            for kind, value in map(_action, conversation["turns"]):
+                if kind == "turn":
+                    await engine.aturn(session_id, value)
+                elif kind == "follow_up" and engine.follow_up(session_id):
+                    if value:
+                        await engine.aaccept_follow_up(session_id)
+                    else:
+                        await engine.adecline_follow_up(session_id)
+                else:
+                    continue
+                turns += 1
+    except Exception as e:
+        error = f"{type(e).__name__}: {e}"
+    try:
+        return _result(conversation, engine, session_id, turns, time.perf_counter() - started, error)
+    finally:
+        engine.close(session_id)
+
+
+# --- Worker pools ---
+def _init_worker(processes: int):
+    # Each process has its own scheduler; the per-key rate limits are split between them
+    scheduler = get_scheduler()
+    scheduler.rpm /= processes
+    scheduler.tpm /= processes
+
+
+def _run_in_worker(conversation: Dict[str, Any]) -> Dict[str, Any]:
+    return run_conversation(get_engine(), conversation)
+
+
+def run_processes(conversations: Iterator[Dict[str, Any]], processes: int, write: Callable[[Dict[str, Any]], None]):
+    """Replay conversations on a process pool, never submitting more than READ_AHEAD per process"""
+    with ProcessPoolExecutor(processes, initializer=_init_worker, initargs=(processes,)) as pool:
+        pending: Set[Future] = set()
+        for conversation in conversations:
+            if len(pending) >= processes * READ_AHEAD:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    write(future.result())
+            pending.add(pool.submit(_run_in_worker, conversation))
+        for future in as_completed(pending):
+            write(future.result())
+
+
+async def run_async(conversations: Iterator[Dict[str, Any]], workers: int, write: Callable[[Dict[str, Any]], None]):
+    """Replay conversations in this process, `workers` at a time, fed through a bounded queue"""
+    engine = get_engine()
+    queue: "asyncio.Queue[Optional[Dict[str, Any]]]" = asyncio.Queue(workers * READ_AHEAD)
+
+    async def worker():
+        while True:
+            conversation = await queue.get()
+            if conversation is None:
+                return
+            write(await arun_conversation(engine, conversation))
+
+    tasks = [asyncio.create_task(worker()) for _ in range(workers)]
+    for conversation in conversations:
+        await queue.put(conversation)
+    for _ in tasks:
+        await queue.put(None)
+    await asyncio.gather(*tasks)
+
+
+# --- Report ---
+class BatchReport:
+    """Running totals of a batch; constant memory however many conversations pass through"""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.conversations = 0
+        self.failed = 0
+        self.completed = 0
+        self.turns = 0
+        self.tokens = 0
+        self.conversation_seconds = 0.0
+        self.slowest = 0.0
+
+    def add(self, result: Dict[str, Any]):
+        self.conversations += 1
+        self.failed += not result["ok"]
+        self.completed += bool(result.get("complete"))
+        self.turns += result["turns"]
+        self.tokens += result.get("usage", {}).get("total_tokens", 0)
+        self.conversation_seconds += result["seconds"]
+        self.slowest = max(self.slowest, result["seconds"])
+
+    def summary(self) -> Dict[str, Any]:
+        elapsed = time.perf_counter() - self.started
+        return {
+            "conversations": self.conversations,
+            "failed": self.failed,
+            "completed_bookings": self.completed,
+            "turns": self.turns,
+            "total_tokens": self.tokens,
+            "elapsed_seconds": round(elapsed, 3),
+            "conversations_per_second": round(self.conversations / elapsed, 3) if elapsed else 0.0,
+            "turns_per_second": round(self.turns / elapsed, 3) if elapsed else 0.0,
+            "tokens_per_second": round(self.tokens / elapsed, 1) if elapsed else 0.0,
+            "avg_conversation_seconds": round(self.conversation_seconds / self.conversations, 4)
+            if self.conversations else 0.0,
+            "slowest_conversation_seconds": round(self.slowest, 4),
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay JSONL conversations through the booking engine")
+    parser.add_argument("input", help='JSONL file of conversations ("-" for stdin)')
+    parser.add_argument("-o", "--output", default="-", help='JSONL file of results (default "-": stdout)')
+    parser.add_argument("--mode", choices=("process", "async"), default="process",
+                        help="a pool of worker processes, or concurrent async conversations in this process")
+    parser.add_argument("--workers", type=int, default=WORKERS, help="processes, or concurrent conversations")
+    parser.add_argument("--report", help="also write the throughput report to this JSON file")
+    args = parser.parse_args()
+
+    report = BatchReport()
+    out = sys.stdout if args.output == "-" else open(args.output, "w", encoding="utf-8")
+
+    def write(result: Dict[str, Any]):
+        out.write(json.dumps(result, default=str) + "\n")
+        out.flush()
+        report.add(result)
+
+    try:
+        conversations = read_conversations(args.input)
+        if args.mode == "async":
+            asyncio.run(run_async(conversations, args.workers, write))
+        else:
+            run_processes(conversations, args.workers, write)
+    finally:
+        if out is not sys.stdout:
+            out.close()
+
+    summary = report.summary()
+    print(json.dumps(summary, indent=2), file=sys.stderr)
+    if args.report:
+        with open(args.report, "w") as f:
+            json.dump(summary, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,134 @@
+# benchmarks/bench_flight_schedule.py
+"""Load time, index size and query latency of the flight schedule index (agents/flight_schedule.py).
+
+Writes a synthetic OAG-style schedule (recurring flights between a set of
+airports) to a temporary CSV, loads it, and times random route/date searches
+with and without a departure-time window:
+
+    python benchmarks/bench_flight_schedule.py
+    python benchmarks/bench_flight_schedule.py --airports 200 --flights 50000 --queries 200000
+
+Needs no third-party packages.
+"""
+import os
+import sys
+import csv
+import json
+import time
+import random
+import argparse
+import platform
+import tempfile
+import subprocess
+from datetime import date, datetime, timedelta
+from typing import Any, Dict, List
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from agents.flight_schedule import PERIODS, load_schedule
+
+RESULTS_DIR = os.path.join(ROOT, "benchmarks", "results")
+CARRIERS = ["6E", "AI", "UK", "SG", "QP", "IX"]
+
+
+# --- Synthetic schedule ---
+def write_schedule(path: str, airports: int, flights: int, seed: int):
+    rng = random.Random(seed)
+    codes = [f"{chr(65 + i // 676 % 26)}{chr(65 + i // 26 % 26)}{chr(65 + i % 26)}" for i in range(airports)]
+    with open(path, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["carrier", "flight_number", "origin", "origin_city", "destination", "destination_city",
+                         "departure", "arrival", "days", "fare"])
+        for number in range(flights):
+            origin, destination = rng.sample(codes, 2)
+            departure = rng.randrange(24 * 60)
+            arrival = (departure + rng.randrange(45, 300)) % (24 * 60)
+            days = "".join(sorted(rng.sample("1234567", rng.randint(3, 7))))
+            writer.writerow([rng.choice(CARRIERS), 100 + number % 9000, origin, f"City {origin}", destination,
+                             f"City {destination}", f"{departure // 60:02d}:{departure % 60:02d}",
+                             f"{arrival // 60:02d}:{arrival % 60:02d}", days, f"INR {rng.randrange(2500, 15000)}"])
+    return codes
+
+
+# --- Measurement ---
+def percentile(samples: List[float], q: float) -> float:
+    return samples[min(len(samples) - 1, int(len(samples) * q))]
+
+
+def time_queries(schedule: Any, codes: List[str], today: date, horizon: int, queries: int, windowed: bool,
+                 seed: int) -> Dict[str, Any]:
+    rng = random.Random(seed)
+    periods = list(PERIODS.values())
+    latencies: List[float] = []
+    found = 0
+    for _ in range(queries):
+        origin, destination = rng.sample(codes, 2)
+        day = today + timedelta(days=rng.randrange(horizon))
+        earliest, latest = rng.choice(periods) if windowed else (0, 24 * 60)
+        start = time.perf_counter()
+        flights = schedule.search(origin, destination, day, earliest, latest, limit=5)
+        latencies.append(time.perf_counter() - start)
+        found += len(flights)
+    latencies.sort()
+    return {
+        "queries": queries,
+        "p50_us": percentile(latencies, 0.50) * 1e6,
+        "p99_us": percentile(latencies, 0.99) * 1e6,
+        "max_us": latencies[-1] * 1e6,
+        "flights_per_query": found / queries,
+    }
+
+
+def git_revision() -> str:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, text=True).strip()
+    except Exception:
+        return "unknown"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--airports", type=int, default=60, help="airports in the synthetic network")
+    parser.add_argument("--flights", type=int, default=20000, help="recurring flights in the schedule")
+    parser.add_argument("--horizon", type=int, default=90, help="days recurring flights are expanded for")
+    parser.add_argument("--queries", type=int, default=100000, help="searches per configuration")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--output", help="JSON results file (default: benchmarks/results/flight-schedule-<time>.json)")
+    args = parser.parse_args()
+
+    today = date.today()
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "schedule.csv")
+        codes = write_schedule(path, args.airports, args.flights, args.seed)
+        start = time.perf_counter()
+        schedule = load_schedule(path, today, args.horizon)
+        load_seconds = time.perf_counter() - start
+    memory = len(schedule.keys) * schedule.keys.itemsize + len(schedule.legs) * schedule.legs.itemsize
+
+    print(f"loaded {len(schedule)} dated flights in {load_seconds:.2f}s, index {memory / 2 ** 20:.1f} MiB")
+    results: Dict[str, Any] = {"dated_flights": len(schedule), "load_seconds": load_seconds, "memory_bytes": memory}
+    print(f"{'query':<16} {'p50 us':>8} {'p99 us':>8} {'max us':>8} {'flights':>8}")
+    for name, windowed in (("route+date", False), ("route+date+time", True)):
+        result = time_queries(schedule, codes, today, args.horizon, args.queries, windowed, args.seed)
+        results[name] = result
+        print(f"{name:<16} {result['p50_us']:>8.2f} {result['p99_us']:>8.2f} {result['max_us']:>8.1f} "
+              f"{result['flights_per_query']:>8.2f}")
+
+    report = {
+        "benchmark": "flight_schedule",
+        "revision": git_revision(),
+        "created": datetime.now().isoformat(),
+        "python": platform.python_version(),
+        "settings": vars(args),
+        "results": results,
+    }
+    output = args.output or os.path.join(RESULTS_DIR, f"flight-schedule-{datetime.now():%Y%m%d-%H%M%S}.json")
+    os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"\nSaved {output}")
+
+
+if __name__ == "__main__":
+    main()
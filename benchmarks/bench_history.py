@@ -0,0 +1,65 @@
+# benchmarks/bench_history.py
+"""Per-turn cost of rendering the agent prompt history.
+
+Compares the old `history += ...` rebuild with the incremental HistoryBuffer
+as a session grows to thousands of messages:
+
+    python benchmarks/bench_history.py
+"""
+import os
+import sys
+import time
+from typing import Any, Dict, List
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from agents.history import HistoryBuffer
+
+CHECKPOINTS = [10, 100, 1000, 2500, 5000, 10000]
+SAMPLE_TURNS = 20
+
+
+def rebuild_history(messages: List[Dict[str, Any]]) -> str:
+    """The pre-HistoryBuffer implementation, kept here as the baseline"""
+    history = ""
+    for msg in messages:
+        agent_prefix = f"[{msg['agent']}] " if 'agent' in msg else ""
+        history += f"{agent_prefix}{msg['role']}: {msg['content']}\n\n"
+    return history
+
+
+def make_turn(i: int) -> List[Dict[str, Any]]:
+    return [
+        {"role": "user", "content": f"Turn {i}: I'd like to fly from Mumbai to Delhi on the 12th, 2 passengers."},
+        {"role": "assistant", "content": f"Turn {i}: Got it. Which class would you prefer: economy, business or first?"},
+    ]
+
+
+def per_turn_us(render, messages: List[Dict[str, Any]]) -> float:
+    """Average time of SAMPLE_TURNS turns, each adding one exchange and rendering the prompt"""
+    start = time.perf_counter()
+    for i in range(SAMPLE_TURNS):
+        messages.extend(make_turn(len(messages)))
+        render(messages)
+    return (time.perf_counter() - start) / SAMPLE_TURNS * 1e6
+
+
+def main():
+    print(f"{'messages':>10} {'rebuild (us/turn)':>20} {'buffer (us/turn)':>18}")
+    for size in CHECKPOINTS:
+        base = [msg for i in range(size // 2) for msg in make_turn(i)]
+
+        naive_messages = list(base)
+        naive = per_turn_us(rebuild_history, naive_messages)
+
+        buffer = HistoryBuffer()
+        buffered_messages = list(base)
+        buffer.sync(buffered_messages)  # earlier turns were already rendered
+        buffered = per_turn_us(buffer.sync, buffered_messages)
+
+        assert buffer.text == rebuild_history(buffered_messages)
+        print(f"{size:>10} {naive:>20.1f} {buffered:>18.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+# benchmarks/bench_messages.py
+"""Memory and lookup cost of chat message records.
+
+Compares the old per-message dicts (ISO timestamp strings, repeated agent
+names) with the slotted Message records for sessions of growing length:
+
+    python benchmarks/bench_messages.py
+"""
+import os
+import sys
+import time
+import tracemalloc
+from datetime import datetime
+from typing import Any, Callable, List
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from agents.message import Message
+
+CHECKPOINTS = [100, 1000, 10000, 100000]
+AGENTS = ["user", "flight", "user", "supervisor"]
+
+
+def make_dict(i: int) -> dict:
+    return {
+        "agent": AGENTS[i % len(AGENTS)],
+        "content": f"Turn {i}: two passengers from Mumbai to Delhi on the 12th.",
+        "timestamp": datetime.now().isoformat()
+    }
+
+
+def make_message(i: int) -> Message:
+    return Message(AGENTS[i % len(AGENTS)], f"Turn {i}: two passengers from Mumbai to Delhi on the 12th.")
+
+
+def bytes_per_message(make: Callable[[int], Any], size: int) -> float:
+    """Heap growth per message, content strings included (they are the same for both)"""
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    messages = [make(i) for i in range(size)]
+    used = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    del messages
+    return used / size
+
+
+def scan_dicts_us(messages: List[dict]) -> float:
+    """One pass that reads agent and content of every message, as the wrappers do"""
+    start = time.perf_counter()
+    count = sum(1 for msg in messages if msg["agent"] == "flight" and msg["content"])
+    assert count
+    return (time.perf_counter() - start) * 1e6
+
+
+def scan_messages_us(messages: List[Message]) -> float:
+    start = time.perf_counter()
+    count = sum(1 for msg in messages if msg.agent == "flight" and msg.content)
+    assert count
+    return (time.perf_counter() - start) * 1e6
+
+
+def main():
+    print(f"{'messages':>10} {'dict (B/msg)':>14} {'Message (B/msg)':>16} {'dict scan (us)':>15} {'Message scan (us)':>18}")
+    for size in CHECKPOINTS:
+        dict_bytes = bytes_per_message(make_dict, size)
+        message_bytes = bytes_per_message(make_message, size)
+        dicts = [make_dict(i) for i in range(size)]
+        messages = [make_message(i) for i in range(size)]
+        assert [Message.from_dict(d).content for d in dicts] == [m.content for m in messages]
+        print(f"{size:>10} {dict_bytes:>14.0f} {message_bytes:>16.0f} "
+              f"{scan_dicts_us(dicts):>15.0f} {scan_messages_us(messages):>18.0f}")
+
+
+if __name__ == "__main__":
+    main()
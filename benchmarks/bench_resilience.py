@@ -0,0 +1,153 @@
+# benchmarks/bench_resilience.py
+"""Tail latency of LLM calls with and without the resilience layer (agents/resilience.py).
+
+A stub model with a heavy latency tail (most calls fast, a few very slow, some
+failing) is called through ResilientChatModel in several configurations, and
+the p50/p99 latency and the share of failed calls are reported:
+
+    python benchmarks/bench_resilience.py
+    python benchmarks/bench_resilience.py --calls 500 --slow-rate 0.05 --error-rate 0.02
+
+Needs langchain_core but no network access.
+"""
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import platform
+import subprocess
+from datetime import datetime
+from typing import Any, Dict, List
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from langchain_core.messages import AIMessage
+
+from agents import resilience
+from agents.resilience import ResilienceStats, ResilientChatModel
+
+RESULTS_DIR = os.path.join(ROOT, "benchmarks", "results")
+
+
+# --- Stub LLM ---
+class TailChatModel:
+    """Answers after `fast` seconds, or `slow` seconds for a share of calls; some calls fail"""
+
+    def __init__(self, name: str, fast: float, slow: float, slow_rate: float, error_rate: float, seed: int):
+        self.model_name = name
+        self.temperature = 0
+        self.fast = fast
+        self.slow = slow
+        self.slow_rate = slow_rate
+        self.error_rate = error_rate
+        self._random = random.Random(seed)
+
+    def invoke(self, messages, **kwargs):
+        if self._random.random() < self.error_rate:
+            raise ConnectionError("stub connection reset")
+        jitter = self._random.uniform(0.8, 1.2)
+        time.sleep((self.slow if self._random.random() < self.slow_rate else self.fast) * jitter)
+        return AIMessage(content=f"{self.model_name} reply")
+
+
+# --- Measurement ---
+def percentile(samples: List[float], q: float) -> float:
+    return samples[min(len(samples) - 1, int(len(samples) * q))]
+
+
+def measure(model: Any, calls: int, warmup: int) -> Dict[str, Any]:
+    # Hedging only starts once the model's p95 is known, so the first calls are not timed
+    for _ in range(warmup):
+        try:
+            model.invoke([])
+        except Exception:
+            pass
+    latencies: List[float] = []
+    failures = 0
+    for _ in range(calls):
+        start = time.perf_counter()
+        try:
+            model.invoke([])
+        except Exception:
+            failures += 1
+        latencies.append(time.perf_counter() - start)
+    latencies.sort()
+    return {
+        "calls": calls,
+        "p50_ms": percentile(latencies, 0.50) * 1000,
+        "p95_ms": percentile(latencies, 0.95) * 1000,
+        "p99_ms": percentile(latencies, 0.99) * 1000,
+        "failure_rate": failures / calls,
+    }
+
+
+def git_revision() -> str:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, text=True).strip()
+    except Exception:
+        return "unknown"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--calls", type=int, default=300, help="calls per configuration")
+    parser.add_argument("--fast", type=float, default=0.02, help="typical latency in seconds")
+    parser.add_argument("--warmup", type=int, default=resilience.HEDGE_MIN_SAMPLES, help="untimed calls first")
+    parser.add_argument("--slow", type=float, default=1.0, help="latency of the slow tail in seconds")
+    parser.add_argument("--slow-rate", type=float, default=0.03, help="share of slow calls")
+    parser.add_argument("--error-rate", type=float, default=0.02, help="share of failing calls")
+    parser.add_argument("--timeout", type=float, default=0.25, help="per-attempt timeout of the timeout configurations")
+    parser.add_argument("--output", help="JSON results file (default: benchmarks/results/resilience-<time>.json)")
+    args = parser.parse_args()
+    resilience.RETRY_BASE_DELAY = 0.01  # keep the backoff from dominating a short run
+
+    def primary(seed: int) -> TailChatModel:
+        return TailChatModel("primary", args.fast, args.slow, args.slow_rate, args.error_rate, seed)
+
+    def fallback(seed: int) -> TailChatModel:
+        # The smaller model: faster, with a thinner tail
+        return TailChatModel("fallback", args.fast / 2, args.slow / 4, args.slow_rate / 2, args.error_rate, seed)
+
+    configurations = {
+        "plain": lambda: primary(1),
+        "retries": lambda: ResilientChatModel(primary(1), None, timeout=0, stats=ResilienceStats()),
+        "timeout+retries": lambda: ResilientChatModel(primary(1), None, timeout=args.timeout, stats=ResilienceStats()),
+        "timeout+fallback": lambda: ResilientChatModel(primary(1), fallback(2), timeout=args.timeout, max_retries=0,
+                                                       stats=ResilienceStats()),
+        "hedged": lambda: ResilientChatModel(primary(1), None, timeout=0, hedge=True, stats=ResilienceStats()),
+        "hedged+timeout+fallback": lambda: ResilientChatModel(primary(1), fallback(2), timeout=args.timeout,
+                                                              hedge=True, stats=ResilienceStats()),
+    }
+    results: Dict[str, Any] = {}
+    print(f"{'configuration':<24} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'failed':>7}  events")
+    for name, build in configurations.items():
+        model = build()
+        result = measure(model, args.calls, args.warmup)
+        if isinstance(model, ResilientChatModel):
+            result["events"] = model.stats.snapshot()
+        results[name] = result
+        events = ", ".join(f"{model_name}: " + " ".join(f"{event}={count}" for event, count in counts.items() if count)
+                           for model_name, counts in result.get("events", {}).items())
+        print(f"{name:<24} {result['p50_ms']:>8.1f} {result['p95_ms']:>8.1f} {result['p99_ms']:>8.1f} "
+              f"{result['failure_rate']:>7.1%}  {events}")
+
+    report = {
+        "benchmark": "resilience",
+        "revision": git_revision(),
+        "created": datetime.now().isoformat(),
+        "python": platform.python_version(),
+        "settings": vars(args),
+        "results": results,
+    }
+    output = args.output or os.path.join(RESULTS_DIR, f"resilience-{datetime.now():%Y%m%d-%H%M%S}.json")
+    os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"\nSaved {output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,218 @@
+# benchmarks/bench_supervisor.py
+"""Time spent by supervisor() and the safe_*_agent wrappers outside the LLM call.
+
+Drives the functions from main1.py with a zero-latency stub LLM over synthetic
+histories and reports per-turn wall time, allocations and peak memory:
+
+    python benchmarks/bench_supervisor.py
+    python benchmarks/bench_supervisor.py --sizes 10 100 --compare benchmarks/results/old.json
+
+Needs the app's dependencies (streamlit, langchain) but no network access.
+"""
+import os
+import sys
+import copy
+import json
+import time
+import argparse
+import platform
+import statistics
+import subprocess
+import tracemalloc
+from datetime import datetime
+from typing import Any, Callable, Dict, List
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.environ.setdefault("LLM_CACHE_PATH", "")  # keep the response cache in memory only
+
+from langchain_core.messages import AIMessage, AIMessageChunk
+
+from agents.backends import LLMBackend, set_backend
+from agents.message_store import MessageStore
+
+DEFAULT_SIZES = [10, 100, 1000, 10000]
+RESULTS_DIR = os.path.join(ROOT, "benchmarks", "results")
+
+
+# --- Stub LLM ---
+class StubChatModel:
+    """Answers instantly with a fresh (never duplicate) reply and tracks time spent inside it"""
+
+    def __init__(self, model: str, temperature: float):
+        self.model_name = f"stub:{model}"
+        # Every repeat sends the same prompt, which the response cache would answer from
+        # memory; a non-zero temperature keeps the cache out of the measurement
+        self.temperature = temperature if temperature else None
+        self.calls = 0
+        self.seconds = 0.0
+
+    def _reply(self) -> str:
+        self.calls += 1
+        return f"Stub reply {self.calls}: which date would you like to travel?"
+
+    def invoke(self, messages, **kwargs):
+        start = time.perf_counter()
+        message = AIMessage(content=self._reply())
+        self.seconds += time.perf_counter() - start
+        return message
+
+    async def ainvoke(self, messages, **kwargs):
+        return self.invoke(messages, **kwargs)
+
+    def stream(self, messages, **kwargs):
+        yield AIMessageChunk(content=self._reply())
+
+    async def astream(self, messages, **kwargs):
+        yield AIMessageChunk(content=self._reply())
+
+
+class StubBackend(LLMBackend):
+    name = "stub"
+
+    def __init__(self):
+        self.models: List[StubChatModel] = []
+
+    def create_chat_model(self, model: str, temperature: float) -> StubChatModel:
+        self.models.append(StubChatModel(model, temperature))
+        return self.models[-1]
+
+    def llm_seconds(self) -> float:
+        return sum(model.seconds for model in self.models)
+
+
+# --- Synthetic sessions ---
+def synthetic_state(size: int, service: str) -> Dict[str, Any]:
+    """A session of `size` messages in the middle of a flight or cab booking"""
+    messages = MessageStore([{
+        "agent": "user",
+        "content": f"I want to book {service}",
+        "timestamp": datetime.now().isoformat()
+    }])
+    for i in range(1, size):
+        if i % 2:
+            messages.append({
+                "agent": service,
+                "content": f"Turn {i}: could you tell me the pickup point, date and number of passengers?",
+                "timestamp": datetime.now().isoformat()
+            })
+        else:
+            messages.append({
+                "agent": "user",
+                "content": f"Turn {i}: two passengers, from the city centre, on the 12th in the morning.",
+                "timestamp": datetime.now().isoformat()
+            })
+    return {
+        "messages": messages,
+        "current_agent": f"{service}_agent",
+        "booking_info": {"flight": {}, "cab": {}},
+        "user_input": "Two passengers please.",
+        "conversation_stage": f"{service}_booking"
+    }
+
+
+# --- Measurement ---
+def measure(fn: Callable[[Dict[str, Any]], Any], template: Dict[str, Any], repeat: int,
+            backend: StubBackend) -> Dict[str, Any]:
+    states = [copy.deepcopy(template) for _ in range(repeat)]
+    wall: List[float] = []
+    llm: List[float] = []
+    for state in states:
+        llm_before = backend.llm_seconds()
+        start = time.perf_counter()
+        fn(state)
+        wall.append(time.perf_counter() - start)
+        llm.append(backend.llm_seconds() - llm_before)
+
+    # Allocations are measured on a separate turn so tracing does not skew the timings
+    state = copy.deepcopy(template)
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    tracemalloc.reset_peak()
+    fn(state)
+    _, peak = tracemalloc.get_traced_memory()
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    diff = after.compare_to(before, "filename")
+    allocated_blocks = sum(stat.count_diff for stat in diff if stat.count_diff > 0)
+    allocated_bytes = sum(stat.size_diff for stat in diff if stat.size_diff > 0)
+
+    overhead = sorted(w - l for w, l in zip(wall, llm))
+    return {
+        "turns": repeat,
+        "wall_us_median": statistics.median(wall) * 1e6,
+        "overhead_us_median": statistics.median(overhead) * 1e6,
+        "overhead_us_p95": overhead[min(len(overhead) - 1, int(len(overhead) * 0.95))] * 1e6,
+        "llm_us_median": statistics.median(llm) * 1e6,
+        "allocated_blocks": allocated_blocks,
+        "allocated_bytes": allocated_bytes,
+        "peak_bytes": peak,
+    }
+
+
+def git_revision() -> str:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, text=True).strip()
+    except Exception:
+        return "unknown"
+
+
+def compare(current: Dict[str, Any], baseline_path: str):
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+    print(f"\nChange vs {baseline_path} ({baseline.get('revision')}):")
+    for key, result in current["results"].items():
+        old = baseline["results"].get(key)
+        if not old:
+            continue
+        before, after = old["overhead_us_median"], result["overhead_us_median"]
+        change = (after - before) / before * 100 if before else 0.0
+        print(f"  {key:<28} {before:>12.1f} -> {after:>12.1f} us  ({change:+.1f}%)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES, help="history sizes in messages")
+    parser.add_argument("--repeat", type=int, default=20, help="timed turns per function and size")
+    parser.add_argument("--output", help="JSON results file (default: benchmarks/results/supervisor-<time>.json)")
+    parser.add_argument("--compare", help="earlier results file to compare against")
+    args = parser.parse_args()
+
+    backend = StubBackend()
+    set_backend(backend)
+    import main1  # after the backend switch; importing runs Streamlit in bare mode
+
+    targets = {
+        "supervisor": (main1.supervisor, "flight"),
+        "safe_flight_agent": (main1.safe_flight_agent, "flight"),
+        "safe_cab_agent": (main1.safe_cab_agent, "cab"),
+    }
+    results: Dict[str, Any] = {}
+    print(f"{'function':<20} {'messages':>8} {'overhead us':>12} {'p95 us':>10} {'alloc blocks':>13} {'peak KiB':>9}")
+    for size in args.sizes:
+        for name, (fn, service) in targets.items():
+            result = measure(fn, synthetic_state(size, service), args.repeat, backend)
+            results[f"{name}@{size}"] = dict(result, function=name, messages=size)
+            print(f"{name:<20} {size:>8} {result['overhead_us_median']:>12.1f} {result['overhead_us_p95']:>10.1f} "
+                  f"{result['allocated_blocks']:>13} {result['peak_bytes'] / 1024:>9.1f}")
+
+    report = {
+        "benchmark": "supervisor",
+        "revision": git_revision(),
+        "created": datetime.now().isoformat(),
+        "python": platform.python_version(),
+        "repeat": args.repeat,
+        "results": results,
+    }
+    output = args.output or os.path.join(RESULTS_DIR, f"supervisor-{datetime.now():%Y%m%d-%H%M%S}.json")
+    os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"\nSaved {output}")
+
+    if args.compare:
+        compare(report, args.compare)
+
+
+if __name__ == "__main__":
+    main()
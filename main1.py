@@ -2,390 +2,19 @@
 
 import streamlit as st
 import os
-from enum import Enum
-from typing import Dict, Any, List
-from datetime import datetime
-import time
+from functools import lru_cache
+from typing import Dict, Any, List, Callable
 
-# Import your actual flight_agent and cab_agent modules
-try:
-    from agents.flight_agent import flight_agent
-    from agents.cab_agent import cab_agent
-    AGENTS_IMPORTED = True
-except ImportError:
-    AGENTS_IMPORTED = False
-    st.error("⚠️ Could not import flight_agent and cab_agent modules. Please ensure they are in your Python path.")
+from agents.message import Message
+from agents.tracing import span
 
-# Wrapper functions to handle message format compatibility
-def safe_flight_agent(state: Dict[str, Any]) -> Dict[str, Any]:
-    """Wrapper for flight_agent with error handling and improved conversation flow"""
-    if not AGENTS_IMPORTED:
-        state["messages"].append({
-            "agent": "flight",
-            "content": "Flight agent module not available. Please check your imports.",
-            "timestamp": datetime.now().isoformat()
-        })
-        return state
-    
-    try:
-        # Check if flight booking is already complete by looking for explicit completion message
-        if any(
-            msg.get("agent") == "flight" and msg.get("content") == "BOOKING_COMPLETE"
-            for msg in state.get("messages", [])
-        ):
-            return state
-        
-        agent_state = state.copy()
-        
-        formatted_messages = []
-        system_context = None
-        current_session_started = False
-        
-        # Process conversation history for flight agent
-        for i, msg in enumerate(state.get("messages", [])):
-            if (msg.get("agent") == "user" and 
-                any(keyword in msg.get("content", "").lower() 
-                    for keyword in ["book flight", "flight", "yes, book flight"])):
-                current_session_started = True
-                session_messages = state["messages"][i:]  # Start from the first relevant user input
-                for session_msg in session_messages:
-                    if isinstance(session_msg, dict):
-                        if session_msg.get("agent") == "user":
-                            formatted_messages.append({
-                                "role": "user",
-                                "content": session_msg.get("content", "")
-                            })
-                        elif session_msg.get("agent") == "flight":
-                            formatted_messages.append({
-                                "role": "assistant",
-                                "content": session_msg.get("content", "")
-                            })
-                        elif session_msg.get("agent") == "supervisor":
-                            # Capture supervisor message as system context
-                            system_context = session_msg.get("content", "")
-                break
-        
-        # If no session started, include the latest user input
-        if not current_session_started and state.get("user_input"):
-            formatted_messages.append({
-                "role": "user",
-                "content": state["user_input"]
-            })
-        
-        # Add system context if it exists
-        if system_context:
-            formatted_messages.insert(0, {
-                "role": "system",
-                "content": system_context
-            })
-        
-        agent_state["messages"] = formatted_messages
-        
-        # Call the actual flight agent
-        result_state = flight_agent(agent_state)
-        
-        # Extract only NEW agent messages, skipping duplicates
-        if "messages" in result_state:
-            for msg in result_state["messages"]:
-                if isinstance(msg, dict):
-                    if msg.get("role") == "assistant" or msg.get("agent") == "flight":
-                        content = msg.get("content", "")
-                        if "BOOKING_COMPLETE" in content:
-                            continue
-                        is_duplicate = any(
-                            existing_msg.get("content") == content and existing_msg.get("agent") == "flight"
-                            for existing_msg in state["messages"]
-                        )
-                        
-                        if not is_duplicate and content.strip():
-                            state["messages"].append({
-                                "agent": "flight",
-                                "content": content,
-                                "timestamp": datetime.now().isoformat()
-                            })
-        
-        # Update booking info and check for completion with stricter conditions
-        if (result_state["booking_info"]["flight"].get("status") == "booked" and 
-            any(msg.get("role") == "assistant" and "your flight has been booked" in msg.get("content", "").lower() 
-                for msg in result_state.get("messages", []))):
-            state["booking_info"]["flight"] = result_state["booking_info"]["flight"]
-            is_completion_message_already_added = any(
-                msg.get("content") == "BOOKING_COMPLETE" and msg.get("agent") == "flight"
-                for msg in state["messages"]
-            )
-            if not is_completion_message_already_added:
-                state["messages"].append({
-                    "agent": "flight",
-                    "content": "BOOKING_COMPLETE",
-                    "timestamp": datetime.now().isoformat()
-                })
-        
-        return state
-        
-    except Exception as e:
-        st.error(f"Error in flight_agent: {str(e)}")
-        state["messages"].append({
-            "agent": "flight",
-            "content": f"Sorry, I encountered an error: {str(e)}. Please try again.",
-            "timestamp": datetime.now().isoformat()
-        })
-        return state
+# The booking flow lives in agents/engine.py; this app is one client of it (api.py is another)
+from agents.engine import AGENTS_IMPORTED, AgentState, get_engine, is_complete
 
-def safe_cab_agent(state: Dict[str, Any]) -> Dict[str, Any]:
-    if not AGENTS_IMPORTED:
-        state["messages"].append({
-            "agent": "cab",
-            "content": "Cab agent module not available. Please check your imports.",
-            "timestamp": datetime.now().isoformat()
-        })
-        return state
-    
-    try:
-        # Check if cab booking is already complete by looking for explicit completion message
-        if any(
-            msg.get("agent") == "cab" and msg.get("content") == "BOOKING_COMPLETE"
-            for msg in state.get("messages", [])
-        ):
-            return state
-        
-        agent_state = state.copy()
-        
-        formatted_messages = []
-        system_context = None
-        current_session_started = False
-        
-        # Process conversation history for cab agent
-        for i, msg in enumerate(state.get("messages", [])):
-            if (msg.get("agent") == "user" and 
-                any(keyword in msg.get("content", "").lower() 
-                    for keyword in ["book cab", "cab", "taxi", "yes, book cab"])):
-                current_session_started = True
-                session_messages = state["messages"][i:]
-                for session_msg in session_messages:
-                    if isinstance(session_msg, dict):
-                        if session_msg.get("agent") == "user":
-                            formatted_messages.append({
-                                "role": "user",
-                                "content": session_msg.get("content", "")
-                            })
-                        elif session_msg.get("agent") == "cab":
-                            formatted_messages.append({
-                                "role": "assistant",
-                                "content": session_msg.get("content", "")
-                            })
-                        elif session_msg.get("agent") == "supervisor":
-                            system_context = session_msg.get("content", "")
-                break
-        
-        if not current_session_started and state.get("user_input"):
-            formatted_messages.append({
-                "role": "user",
-                "content": state["user_input"]
-            })
-        
-        if system_context:
-            formatted_messages.insert(0, {
-                "role": "system",
-                "content": system_context
-            })
-        
-        agent_state["messages"] = formatted_messages
-        
-        # Call the actual cab agent
-        result_state = cab_agent(agent_state)
-        
-        # Extract only NEW agent messages, skipping duplicates
-        if "messages" in result_state:
-            for msg in result_state["messages"]:
-                if isinstance(msg, dict):
-                    if msg.get("role") == "assistant" or msg.get("agent") == "cab":
-                        content = msg.get("content", "")
-                        if "BOOKING_COMPLETE" in content:
-                            continue
-                        is_duplicate = any(
-                            existing_msg.get("content") == content and existing_msg.get("agent") == "cab"
-                            for existing_msg in state["messages"]
-                        )
-                        
-                        if not is_duplicate and content.strip():
-                            state["messages"].append({
-                                "agent": "cab",
-                                "content": content,
-                                "timestamp": datetime.now().isoformat()
-                            })
-        
-        # Update booking info and check for confirmation before marking as complete
-        if "cab" in result_state["booking_info"]:
-            # Check if the cab agent is waiting for confirmation
-            if (result_state["booking_info"]["cab"].get("status") == "pending_confirmation" and 
-                any(msg.get("role") == "assistant" and "to confirm" in msg.get("content", "").lower() 
-                    for msg in result_state.get("messages", []))):
-                state["booking_info"]["cab"] = result_state["booking_info"]["cab"]
-                # Wait for user confirmation (e.g., "Yes, book it" or "No, I have special requests")
-                last_user_input = state.get("user_input", "").lower()
-                if "yes" in last_user_input or "book it" in last_user_input:
-                    state["booking_info"]["cab"]["status"] = "booked"
-                    state["messages"].append({
-                        "agent": "cab",
-                        "content": "Your cab has been booked successfully!",
-                        "timestamp": datetime.now().isoformat()
-                    })
-                    state["messages"].append({
-                        "agent": "cab",
-                        "content": "BOOKING_COMPLETE",
-                        "timestamp": datetime.now().isoformat()
-                    })
-                elif "no" in last_user_input or "special request" in last_user_input:
-                    state["booking_info"]["cab"]["status"] = "awaiting_special_requests"
-                    state["messages"].append({
-                        "agent": "cab",
-                        "content": "Please provide your special requests, and I'll update the booking accordingly.",
-                        "timestamp": datetime.now().isoformat()
-                    })
-            elif (result_state["booking_info"]["cab"].get("status") == "booked" and 
-                  any(msg.get("role") == "assistant" and "your cab has been booked" in msg.get("content", "").lower() 
-                      for msg in result_state.get("messages", []))):
-                state["booking_info"]["cab"] = result_state["booking_info"]["cab"]
-                is_completion_message_already_added = any(
-                    msg.get("content") == "BOOKING_COMPLETE" and msg.get("agent") == "cab"
-                    for msg in state["messages"]
-                )
-                if not is_completion_message_already_added:
-                    state["messages"].append({
-                        "agent": "cab",
-                        "content": "BOOKING_COMPLETE",
-                        "timestamp": datetime.now().isoformat()
-                    })
-        
-        return state
-        
-    except Exception as e:
-        st.error(f"Error in cab_agent: {str(e)}")
-        state["messages"].append({
-            "agent": "cab",
-            "content": f"Sorry, I encountered an error: {str(e)}. Please try again.",
-            "timestamp": datetime.now().isoformat()
-        })
-        return state
-
-# --- Shared Agent State Enum ---
-class AgentState(str, Enum):
-    FLIGHT_AGENT = "flight_agent"
-    CAB_AGENT = "cab_agent"
-    END = "end"
-
-def supervisor(state: Dict[str, Any]) -> Dict[str, Any]:
-    """Supervisor function to route tasks to appropriate agents and share context"""
-    current_agent = state.get("current_agent")
-    
-    # If we're switching agents, clear any previous agent-specific state
-    if current_agent == AgentState.FLIGHT_AGENT:
-        if "cab_context" in state:
-            del state["cab_context"]
-        
-        # Check if the user has confirmed the follow-up question
-        user_confirmed = any(
-            msg.get("agent") == "user" and msg.get("content", "").lower() == "yes, book flight"
-            for msg in state.get("messages", [])
-        )
-        
-        # Only pass context if user has confirmed the follow-up
-        flight_messages_exist = any(msg.get("agent") == "flight" for msg in state.get("messages", []))
-        if not flight_messages_exist and user_confirmed:
-            # Find the last cab agent message before BOOKING_COMPLETE
-            cab_summary = None
-            for msg in reversed(state.get("messages", [])):
-                if msg.get("agent") == "cab" and msg.get("content") != "BOOKING_COMPLETE":
-                    cab_summary = msg.get("content")
-                    break
-            
-            if cab_summary:
-                # Craft a message for the flight agent with the cab summary and user input
-                last_user_input = state.get("user_input", "book flight")
-                supervisor_message = (
-                    f"The user wants to book a flight: '{last_user_input}'. They have just completed a cab booking. Here are the details:\n\n"
-                    f"{cab_summary}\n\n"
-                    f"Please assist the user in booking a flight based on this cab information. "
-                    f"For example, suggest a flight that aligns with the cab's pickup or drop-off location and time."
-                )
-                state["messages"].append({
-                    "agent": "supervisor",
-                    "content": supervisor_message,
-                    "timestamp": datetime.now().isoformat()
-                })
-            else:
-                # Fallback if no cab summary is found
-                supervisor_message = (
-                    f"The user wants to book a flight: '{last_user_input}'. I don't have prior cab booking details. "
-                    f"Please assist them with the booking process by asking for their origin, destination, and preferred travel date and time."
-                )
-                state["messages"].append({
-                    "agent": "supervisor",
-                    "content": supervisor_message,
-                    "timestamp": datetime.now().isoformat()
-                })
-        
-        state = safe_flight_agent(state)
-        
-    elif current_agent == AgentState.CAB_AGENT:
-        if "flight_context" in state:
-            del state["flight_context"]
-        
-        # Check if the user has confirmed the follow-up question
-        user_confirmed = any(
-            msg.get("agent") == "user" and msg.get("content", "").lower() == "yes, book cab"
-            for msg in state.get("messages", [])
-        )
-        
-        # Only pass context if user has confirmed the follow-up
-        cab_messages_exist = any(msg.get("agent") == "cab" for msg in state.get("messages", []))
-        if not cab_messages_exist and user_confirmed:
-            # Find the last flight agent message before BOOKING_COMPLETE
-            flight_summary = None
-            for msg in reversed(state.get("messages", [])):
-                if msg.get("agent") == "flight" and msg.get("content") != "BOOKING_COMPLETE":
-                    flight_summary = msg.get("content")
-                    break
-            
-            if flight_summary:
-                # Craft a message for the cab agent with the flight summary and user input
-                last_user_input = state.get("user_input", "book cab")
-                supervisor_message = (
-                    f"The user wants to book a cab: '{last_user_input}'. They have just completed a flight booking. Here are the details:\n\n"
-                    f"{flight_summary}\n\n"
-                    f"Please assist the user in booking a cab based on this flight information. "
-                    f"For example, suggest a cab to the departure airport a few hours before the flight, "
-                    f"or a cab from the 'arrival airport' after landing "
-                    f"or BOTH"
-                )
-                state["messages"].append({
-                    "agent": "supervisor",
-                    "content": supervisor_message,
-                    "timestamp": datetime.now().isoformat()
-                })
-            else:
-                # Fallback if no flight summary is found
-                supervisor_message = (
-                    f"The user wants to book a cab: '{last_user_input}'. I don't have prior flight booking details. "
-                    f"Please assist them with the booking process by asking for their pickup location, destination, and preferred time."
-                )
-                state["messages"].append({
-                    "agent": "supervisor",
-                    "content": supervisor_message,
-                    "timestamp": datetime.now().isoformat()
-                })
-        
-        state = safe_cab_agent(state)
-    else:
-        # Handle initial case
-        if not state.get("messages") or state["messages"][-1]["agent"] != "supervisor":
-            state["messages"].append({
-                "agent": "supervisor",
-                "content": "I can help you book flights and cabs. Would you like to book a flight or a cab?",
-                "timestamp": datetime.now().isoformat()
-            })
-    
-    return state
+if AGENTS_IMPORTED:
+    from agents.llm_pool import warm_up
+else:
+    st.error("⚠️ Could not import flight_agent and cab_agent modules. Please ensure they are in your Python path.")
 
 # --- Streamlit Configuration ---
 st.set_page_config(
@@ -395,29 +24,34 @@ st.set_page_config(
     initial_sidebar_state="expanded"
 )
 
+# --- Rendering settings ---
+PAGE_SIZE = int(os.environ.get("CHAT_PAGE_SIZE", "30"))  # messages shown before "show earlier"
+RENDER_CACHE_SIZE = int(os.environ.get("CHAT_RENDER_CACHE_SIZE", "4096"))
+
+# Partial reruns: widgets inside a fragment rerun only that fragment (plain function on old Streamlit)
+fragment = getattr(st, "fragment", None) or getattr(st, "experimental_fragment", None) or (lambda func: func)
+
+# --- LLM connection warm-up ---
+@st.cache_resource
+def warm_llm_pool():
+    """Open the shared LLM connection pool once per server process (set LLM_WARM_UP=1)"""
+    if AGENTS_IMPORTED and os.environ.get("LLM_WARM_UP") == "1":
+        warm_up()
+    return True
+
 # --- Initialize Session State ---
 def initialize_session_state():
-    if "state" not in st.session_state:
-        st.session_state.state = {
-            "messages": [],
-            "current_agent": None,
-            "booking_info": {
-                "flight": {},
-                "cab": {}
-            },
-            "user_input": "",
-            "conversation_stage": "initial"  # initial, flight_booking, cab_booking, completed
-        }
-    if "show_follow_up" not in st.session_state:
-        st.session_state.show_follow_up = False
-    if "follow_up_type" not in st.session_state:
-        st.session_state.follow_up_type = None
-    if "follow_up_declined" not in st.session_state:
-        st.session_state.follow_up_declined = False
+    # Streamlit only keeps the id; the conversation itself lives in the engine (and its store).
+    # The id is also put in the URL so a reload or server restart resumes the same booking.
+    session_id = st.session_state.get("session_id") or st.query_params.get("session")
+    st.session_state.session_id = get_engine().ensure_session(session_id)
+    st.query_params["session"] = st.session_state.session_id
+
+def current_state() -> Dict[str, Any]:
+    return get_engine().state(st.session_state.session_id)
 
 # --- Custom CSS ---
-def load_css():
-    st.markdown("""
+CSS = """
     <style>
     .main-header {
         text-align: center;
@@ -512,27 +146,50 @@ def load_css():
         margin: 0.5rem 0;
     }
     </style>
-    """, unsafe_allow_html=True)
+    """
+
+def load_css():
+    # Streamlit drops whatever a rerun does not emit, so the (constant) stylesheet is sent every time
+    st.markdown(CSS, unsafe_allow_html=True)
 
 # --- Helper Functions ---
-def display_booking_status():
-    """Display current booking status in sidebar without details"""
-    flight_status = st.session_state.state["booking_info"]["flight"]
-    cab_status = st.session_state.state["booking_info"]["cab"]
+def display_booking_status(state: Dict[str, Any]):
+    """Display current booking status (call inside the sidebar) without details"""
+    flight_status = state["booking_info"]["flight"]
+    cab_status = state["booking_info"]["cab"]
     
-    st.sidebar.subheader("📊 Booking Status")
+    st.subheader("📊 Booking Status")
     
     # Flight Status
     if flight_status.get("status") == "booked":
-        st.sidebar.success("✈️ Flight: Booked")
+        st.success("✈️ Flight: Booked")
     else:
-        st.sidebar.info("✈️ Flight: Not booked")
+        st.info("✈️ Flight: Not booked")
     
     # Cab Status
     if cab_status.get("status") == "booked":
-        st.sidebar.success("🚗 Cab: Booked")
+        st.success("🚗 Cab: Booked")
     else:
-        st.sidebar.info("🚗 Cab: Not booked")
+        st.info("🚗 Cab: Not booked")
+
+def display_usage(usage: Dict[str, Any]):
+    """Token usage and LLM latency of this session (call inside the sidebar)"""
+    st.subheader("📈 Usage")
+    if not usage["agents"]:
+        st.caption("No LLM calls yet.")
+        return
+    
+    st.write(f"**Tokens:** {usage['total_tokens']:,} "
+             f"({usage['prompt_tokens']:,} prompt / {usage['completion_tokens']:,} completion)")
+    if usage["budget"]:
+        st.progress(min(usage["total_tokens"] / usage["budget"], 1.0),
+                    text=f"Budget: {usage['total_tokens']:,} of {usage['budget']:,} tokens")
+    for agent, agent_usage in usage["agents"].items():
+        st.caption(
+            f"{get_agent_icon(agent)} {agent.title()}: {agent_usage['calls']} calls, "
+            f"{agent_usage['total_tokens']:,} tokens, "
+            f"TTFT {agent_usage['avg_ttft_ms']:.0f} ms, latency {agent_usage['avg_latency_ms']:.0f} ms"
+        )
 
 def get_agent_icon(agent_type):
     """Get icon for different agent types"""
@@ -544,31 +201,55 @@ def get_agent_icon(agent_type):
     }
     return icons.get(agent_type, "🤖")
 
-def check_completion_status():
-    """Check if both bookings are complete"""
-    flight_booked = st.session_state.state["booking_info"]["flight"].get("status") == "booked"
-    cab_booked = st.session_state.state["booking_info"]["cab"].get("status") == "booked"
-    return flight_booked and cab_booked
+def message_html(agent_type: str, content: str) -> str:
+    """HTML for one chat bubble. Kept on a single block (newlines become <br>) so that
+    bubbles can be joined into one markdown element without breaking the HTML block."""
+    icon = get_agent_icon(agent_type)
+    agent_name = agent_type.replace("_", " ").title()
+    css_class = f"{agent_type.replace('_', '-')}-message"
+    body = content.replace("\r\n", "\n").replace("\n", "<br>")
+    return f'<div class="{css_class}"><strong>{icon} {agent_name} Agent:</strong><br>{body}</div>\n'
 
-def should_show_follow_up():
-    """Determine if follow-up question should be shown"""
-    # If the user has already declined the follow-up, don't show it again
-    if st.session_state.follow_up_declined:
-        return None
-    
-    flight_booked = st.session_state.state["booking_info"]["flight"].get("status") == "booked"
-    cab_booked = st.session_state.state["booking_info"]["cab"].get("status") == "booked"
-    current_agent = st.session_state.state["current_agent"]
+# --- Render cache ---
+# Messages are immutable records, so each one is turned into HTML once and reused on every rerun
+@lru_cache(maxsize=RENDER_CACHE_SIZE)
+def cached_message_html(message: Message) -> str:
+    return message_html(message.get("agent") or "supervisor", message["content"])
+
+def render_message(message: Dict[str, Any], container=st):
+    """Render a single chat message into container (the page by default)"""
+    container.markdown(message_html(message.get("agent", "supervisor"), message["content"]), unsafe_allow_html=True)
+
+def render_history(messages: List[Message], container=st):
+    """Render the latest page of the transcript as one markdown element.
+
+    Older messages stay behind a "show earlier" button, so a long session costs
+    one cached join per rerun instead of one element per message."""
+    visible = st.session_state.setdefault("visible_messages", PAGE_SIZE)
+    start = max(0, len(messages) - visible)
+    if start and container.button(f"⬆️ Show earlier messages ({start} hidden)", key="show_earlier"):
+        st.session_state.visible_messages = visible + PAGE_SIZE
+        st.rerun()
+    if len(messages) > start:
+        with span("render", session_id=st.session_state.get("session_id"), messages=len(messages) - start):
+            container.markdown("".join(cached_message_html(message) for message in messages[start:]),
+                               unsafe_allow_html=True)
+
+def stream_renderer(placeholder, state: Dict[str, Any]) -> Callable[[str], None]:
+    """Build an on_token callback that renders a streamed agent reply into placeholder.
+    The agent is looked up on the first token, after the engine has routed the turn."""
+    parts: List[str] = []
     
-    # If an agent is already active, don't show the follow-up question
-    if current_agent in [AgentState.FLIGHT_AGENT, AgentState.CAB_AGENT]:
-        return None
+    def on_token(token: str):
+        parts.append(token)
+        agent_type = "flight" if state["current_agent"] == AgentState.FLIGHT_AGENT else "cab"
+        render_message({"agent": agent_type, "content": "".join(parts)}, placeholder)
     
-    if flight_booked and not cab_booked and not st.session_state.show_follow_up:
-        return "cab"
-    elif cab_booked and not flight_booked and not st.session_state.show_follow_up:
-        return "flight"
-    return None
+    return on_token
+
+def show_error(state: Dict[str, Any]):
+    if state.get("last_error"):
+        st.error(state["last_error"])
 
 def preserve_scroll_position():
     scroll_script = """
@@ -583,11 +264,73 @@ def preserve_scroll_position():
     """
     st.markdown(scroll_script, unsafe_allow_html=True)
 
+def start_new_booking():
+    get_engine().reset(st.session_state.session_id)
+    st.session_state.visible_messages = PAGE_SIZE
+    st.rerun()
+
+# --- Fragments ---
+# The sidebar and the follow-up prompt rerun on their own; anything that changes the
+# conversation calls st.rerun(), which reruns the whole app.
+@fragment
+def sidebar_panel():
+    st.header("🎯 Supervisor Dashboard")
+    display_booking_status(current_state())
+    display_usage(get_engine().usage(st.session_state.session_id))
+    
+    st.markdown("---")
+    st.write("**Available Services:**")
+    st.write("• ✈️ Flight Booking")
+    st.write("• 🚗 Cab/Taxi Booking")
+    st.write("• 🎯 Smart Recommendations")
+    
+    st.markdown("---")
+    if st.button("🔄 Start New Booking", type="secondary"):
+        start_new_booking()
+
+@fragment
+def follow_up_panel():
+    engine = get_engine()
+    session_id = st.session_state.session_id
+    follow_up = engine.follow_up(session_id)
+    if not follow_up:
+        return
+    # A double click re-sends the same version, so the engine runs the request only once
+    version = engine.version(session_id)
+    service_name, follow_up_message = follow_up
+    
+    st.markdown(f"""
+    <div class="follow-up-section">
+        <strong>🎯 Supervisor:</strong><br>
+        {follow_up_message}
+    </div>
+    """, unsafe_allow_html=True)
+    
+    # Fragments may only write inside themselves, so the accepted agent's first reply streams here
+    placeholder = st.empty()
+    col1, col2, col3 = st.columns([1, 1, 2])
+    with col1:
+        if st.button(f"✅ Yes, book {service_name}", key="yes_follow_up"):
+            state = engine.accept_follow_up(session_id, on_token=stream_renderer(placeholder, current_state()),
+                                            version=version)
+            show_error(state)
+            st.rerun()
+
+    with col2:
+        if st.button("❌ No, thanks", key="no_follow_up"):
+            engine.decline_follow_up(session_id, version=version)
+            st.rerun()
+
 # --- Main App ---
 def main():
+    warm_llm_pool()
     load_css()
     initialize_session_state()
     preserve_scroll_position()
+    engine = get_engine()
+    session_id = st.session_state.session_id
+    state = current_state()
+    version = engine.version(session_id)  # what this run shows; duplicate submissions of it are coalesced
     
     # Header
     st.markdown("""
@@ -599,28 +342,7 @@ def main():
     
     # Sidebar
     with st.sidebar:
-        st.header("🎯 Supervisor Dashboard")
-        display_booking_status()
-        
-        st.markdown("---")
-        st.write("**Available Services:**")
-        st.write("• ✈️ Flight Booking")
-        st.write("• 🚗 Cab/Taxi Booking")
-        st.write("• 🎯 Smart Recommendations")
-        
-        st.markdown("---")
-        if st.button("🔄 Start New Booking", type="secondary"):
-            st.session_state.state = {
-                "messages": [],
-                "current_agent": None,
-                "booking_info": {"flight": {}, "cab": {}},
-                "user_input": "",
-                "conversation_stage": "initial"
-            }
-            st.session_state.show_follow_up = False
-            st.session_state.follow_up_type = None
-            st.session_state.follow_up_declined = False
-            st.rerun()
+        sidebar_panel()
     
     # Main chat interface
     # st.subheader("💬 Conversation with Travel Agents")
@@ -630,7 +352,7 @@ def main():
     chat_container = st.container()
     
     with chat_container:
-        if not st.session_state.state["messages"]:
+        if not state["messages"]:
             st.markdown("""
             <div class="supervisor-message">
                 <strong>🎯 Supervisor:</strong><br>
@@ -639,212 +361,37 @@ def main():
             </div>
             """, unsafe_allow_html=True)
         
-        for message in st.session_state.state["messages"]:
-            agent_type = message.get("agent", "supervisor")
-            icon = get_agent_icon(agent_type)
-            agent_name = agent_type.replace("_", " ").title()
-            
-            css_class = f"{agent_type.replace('_', '-')}-message"
-            
-            st.markdown(f"""
-            <div class="{css_class}">
-                <strong>{icon} {agent_name} Agent:</strong><br>
-                {message["content"]}
-            </div>
-            """, unsafe_allow_html=True)
-    
-    # Check for follow-up questions
-    follow_up_needed = should_show_follow_up()
-    if follow_up_needed and not st.session_state.show_follow_up:
-        st.session_state.show_follow_up = True
-        st.session_state.follow_up_type = follow_up_needed
+        render_history(state["messages"])
     
     # Display follow-up question
-    if st.session_state.show_follow_up and not check_completion_status():
-        service_name = "cab" if st.session_state.follow_up_type == "cab" else "flight"
-        other_service = "flight" if service_name == "cab" else "cab"
-        
-        # Reuse the supervisor's logic to get the last agent message for context
-        booking_summary = None
-        for msg in reversed(st.session_state.state.get("messages", [])):
-            if msg.get("agent") == other_service and msg.get("content") != "BOOKING_COMPLETE":
-                content = msg.get("content")
-                if "from" in content:
-                    booking_summary = content[content.lower().find("from"):]  # Extract from "from" onwards
-                else:
-                    booking_summary = content  # fallback to full content
-                break
-
-        # Construct dynamic follow-up message
-        if booking_summary:
-            follow_up_message = (
-                f"You have successfully booked your {other_service} {booking_summary}. "
-                f"Would you like to book a {service_name} as well to complement your trip?"
-            )
-        else:
-            follow_up_message = (
-                f"You have successfully booked your {other_service}. "
-                f"Would you like to book a {service_name} as well to complement your trip?"
-            )
-
-        
-        st.markdown(f"""
-        <div class="follow-up-section">
-            <strong>🎯 Supervisor:</strong><br>
-            {follow_up_message}
+    follow_up = engine.follow_up(session_id)
+    if follow_up:
+        follow_up_panel()
+    
+    # Check if both bookings are complete
+    if is_complete(state):
+        st.markdown("""
+        <div class="booking-complete">
+            🎉 Congratulations! Your travel booking is complete! 🎉<br>
+            Both your flight and cab have been successfully booked.
         </div>
         """, unsafe_allow_html=True)
         
-        col1, col2, col3 = st.columns([1, 1, 2])
-        with col1:
-            if st.button(f"✅ Yes, book {service_name}", key="yes_follow_up"):
-                # Clear any previous booking context for the new service
-                if service_name == "flight":
-                    st.session_state.state["booking_info"]["flight"] = {}
-                else:
-                    st.session_state.state["booking_info"]["cab"] = {}
-                
-                # Clear any agent-specific context that might persist
-                st.session_state.state.pop("flight_context", None)
-                st.session_state.state.pop("cab_context", None)
-                
-                # Add messages to conversation
-                st.session_state.state["messages"].append({
-                    "agent": "supervisor",
-                    "content": follow_up_message,
-                    "timestamp": datetime.now().isoformat()
-                })
-                
-                st.session_state.state["messages"].append({
-                    "agent": "user",
-                    "content": f"Yes, book {service_name}",
-                    "timestamp": datetime.now().isoformat()
-                })
-                
-                # Set the appropriate agent and reset conversation stage
-                st.session_state.state["current_agent"] = AgentState.CAB_AGENT if service_name == "cab" else AgentState.FLIGHT_AGENT
-                st.session_state.state["user_input"] = f"book {service_name}"
-                st.session_state.state["conversation_stage"] = f"{service_name}_booking"
-                
-                st.session_state.show_follow_up = False
-                st.session_state.follow_up_type = None
-                
-                # Process through supervisor to initialize the new agent
-                with st.spinner(f"Connecting you to the {service_name} agent..."):
-                    st.session_state.state = supervisor(st.session_state.state)
-                
-                st.rerun()
-
-        with col2:
-            if st.button("❌ No, thanks", key="no_follow_up"):
-                # Add supervisor message to conversation
-                st.session_state.state["messages"].append({
-                    "agent": "supervisor",
-                    "content": follow_up_message,
-                    "timestamp": datetime.now().isoformat()
-                })
-                
-                # Add user response to conversation
-                st.session_state.state["messages"].append({
-                    "agent": "user",
-                    "content": "No, thanks",
-                    "timestamp": datetime.now().isoformat()
-                })
-                
-                # Add supervisor response
-                st.session_state.state["messages"].append({
-                    "agent": "supervisor",
-                    "content": "Thank you for using our travel booking service! Have a great trip!",
-                    "timestamp": datetime.now().isoformat()
-                })
-                
-                st.session_state.show_follow_up = False
-                st.session_state.follow_up_type = None
-                st.session_state.follow_up_declined = True
-                st.session_state.state["conversation_stage"] = "completed"
-                st.rerun()
-        
-        # Check if both bookings are complete
-        if check_completion_status():
-            st.markdown("""
-            <div class="booking-complete">
-                🎉 Congratulations! Your travel booking is complete! 🎉<br>
-                Both your flight and cab have been successfully booked.
-            </div>
-            """, unsafe_allow_html=True)
-            
-            if st.button("🆕 Start New Booking", type="primary"):
-                st.session_state.state = {
-                    "messages": [],
-                    "current_agent": None,
-                    "booking_info": {"flight": {}, "cab": {}},
-                    "user_input": "",
-                    "conversation_stage": "initial"
-                }
-                st.session_state.show_follow_up = False
-                st.session_state.follow_up_type = None
-                st.session_state.follow_up_declined = False
-                st.rerun()
+        if st.button("🆕 Start New Booking", type="primary"):
+            start_new_booking()
 
     # Chat input with kill switch
-    if not check_completion_status() and (
-        not st.session_state.show_follow_up or 
-        st.session_state.state["current_agent"] in [AgentState.FLIGHT_AGENT, AgentState.CAB_AGENT]
-    ):
+    if not is_complete(state) and not follow_up:
         user_input = st.chat_input("Please provide the details (e.g., pickup location, flight destination, etc.)")
         
         if user_input:
-            # Add user message to history
-            st.session_state.state["messages"].append({
-                "agent": "user",
-                "content": user_input,
-                "timestamp": datetime.now().isoformat()
-            })
-            
-            # Check for kill switch
-            user_input_lower = user_input.lower()
-            if "stop" in user_input_lower:
-                st.session_state.state["messages"].append({
-                    "agent": "supervisor",
-                    "content": "Booking process stopped. How can I assist you further?",
-                    "timestamp": datetime.now().isoformat()
-                })
-                st.session_state.state["current_agent"] = None
-                st.session_state.state["conversation_stage"] = "initial"
-                st.rerun()
-            else:
-                # Determine which agent to activate first
-                if st.session_state.state["current_agent"] is None:
-                    if any(k in user_input_lower for k in ["flight", "book a flight", "plane", "air ticket", "fly"]):
-                        st.session_state.state["current_agent"] = AgentState.FLIGHT_AGENT
-                        st.session_state.state["conversation_stage"] = "flight_booking"
-                    elif any(k in user_input_lower for k in ["cab", "taxi", "ride", "airport drop", "uber", "lyft"]):
-                        st.session_state.state["current_agent"] = AgentState.CAB_AGENT
-                        st.session_state.state["conversation_stage"] = "cab_booking"
-                    else:
-                        # Supervisor handles unclear requests
-                        st.session_state.state["messages"].append({
-                            "agent": "supervisor",
-                            "content": "I can help you book flights and cabs! Please specify if you'd like to book a flight or a cab/taxi.",
-                            "timestamp": datetime.now().isoformat()
-                        })
-                        st.rerun()
-                        return
-                
-                # Set user input and process through supervisor
-                st.session_state.state["user_input"] = user_input
-                with st.spinner("Processing your request..."):
-                    st.session_state.state = supervisor(st.session_state.state)
-                
-                # Reset current agent only if booking is fully complete
-                if st.session_state.state["current_agent"] is not None:
-                    current_booking_type = "flight" if st.session_state.state["current_agent"] == AgentState.FLIGHT_AGENT else "cab"
-                    if st.session_state.state["booking_info"][current_booking_type].get("status") == "booked":
-                        st.session_state.state["current_agent"] = None
-                        st.session_state.state["conversation_stage"] = "completed"
-                        st.session_state.show_follow_up = False
-                
-                st.rerun()
+            # The engine records the message, handles "stop", routes the turn and runs the agent
+            with chat_container:
+                render_message({"agent": "user", "content": user_input})
+                placeholder = st.empty()
+            state = engine.turn(session_id, user_input, on_token=stream_renderer(placeholder, state), version=version)
+            show_error(state)
+            st.rerun()
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,9 @@
+# Tests run offline: the scripted local model, no LLM cache, no session store, no artificial latency
+import os
+
+os.environ.setdefault("LLM_BACKEND", "local")
+os.environ.setdefault("LLM_CACHE_PATH", "")
+os.environ.setdefault("SESSION_STORE", "none")
+os.environ.setdefault("LOCAL_LLM_LATENCY", "0")
+os.environ.setdefault("LOCAL_LLM_TOKENS_PER_SECOND", "0")
+os.environ.setdefault("SPECULATIVE_FOLLOW_UP", "0")
@@ -0,0 +1,144 @@
+import asyncio
+import threading
+import time
+
+from agents.engine import STOPPED_REPLY, ConversationEngine, SessionLock, SessionManager
+
+
+def new_engine():
+    return ConversationEngine(SessionManager())
+
+
+def test_async_waiter_is_woken_by_a_sync_release():
+    lock = SessionLock()
+    lock.acquire()
+    events = []
+
+    async def waiter():
+        async with lock:
+            events.append("async")
+
+    def release_later():
+        time.sleep(0.05)
+        events.append("sync released")
+        lock.release()
+
+    threading.Thread(target=release_later).start()
+    asyncio.run(asyncio.wait_for(waiter(), 5))
+    assert events == ["sync released", "async"]
+    assert not lock.locked()
+
+
+def test_sync_caller_waits_for_an_async_holder():
+    lock = SessionLock()
+    events = []
+
+    async def hold():
+        async with lock:
+            thread = threading.Thread(target=lambda: (lock.acquire(), events.append("sync"), lock.release()))
+            thread.start()
+            await asyncio.sleep(0.05)
+            events.append("async done")
+        return thread
+
+    thread = asyncio.run(hold())
+    thread.join(5)
+    assert events == ["async done", "sync"]
+
+
+def test_cancelled_async_waiter_does_not_take_the_lock():
+    lock = SessionLock()
+    lock.acquire()
+
+    async def main():
+        task = asyncio.create_task(lock.aacquire())
+        await asyncio.sleep(0.01)
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+        lock.release()
+
+    asyncio.run(main())
+    assert not lock.locked()
+
+
+def test_resubmitted_turn_is_answered_from_the_state():
+    engine = new_engine()
+    session_id = engine.create_session()
+    version = engine.version(session_id)
+    engine.turn(session_id, "I need a flight", version=version)
+    messages = len(engine.state(session_id)["messages"])
+    engine.turn(session_id, "I need a flight", version=version)
+    assert len(engine.state(session_id)["messages"]) == messages
+    assert engine.stats()["coalesced"] == 1
+
+
+COMBINED_REQUEST = "I need a flight from Pune to Goa tomorrow and a cab to the airport"
+
+
+def new_replies(state, before):
+    return [msg["content"] for msg in state["messages"][before:] if msg["agent"] in ("flight", "cab")]
+
+
+def test_one_service_with_the_other_mentioned_is_not_combined():
+    engine = new_engine()
+    session_id = engine.create_session()
+    state = engine.turn(session_id, "my flight lands at 6, I need a cab")
+    assert state["conversation_stage"] == "cab_booking"
+
+
+def test_combined_booking_streams_each_reply_as_it_is_generated():
+    engine = new_engine()
+    session_id = engine.create_session()
+    tokens = []
+    state = engine.turn(session_id, COMBINED_REQUEST, on_token=tokens.append)
+    assert state["conversation_stage"] == "combined_booking"
+    replies = new_replies(state, 1)
+    assert len(replies) == 2
+    assert len(tokens) > 2
+    assert "".join(tokens) == "\n\n".join(replies)
+
+
+def test_async_combined_booking_streams_each_reply_as_it_is_generated():
+    engine = new_engine()
+    session_id = engine.create_session()
+
+    async def run():
+        return [token async for token in engine.astream_turn(session_id, COMBINED_REQUEST)]
+
+    tokens = asyncio.run(run())
+    replies = new_replies(engine.state(session_id), 1)
+    assert len(replies) == 2
+    assert len(tokens) > 2
+    assert "".join(tokens) == "\n\n".join(replies)
+
+
+def test_async_decline_waits_for_the_session_without_blocking_the_loop():
+    engine = new_engine()
+    session_id = engine.create_session()
+    lock = engine.session(session_id).lock
+    lock.acquire()
+    ticks = []
+
+    async def tick():
+        while True:
+            ticks.append(None)
+            await asyncio.sleep(0.005)
+
+    async def main():
+        ticker = asyncio.create_task(tick())
+        threading.Timer(0.05, lock.release).start()
+        await asyncio.wait_for(engine.adecline_follow_up(session_id), 5)
+        ticker.cancel()
+
+    asyncio.run(main())
+    assert len(ticks) > 3
+    assert not lock.locked()
+
+
+def test_a_stop_in_the_itinerary_does_not_end_the_booking():
+    engine = new_engine()
+    session_id = engine.create_session()
+    engine.turn(session_id, "I need a flight from Pune to Goa")
+    state = engine.turn(session_id, "a flight with one stop is fine")
+    assert state["conversation_stage"] == "flight_booking"
+    assert all(msg["content"] != STOPPED_REPLY for msg in state["messages"])
@@ -0,0 +1,80 @@
+from datetime import date
+
+from agents.flight_agent import FlightSearch
+from agents.flight_schedule import FlightRequest, FlightSchedule, parse_date
+
+MONDAY = date(2026, 10, 19)
+
+
+def row(carrier, number, origin, destination, departure, arrival, days="1234567", **extra):
+    return dict(carrier=carrier, flight_number=number, origin=origin, destination=destination,
+                departure=departure, arrival=arrival, days=days, **extra)
+
+
+def schedule():
+    return FlightSchedule([
+        row("6E", "733", "PNQ", "GOI", "18:05", "19:15", origin_city="Pune", destination_city="Goa"),
+        row("6E", "501", "PNQ", "GOI", "06:15", "07:25", fare="INR 3950"),
+        row("AI", "862", "PNQ", "GOI", "09:40", "10:55", days="135"),
+        row("UK", "981", "DEL", "BOM", "23:30", "01:40"),
+        row("SG", "10", "PNQ", "GOI", "12:00", "13:10", date="2026-10-20"),
+    ], today=MONDAY, horizon_days=14)
+
+
+def codes(flights):
+    return [flight.code for flight in flights]
+
+
+def test_search_returns_the_day_window_by_departure():
+    inventory = schedule()
+    tuesday = date(2026, 10, 20)
+    assert codes(inventory.search("PNQ", "GOI", MONDAY)) == ["6E501", "AI862", "6E733"]
+    assert codes(inventory.search("pnq", "goi", tuesday)) == ["6E501", "SG10", "6E733"]
+    assert codes(inventory.search("PNQ", "GOI", MONDAY, 9 * 60, 18 * 60)) == ["AI862"]
+    assert codes(inventory.search("PNQ", "GOI", MONDAY, limit=1)) == ["6E501"]
+    assert inventory.search("GOI", "PNQ", MONDAY) == []
+    assert inventory.search("PNQ", "GOI", date(2026, 11, 30)) == []  # beyond the horizon
+
+
+def test_overnight_arrival_is_on_the_next_day():
+    flight, = schedule().search("DEL", "BOM", MONDAY)
+    assert flight.departure == 23 * 60 + 30
+    assert flight.arrival == 24 * 60 + 100
+
+
+def test_parse_date_takes_the_last_mention():
+    assert parse_date("flying tomorrow", MONDAY) == date(2026, 10, 20)
+    assert parse_date("the day after tomorrow", MONDAY) == date(2026, 10, 21)
+    assert parse_date("on 2026-12-01", MONDAY) == date(2026, 12, 1)
+    assert parse_date("on 5th of march", MONDAY) == date(2027, 3, 5)
+    assert parse_date("nov 2 please", MONDAY) == date(2026, 11, 2)
+    assert parse_date("on 25/12", MONDAY) == date(2026, 12, 25)
+    assert parse_date("monday", MONDAY) == date(2026, 10, 26)  # the coming one, never today
+    assert parse_date("friday, no make it tomorrow", MONDAY) == date(2026, 10, 20)
+    assert parse_date("on 31/02", MONDAY) is None
+    assert parse_date("as soon as possible", MONDAY) is None
+
+
+def search_of(*flight_codes):
+    flights = [row(code[:2], code[2:], "PNQ", "GOI", "06:15", "07:25") for code in flight_codes]
+    inventory = FlightSchedule(flights, today=MONDAY, horizon_days=1)
+    return FlightSearch(FlightRequest(), inventory.search("PNQ", "GOI", MONDAY), inventory.cities)
+
+
+def test_chosen_matches_whole_flight_codes():
+    search = search_of("6E123", "6E1234")
+    assert search.chosen(["I'll take 6E1234"]).code == "6E1234"
+    assert search.chosen(["I'll take 6E 123"]).code == "6E123"
+    assert search.chosen(["6e-1234 please"]).code == "6E1234"
+    assert search.chosen(["6E12345"]) is None
+
+
+def test_chosen_uses_the_latest_text_naming_a_flight():
+    search = search_of("6E501", "AI862")
+    assert search.chosen(["AI 862", "actually 6E501", "yes, book it"]).code == "6E501"
+
+
+def test_chosen_ignores_flights_without_a_carrier():
+    search = search_of("  501")
+    assert search.flights[0].code == "501"
+    assert search.chosen(["I land at 501 minutes past"]) is None
@@ -0,0 +1,26 @@
+from agents.history import HistoryBuffer
+
+
+def turn(i, content=None):
+    return [
+        {"agent": "user", "role": "user", "content": content or f"message {i}"},
+        {"agent": "flight", "role": "assistant", "content": f"reply {i}"},
+    ]
+
+
+def test_sync_appends_only_new_messages():
+    buffer = HistoryBuffer()
+    messages = turn(0)
+    first = buffer.sync(messages)
+    messages += turn(1)
+    assert buffer.sync(messages).startswith(first)
+    assert len(buffer) == 4
+
+
+def test_sync_rebuilds_when_an_earlier_message_changed():
+    buffer = HistoryBuffer()
+    buffer.sync(turn(0) + turn(1))
+    # Same last rendered message, different first one
+    edited = turn(0, content="edited") + turn(1)
+    assert buffer.sync(edited + turn(2)).startswith("[user] user: edited")
+    assert len(buffer) == 6
@@ -0,0 +1,46 @@
+import pytest
+
+from agents.intent_router import get_router
+
+
+@pytest.mark.parametrize("text, services", [
+    ("I need a flight to Goa and a cab to the airport", ["flight", "cab"]),
+    ("book a flight and cab", ["flight", "cab"]),
+    ("I'd like to book a cab and a flight", ["cab", "flight"]),
+    ("Book a flight to Goa tomorrow, and a cab to the airport", ["flight", "cab"]),
+    ("Book a flight from Pune to Goa plus an airport drop", ["flight", "cab"]),
+    ("I need both a flight and a cab", ["flight", "cab"]),
+    # Only one service is asked for; the other is an existing booking
+    ("my flight lands at 6, I need a cab", ["cab"]),
+    ("I need a cab to pick me up when my flight lands", ["cab"]),
+    ("book a cab, my flight is at 9", ["cab"]),
+    ("what time does my flight leave? I want a taxi", ["cab"]),
+    ("my cab is late, can you book a flight", ["flight"]),
+    ("the flight was great, thanks for the ride", []),
+])
+def test_services_only_counts_requested_services(text, services):
+    assert get_router().services(text) == services
+
+
+@pytest.mark.parametrize("text, label", [
+    ("book a flight", "flight"),
+    ("I need a taxi", "cab"),
+    ("please stop", "stop"),
+])
+def test_route(text, label):
+    assert get_router().route(text) == label
+
+
+@pytest.mark.parametrize("text, stop", [
+    ("stop", True),
+    ("Please stop.", True),
+    ("ok, stop the booking", True),
+    ("thanks. stop now", True),
+    ("a flight with one stop", False),
+    ("non-stop to Goa", False),
+    ("a nonstop flight", False),
+    ("stop over in Dubai", False),
+    ("no stop please", False),
+])
+def test_stop_only_as_a_command(text, stop):
+    assert get_router().wants_stop(text) is stop
@@ -0,0 +1,28 @@
+from agents.conversation import Stage, ensure_conversation
+from agents.message import Message
+from agents.message_store import BOOKING_COMPLETE, MessageStore
+
+
+def test_counters_and_completion_flags_follow_appends_and_edits():
+    store = MessageStore([Message("user", "I need a flight", "user"), Message("flight", "Where to?")])
+    store.append({"agent": "flight", "role": "assistant", "content": BOOKING_COMPLETE})
+    assert store.agent_count("flight") == 2
+    assert store.agent_count("cab") == 0
+    assert store.is_complete("flight")
+    assert store.last_message("flight").content == "Where to?"
+
+    store.pop()
+    assert store.agent_count("flight") == 1
+    assert not store.is_complete("flight")
+
+
+def test_transcript_saved_with_completion_entries_seeds_the_state_machine():
+    state = {
+        "messages": [{"agent": "flight", "role": "assistant", "content": "Booked!"},
+                     {"agent": "flight", "role": "assistant", "content": BOOKING_COMPLETE}],
+        "booking_info": {"flight": {}, "cab": {}},
+    }
+    conversation = ensure_conversation(state)
+    assert conversation.is_booked("flight")
+    assert not conversation.is_booked("cab")
+    assert conversation.stage == Stage.COMPLETED
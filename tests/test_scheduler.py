@@ -0,0 +1,153 @@
+import threading
+import time
+
+import pytest
+from langchain_core.messages import AIMessage
+
+from agents.deadline import TurnCancelled
+from agents.resilience import LLMTimeoutError, ResilienceStats, ResilientChatModel, _Request, _get_pool
+from agents.scheduler import LLMScheduler, PriorityGroup, ScheduledChatModel, priority_scope
+
+
+def drained(scheduler, model, **levels):
+    """Register model and set bucket levels, e.g. requests=0 or tokens_key1=100"""
+    scheduler.register(model)
+    slots = scheduler._slots[model]
+    for name, level in levels.items():
+        bucket, _, index = name.partition("_key")
+        setattr(getattr(slots[int(index or 0)], bucket), "level", level)
+    return slots
+
+
+def grant_order(tickets, count, timeout=5):
+    order = []
+    done = threading.Event()
+    lock = threading.Lock()
+
+    def record(name):
+        def callback(_):
+            with lock:
+                order.append(name)
+                if len(order) == count:
+                    done.set()
+        return callback
+
+    for name, ticket in tickets:
+        ticket.future.add_done_callback(record(name))
+    assert done.wait(timeout)
+    return order
+
+
+def test_waiting_calls_are_granted_in_priority_order():
+    scheduler = LLMScheduler(api_keys=[None], rpm=600, tpm=0)  # one request every 0.1s once drained
+    with scheduler._cond:
+        drained(scheduler, "m", requests=0)
+        tickets = [(priority, scheduler.submit("m", 10, priority))
+                   for priority in ("batch", "speculative", "interactive", "confirm", "interactive")]
+    assert grant_order(tickets, 5) == ["confirm", "interactive", "interactive", "speculative", "batch"]
+
+
+def test_a_waiting_model_does_not_hold_up_other_models():
+    scheduler = LLMScheduler(api_keys=[None], rpm=60, tpm=0)
+    with scheduler._cond:
+        drained(scheduler, "slow", requests=0)
+        blocked = scheduler.submit("slow", 10, "confirm")
+        free = scheduler.submit("fast", 10, "batch")
+    assert free.future.result(timeout=5).key_id == "key0"
+    assert not blocked.future.done()
+
+
+def test_later_calls_use_other_keys_without_delaying_the_head():
+    scheduler = LLMScheduler(api_keys=["a", "b"], rpm=0, tpm=600)  # 10 tokens a second per key
+    with scheduler._cond:
+        drained(scheduler, "m", tokens_key0=500, tokens_key1=100)
+        head = scheduler.submit("m", 590, "confirm")  # best on key0, in about 9s
+        small = scheduler.submit("m", 50, "batch")
+        behind = scheduler.submit("m", 580, "batch")
+    assert small.future.result(timeout=5).key_id == "key1"
+    assert not head.future.done()
+    assert not behind.future.done()
+    # The head's key was not touched
+    assert scheduler._slots["m"][0].tokens.level == pytest.approx(500, abs=10)
+
+
+def test_promoted_group_moves_ahead_with_its_later_calls():
+    scheduler = LLMScheduler(api_keys=[None], rpm=600, tpm=0)
+    group = PriorityGroup("speculative")
+    with scheduler._cond:
+        drained(scheduler, "m", requests=0)
+        with priority_scope(group):
+            queued = scheduler.submit("m", 10)
+        interactive = scheduler.submit("m", 10, "interactive")
+    scheduler.promote(group, "confirm")
+    with priority_scope(group):
+        later = scheduler.submit("m", 10)
+    assert later.priority == "confirm"
+    order = grant_order([("queued", queued), ("interactive", interactive), ("later", later)], 3)
+    assert order == ["queued", "later", "interactive"]
+
+
+def test_promote_never_lowers_a_priority():
+    scheduler = LLMScheduler(api_keys=[None], rpm=0, tpm=0)
+    group = PriorityGroup("confirm")
+    scheduler.promote(group, "batch")
+    assert group.priority == "confirm"
+
+
+def test_unknown_priority_is_rejected():
+    with pytest.raises(ValueError):
+        with priority_scope("urgent"):
+            pass
+
+
+class EchoModel:
+    model_name = "echo"
+
+    def __init__(self):
+        self.calls = 0
+
+    def invoke(self, messages, **kwargs):
+        self.calls += 1
+        return AIMessage(content="ok")
+
+
+def scheduled_echo(scheduler):
+    echo = EchoModel()
+    model = ScheduledChatModel({"key0": echo}, scheduler)
+    with scheduler._cond:
+        drained(scheduler, "echo", requests=0)
+    return echo, model
+
+
+def test_queue_wait_does_not_count_against_the_attempt_timeout():
+    scheduler = LLMScheduler(api_keys=[None], rpm=120, tpm=0)  # the first slot frees in 0.5s
+    echo, model = scheduled_echo(scheduler)
+    resilient = ResilientChatModel(model, timeout=0.2, max_retries=0, stats=ResilienceStats())
+    assert resilient.invoke("hi").content == "ok"
+    assert echo.calls == 1
+
+
+def test_request_given_up_while_queued_is_never_sent():
+    scheduler = LLMScheduler(api_keys=[None], rpm=600, tpm=0)  # the first slot frees in 0.1s
+    echo, model = scheduled_echo(scheduler)
+    request = _Request(_get_pool(), None, model.invoke, "hi")
+    time.sleep(0.02)
+    request.cancel()
+    with pytest.raises(TurnCancelled):
+        request.future.result(timeout=5)
+    time.sleep(0.2)
+    assert echo.calls == 0
+    assert scheduler.stats()["keys"]["echo"]["key0"] == {"in_flight": 0, "granted": 0, "throttled": 0}
+
+
+def test_a_slow_request_still_times_out():
+    class SlowModel(EchoModel):
+        def invoke(self, messages, **kwargs):
+            time.sleep(0.3)
+            return super().invoke(messages, **kwargs)
+
+    scheduler = LLMScheduler(api_keys=[None], rpm=0, tpm=0)
+    model = ScheduledChatModel({"key0": SlowModel()}, scheduler)
+    resilient = ResilientChatModel(model, timeout=0.1, max_retries=0, stats=ResilienceStats())
+    with pytest.raises(LLMTimeoutError):
+        resilient.invoke("hi")
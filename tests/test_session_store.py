@@ -0,0 +1,121 @@
+import sqlite3
+import time
+
+import pytest
+
+from agents import session_store
+from agents.engine import SessionManager
+from agents.message import Message
+from agents.session_store import FileSessionStore, SQLiteSessionStore
+
+
+@pytest.fixture(params=["sqlite", "file"])
+def make_store(request, tmp_path):
+    stores = []
+
+    def make(wrap=lambda cls: cls, flush_interval=0):
+        if request.param == "sqlite":
+            store = wrap(SQLiteSessionStore)(str(tmp_path / "sessions.sqlite"), flush_interval)
+        else:
+            store = wrap(FileSessionStore)(str(tmp_path / "sessions"), flush_interval)
+        stores.append(store)
+        return store
+
+    yield make
+    for store in stores:
+        store.close()
+
+
+def messages(*contents):
+    return [Message("user", content, "user") for content in contents]
+
+
+def test_load_replays_turns_logged_after_a_snapshot(make_store):
+    store = make_store()
+    store.append("s1", 1, messages("a"), {"stage": 1})
+    store.append("s1", 2, messages("b"), {"stage": 2})
+    store.snapshot("s1", 2, messages("a", "b"), {"stage": 2})
+    store.append("s1", 3, messages("c"), {"stage": 3})
+    store.append("s1", 4, messages("d"), {"stage": 4})
+
+    stored = make_store().load("s1")
+    assert [msg.content for msg in stored.messages] == ["a", "b", "c", "d"]
+    assert stored.fields == {"stage": 4}
+    assert stored.seq == 4
+
+
+def test_unknown_and_deleted_sessions_load_as_none(make_store):
+    store = make_store()
+    assert store.load("missing") is None
+    store.append("s1", 1, messages("a"), {})
+    store.delete("s1")
+    assert store.load("s1") is None
+
+
+def test_failed_batch_is_kept_and_retried(make_store, monkeypatch):
+    monkeypatch.setattr(session_store, "FLUSH_RETRY", 0.01)
+    failures = []
+
+    def flaky(cls):
+        class FlakyStore(cls):
+            def _write_batch(self, batch):
+                if not failures:
+                    failures.append(len(batch))
+                    raise OSError("database is locked")
+                super()._write_batch(batch)
+        return FlakyStore
+
+    store = make_store(flaky, flush_interval=0.01)
+    store.append("s1", 1, messages("a"), {"stage": 1})
+    deadline = time.monotonic() + 5
+    while store.records == 0 and time.monotonic() < deadline:
+        time.sleep(0.01)
+
+    assert failures == [1]
+    assert store.failures == 1
+    assert store._flusher.is_alive()
+    assert [msg.content for msg in store.load("s1").messages] == ["a"]
+
+
+def test_file_backend_has_its_own_default_path(monkeypatch, tmp_path):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(session_store, "STORE_BACKEND", "file")
+    monkeypatch.setattr(session_store, "STORE_PATH", "")
+    store = session_store.create_session_store()
+    try:
+        assert isinstance(store, FileSessionStore)
+        assert store.directory == session_store.DEFAULT_PATHS["file"]
+        assert (tmp_path / ".sessions").is_dir()
+    finally:
+        store.close()
+
+
+def test_load_sees_queued_writes_while_the_backend_fails(make_store):
+    def failing(cls):
+        class FailingStore(cls):
+            def _write_batch(self, batch):
+                raise OSError("database is locked")
+        return FailingStore
+
+    store = make_store(failing, flush_interval=60)
+    store.append("s1", 1, messages("a"), {"stage": 1})
+    store.snapshot("s1", 1, messages("a"), {"stage": 1})
+    store.append("s1", 2, messages("b"), {"stage": 2})
+    stored = store.load("s1")
+    assert [msg.content for msg in stored.messages] == ["a", "b"]
+    assert (stored.fields, stored.seq) == ({"stage": 2}, 2)
+    store.delete("s1")
+    assert store.load("s1") is None
+    store._pending.clear()  # let close() succeed
+
+
+def test_unreadable_store_loads_no_session(tmp_path):
+    class UnreadableStore(SQLiteSessionStore):
+        def _read(self, session_id):
+            raise sqlite3.OperationalError("database is locked")
+
+    store = UnreadableStore(str(tmp_path / "sessions.sqlite"), 0)
+    try:
+        assert SessionManager(store=store).get("s1") is None
+    finally:
+        store.close()
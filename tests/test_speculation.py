@@ -0,0 +1,21 @@
+from agents.speculation import SpeculationBudget
+
+
+def test_running_turns_reserve_tokens_against_the_hourly_cap():
+    budget = SpeculationBudget(max_in_flight=10, tokens_per_hour=1000, estimate=400)
+    assert budget.acquire() == 400
+    assert budget.acquire() == 400
+    assert budget.acquire() is None  # 1200 tokens would overshoot
+    assert budget.stats()["tokens_reserved"] == 800
+
+    budget.release(300, 400)
+    stats = budget.stats()
+    assert (stats["tokens_reserved"], stats["tokens_last_hour"]) == (400, 300)
+    assert budget.acquire() == 300  # the recent average from now on
+    assert budget.stats()["skipped"] == 1
+
+
+def test_in_flight_limit():
+    budget = SpeculationBudget(max_in_flight=1, tokens_per_hour=0)
+    assert budget.acquire() is not None
+    assert budget.acquire() is None
@@ -0,0 +1,51 @@
+from agents.streaming import AWAITING_CONFIRMATION, BOOKING_COMPLETE, MarkerFilter, consume_stream
+
+
+def run(tokens, *markers):
+    marker_filter = MarkerFilter(*markers)
+    out = [marker_filter.feed(token) for token in tokens]
+    out.append(marker_filter.flush())
+    return out, marker_filter.found
+
+
+def test_marker_split_across_tokens_is_removed():
+    out, found = run(["Booked! BOOK", "ING_COM", "PLETE"])
+    assert "".join(out) == "Booked! "
+    assert found == {BOOKING_COMPLETE}
+
+
+def test_only_a_possible_marker_prefix_is_held_back():
+    out, found = run(["Your seat is 4B", "OOK", "ED for you"])
+    assert out[0] == "Your seat is 4"  # "B" may start the marker
+    assert out[1] == ""
+    assert "".join(out) == "Your seat is 4BOOKED for you"
+    assert found == set()
+
+
+def test_trailing_partial_marker_is_released_on_flush():
+    out, found = run(["See you, BOOKING"])
+    assert out == ["See you, ", "BOOKING"]
+    assert found == set()
+
+
+def test_several_markers_and_text_after_them():
+    out, found = run(["Please conf", "irm. AWAITING_", "CONFIRMATION done", BOOKING_COMPLETE],
+                     BOOKING_COMPLETE, AWAITING_CONFIRMATION)
+    assert "".join(out) == "Please confirm.  done"
+    assert found == {BOOKING_COMPLETE, AWAITING_CONFIRMATION}
+
+
+def test_leading_whitespace_is_never_streamed():
+    out, _ = run(["\n", "  ", BOOKING_COMPLETE, "\n Hello", " there"])
+    assert "".join(out) == "Hello there"
+
+
+def test_consume_stream_returns_the_final_state():
+    def stream():
+        yield "a"
+        yield "b"
+        return {"done": True}
+
+    tokens = []
+    assert consume_stream(stream(), tokens.append) == {"done": True}
+    assert tokens == ["a", "b"]
@@ -0,0 +1,42 @@
+import pytest
+
+from agents import engine
+from agents.engine import get_engine
+from agents.intent_router import get_router
+from agents.supervisor_agent import route_of_reply
+
+
+@pytest.mark.parametrize("reply, route", [
+    ("Routing you to the flight agent to book your flight.", "flight"),
+    ("Sure, the Cab Agent will arrange your ride.", "cab"),
+    ("Would you like to book a flight or a cab?", None),
+    ("I can pass you to the flight agent or the cab agent.", None),
+    ("Error processing request: timeout. Please try again.", None),
+])
+def test_route_of_reply(reply, route):
+    assert route_of_reply(reply) == route
+
+
+@pytest.fixture
+def unsure_router(monkeypatch):
+    # No confidence is high enough, so every new request goes to the supervisor LLM
+    monkeypatch.setattr(get_router(), "threshold", 1.01)
+
+
+def test_unclear_input_is_routed_by_the_supervisor_llm(unsure_router):
+    eng = get_engine()
+    session_id = eng.create_session()
+    tokens = []
+    state = eng.turn(session_id, "i want to fly to goa", on_token=tokens.append)
+    assert state["conversation_stage"] == "flight_booking"
+    assert [msg["agent"] for msg in state["messages"]] == ["user", "supervisor", "flight"]
+    assert "".join(tokens).startswith("Routing you to the flight agent")
+
+
+def test_supervisor_llm_asks_again_when_it_cannot_route(unsure_router):
+    eng = get_engine()
+    session_id = eng.create_session()
+    state = eng.turn(session_id, "travel to delhi")
+    assert state["current_agent"] is None
+    assert state["messages"][-1]["content"] == "Would you like to book a flight or a cab?"
+    assert state["messages"][-1]["content"] != engine.UNCLEAR_REPLY
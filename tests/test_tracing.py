@@ -0,0 +1,45 @@
+import json
+
+from agents import tracing
+from agents.tracing import SpanMetrics, TraceExporter, span
+
+
+def run_trace():
+    with span("turn", session_id="s1"):
+        with span("agent", agent="flight"):
+            pass
+
+
+def test_metrics_see_unsampled_traces(monkeypatch):
+    metrics = SpanMetrics()
+    exporter = TraceExporter(path="")
+    monkeypatch.setattr(tracing, "SAMPLE_RATE", 0.0)
+    monkeypatch.setattr(tracing, "_metrics", metrics)
+    monkeypatch.setattr(tracing, "_exporter", exporter)
+    for _ in range(3):
+        run_trace()
+    assert metrics.traces == 3
+    assert 'travel_span_duration_seconds_count{span="agent",agent="flight",outcome="ok"} 3' in metrics.render()
+
+
+def test_sampled_traces_are_written_by_the_exporter(monkeypatch, tmp_path):
+    path = tmp_path / "traces.jsonl"
+    exporter = TraceExporter(path=str(path))
+    monkeypatch.setattr(tracing, "SAMPLE_RATE", 1.0)
+    monkeypatch.setattr(tracing, "_metrics", SpanMetrics())
+    monkeypatch.setattr(tracing, "_exporter", exporter)
+    run_trace()
+    run_trace()
+    exporter.close()
+
+    spans = [json.loads(line) for line in path.read_text().splitlines()]
+    assert [s["name"] for s in spans] == ["agent", "turn", "agent", "turn"]
+    assert spans[0]["parent_id"] == spans[1]["span_id"]
+    assert spans[0]["attributes"] == {"session_id": "s1", "agent": "flight"}
+    assert exporter.exported == 2
+
+
+def test_exporter_drops_traces_beyond_max_pending(tmp_path):
+    exporter = TraceExporter(path=str(tmp_path / "traces.jsonl"), max_pending=0)
+    exporter.export([])
+    assert exporter.dropped == 1